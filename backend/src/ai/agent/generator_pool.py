@@ -0,0 +1,159 @@
+"""
+Współdzielony generator pytań w procesie.
+
+BookQuestionGenerator() czyta zmienne środowiskowe i tworzy nowych klientów
+ChatAnthropic/TavilySearch (każdy z własną pulą połączeń HTTP). Pula trzyma
+jeden rozgrzany generator na proces - połączenia keep-alive są
+współdzielone przez widoki, consumery i pipeline w tle - oraz ogranicza
+liczbę równoległych generowań (QUESTION_GENERATOR_MAX_CONCURRENCY) łącznie
+dla ścieżki blokującej i asynchronicznej.
+"""
+import asyncio
+import threading
+from collections import deque
+from functools import partial
+from typing import Callable, Deque, Optional
+
+from django.conf import settings
+
+from ai.agent.question_generator import BookQuestionGenerator, BookQuestionsResponse
+
+
+class ConcurrencyLimit:
+    """
+    Limit wspólny dla wątków i pętli zdarzeń.
+
+    Zwolnione miejsce przechodzi bezpośrednio do najdłużej czekającego -
+    wątku albo zadania asyncio - więc oba rodzaje wywołań razem nie
+    przekroczą limitu, a czekające zadania nie zajmują wątków.
+    """
+
+    def __init__(self, size: int):
+        self._free = size
+        self._lock = threading.Lock()
+        # Przekazanie miejsca czekającemu (Event.set albo call_soon_threadsafe)
+        self._waiters: Deque[Callable[[], None]] = deque()
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self._free:
+                self._free -= 1
+                return
+            granted = threading.Event()
+            self._waiters.append(granted.set)
+        granted.wait()
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free:
+                self._free -= 1
+                return
+            future = loop.create_future()
+            wake = partial(loop.call_soon_threadsafe, self._grant, future)
+            self._waiters.append(wake)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiting = wake in self._waiters
+                if waiting:
+                    self._waiters.remove(wake)
+            # Miejsce przekazane tuż przed anulowaniem wraca do puli
+            if not waiting and future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def _grant(self, future: asyncio.Future) -> None:
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                wake = self._waiters.popleft()
+                try:
+                    wake()
+                    return
+                except RuntimeError:
+                    continue  # Pętla czekającego została zamknięta
+            self._free += 1
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def __aenter__(self):
+        await self.aacquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+class GeneratorPool:
+    """Rozgrzany BookQuestionGenerator z limitem równoległych generowań"""
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.max_concurrency = max_concurrency or getattr(
+            settings, 'QUESTION_GENERATOR_MAX_CONCURRENCY', 4)
+        self._generator: Optional[BookQuestionGenerator] = None
+        self._lock = threading.Lock()
+        self._limit = ConcurrencyLimit(self.max_concurrency)
+
+    def get_generator(self) -> BookQuestionGenerator:
+        """Generator tworzony raz na proces (klienci LLM i Tavily są bezpieczni wątkowo)"""
+        if self._generator is None:
+            with self._lock:
+                if self._generator is None:
+                    self._generator = BookQuestionGenerator()
+        return self._generator
+
+    def _generate(self, use_agent: bool, **book) -> BookQuestionsResponse:
+        generator = self.get_generator()
+        if use_agent:
+            return generator.generate_questions(**book)
+        return generator.generate_questions_simple(**book)
+
+    def generate_questions(self, use_agent: bool = True, **book) -> BookQuestionsResponse:
+        """
+        Wygeneruj pytania (blokująco); czeka, gdy trwa już max_concurrency generowań.
+
+        book: title, author, isbn, subject, toc_pdf_url
+        """
+        with self._limit:
+            return self._generate(use_agent, **book)
+
+    async def agenerate_questions(self, use_agent: bool = True, **book) -> BookQuestionsResponse:
+        """
+        Asynchroniczna wersja generate_questions dla consumerów ASGI.
+
+        Generowanie jest natywnie asynchroniczne (ainvoke, async Tavily i PDF),
+        więc czekające generowania nie zajmują wątków - ani własnych, ani
+        domyślnego executora, z którego korzysta database_sync_to_async.
+        Limit jest wspólny z generate_questions.
+        """
+        async with self._limit:
+            generator = self.get_generator()
+            if use_agent:
+                return await generator.agenerate_questions(**book)
+            return await generator.agenerate_questions_simple(**book)
+
+
+_pool: Optional[GeneratorPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_generator_pool() -> GeneratorPool:
+    """Pula generatora dla bieżącego procesu"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = GeneratorPool()
+    return _pool
@@ -1,11 +1,20 @@
+import asyncio
+import json
+import logging
 import os
+import re
 from typing import Optional, List, Dict, Any
 from langchain_tavily import TavilySearch
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
 from pydantic import BaseModel, Field, ValidationError
 
 from ai.extractors.pdf_extractor import PDFExtractor
 
+logger = logging.getLogger(__name__)
+
+# Maksymalna liczba rund wywołań narzędzi przez agenta
+MAX_TOOL_ITERATIONS = 3
+
 
 # Modele Pydantic do walidacji odpowiedzi
 class QuestionAnswer(BaseModel):
@@ -71,35 +80,8 @@ class BookQuestionGenerator:
         # Bind tools to LLM (nowsze API LangChain)
         self.llm_with_tools = self.llm.bind_tools([self.tavily_tool])
 
-    def generate_questions(
-        self,
-        title: str,
-        author: str,
-        isbn: str,
-        subject: str,
-        toc_pdf_url: str
-    ) -> BookQuestionsResponse:
-        """
-        Generuje 10 pytań i odpowiedzi dla danej książki używając LLM z dostępem do Tavily.
-
-        Args:
-            title: Tytuł książki
-            author: Autor książki
-            isbn: ISBN książki
-            subject: Kategoria/temat książki
-            toc_pdf_url: URL do PDF z spisem treści
-
-        Returns:
-            BookQuestionsResponse z pytaniami i odpowiedziami
-        """
-        # Ekstrahuj tekst z PDF
-        print(f"Ekstrakcja treści z PDF: {toc_pdf_url}")
-        pdf_text = self.pdf_extractor.extract_text_from_url(toc_pdf_url)
-
-        if not pdf_text:
-            raise ValueError(
-                f"Nie udało się ekstrahować treści z PDF: {toc_pdf_url}")
-
+    def _agent_messages(self, title: str, author: str, isbn: str, subject: str, pdf_text: str) -> List:
+        """Wiadomości dla agenta z dostępem do Tavily"""
         # System prompt
         system_prompt = """Jesteś ekspertem w tworzeniu pytań edukacyjnych wielokrotnego wyboru z książek akademickich i naukowych.
 
@@ -175,90 +157,13 @@ WAŻNE WYTYCZNE:
 
 Jeśli potrzebujesz dodatkowych informacji o książce, możesz użyć narzędzia wyszukiwarki Tavily."""
 
-        # Wywołaj LLM z tools
-        print("Generowanie pytań przez LLM z dostępem do Tavily...")
-        messages = [
+        return [
             SystemMessage(content=system_prompt),
             HumanMessage(content=user_prompt)
         ]
 
-        # Wykonaj wywołanie z możliwością użycia tools
-        response = self.llm_with_tools.invoke(messages)
-
-        # Jeśli LLM chce użyć tool, wykonaj to (maksymalnie 3 iteracje)
-        max_iterations = 3
-        iteration = 0
-        while hasattr(response, 'tool_calls') and response.tool_calls and iteration < max_iterations:
-            from langchain_core.messages import ToolMessage
-            tool_results = []
-            for tool_call in response.tool_calls:
-                tool_name = tool_call.get("name", "")
-                tool_args = tool_call.get("args", {})
-                if "tavily" in tool_name.lower() or "search" in tool_name.lower():
-                    try:
-                        result = self.tavily_tool.invoke(tool_args)
-                        tool_results.append(
-                            ToolMessage(
-                                content=str(result),
-                                tool_call_id=tool_call.get("id", "")
-                            )
-                        )
-                    except Exception as e:
-                        print(f"Błąd podczas wywołania Tavily: {e}")
-
-            # Dodaj wyniki tool do konwersacji
-            messages.append(response)
-            messages.extend(tool_results)
-
-            # Kontynuuj konwersację
-            response = self.llm_with_tools.invoke(messages)
-            iteration += 1
-
-        # Parsuj odpowiedź
-        agent_response = response.content if hasattr(
-            response, 'content') else str(response)
-
-        # Spróbuj wyciągnąć JSON z odpowiedzi
-        import json
-        import re
-
-        # Szukaj JSON w odpowiedzi
-        json_match = re.search(r'\{.*\}', agent_response, re.DOTALL)
-        if json_match:
-            try:
-                json_str = json_match.group(0)
-                data = json.loads(json_str)
-
-                # Waliduj przez Pydantic
-                response_obj = BookQuestionsResponse(**data)
-                return response_obj
-            except (json.JSONDecodeError, ValidationError) as e:
-                print(f"Błąd parsowania JSON: {e}")
-                print(f"Odpowiedź LLM: {agent_response[:500]}")
-                raise ValueError(
-                    f"Nie udało się sparsować odpowiedzi: {e}")
-        else:
-            raise ValueError("Nie znaleziono JSON w odpowiedzi")
-
-    def generate_questions_simple(
-        self,
-        title: str,
-        author: str,
-        isbn: str,
-        subject: str,
-        toc_pdf_url: str
-    ) -> BookQuestionsResponse:
-        """
-        Uproszczona wersja bez agenta - bezpośrednie wywołanie LLM.
-        Użyj tego jeśli agent nie działa poprawnie.
-        """
-        # Ekstrahuj tekst z PDF
-        pdf_text = self.pdf_extractor.extract_text_from_url(toc_pdf_url)
-
-        if not pdf_text:
-            raise ValueError(
-                f"Nie udało się ekstrahować treści z PDF: {toc_pdf_url}")
-
+    def _simple_messages(self, title: str, author: str, isbn: str, subject: str, pdf_text: str) -> List:
+        """Wiadomości dla bezpośredniego wywołania LLM (bez narzędzi)"""
         # Przygotuj prompt
         system_prompt = """Jesteś ekspertem w tworzeniu pytań edukacyjnych wielokrotnego wyboru z książek akademickich.
 
@@ -305,21 +210,195 @@ Zwróć TYLKO poprawny JSON w formacie:
     ]
 }}"""
 
-        # Wywołaj LLM bezpośrednio
-        messages = [
+        return [
             SystemMessage(content=system_prompt),
             HumanMessage(content=user_prompt)
         ]
-        response = self.llm.invoke(messages)
-        response_text = response.content
 
-        # Parsuj JSON
-        import json
-        import re
+    @staticmethod
+    def _search_calls(response) -> List[Dict[str, Any]]:
+        """Wywołania narzędzia wyszukiwania, o które prosi LLM"""
+        return [
+            tool_call for tool_call in (getattr(response, 'tool_calls', None) or [])
+            if "tavily" in tool_call.get("name", "").lower() or "search" in tool_call.get("name", "").lower()
+        ]
+
+    @staticmethod
+    def _require_text(pdf_text: Optional[str], toc_pdf_url: str) -> str:
+        if not pdf_text:
+            raise ValueError(
+                f"Nie udało się ekstrahować treści z PDF: {toc_pdf_url}")
+        return pdf_text
+
+    @staticmethod
+    def _tool_messages(tool_calls: List[Dict[str, Any]], results: List[Any]) -> List[ToolMessage]:
+        """Wyniki wyszukiwań dla LLM (wyjątek zamiast wyniku - wywołanie pominięte)"""
+        tool_messages = []
+        for tool_call, result in zip(tool_calls, results):
+            if isinstance(result, Exception):
+                logger.warning("Błąd podczas wywołania Tavily: %s", result)
+                continue
+            tool_messages.append(
+                ToolMessage(
+                    content=str(result),
+                    tool_call_id=tool_call.get("id", "")
+                )
+            )
+        return tool_messages
+
+    @staticmethod
+    def _parse_agent_response(response) -> BookQuestionsResponse:
+        # Parsuj odpowiedź
+        agent_response = response.content if hasattr(
+            response, 'content') else str(response)
 
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        # Szukaj JSON w odpowiedzi
+        json_match = re.search(r'\{.*\}', agent_response, re.DOTALL)
+        if json_match:
+            try:
+                json_str = json_match.group(0)
+                data = json.loads(json_str)
+
+                # Waliduj przez Pydantic
+                response_obj = BookQuestionsResponse(**data)
+                return response_obj
+            except (json.JSONDecodeError, ValidationError) as e:
+                logger.warning("Błąd parsowania JSON: %s; odpowiedź LLM: %s", e, agent_response[:500])
+                raise ValueError(
+                    f"Nie udało się sparsować odpowiedzi: {e}")
+        else:
+            raise ValueError("Nie znaleziono JSON w odpowiedzi")
+
+    @staticmethod
+    def _parse_simple_response(response) -> BookQuestionsResponse:
+        json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
         if json_match:
             data = json.loads(json_match.group(0))
             return BookQuestionsResponse(**data)
         else:
             raise ValueError("Nie znaleziono JSON w odpowiedzi")
+
+    def generate_questions(
+        self,
+        title: str,
+        author: str,
+        isbn: str,
+        subject: str,
+        toc_pdf_url: str
+    ) -> BookQuestionsResponse:
+        """
+        Generuje 10 pytań i odpowiedzi dla danej książki używając LLM z dostępem do Tavily.
+
+        Args:
+            title: Tytuł książki
+            author: Autor książki
+            isbn: ISBN książki
+            subject: Kategoria/temat książki
+            toc_pdf_url: URL do PDF z spisem treści
+
+        Returns:
+            BookQuestionsResponse z pytaniami i odpowiedziami
+        """
+        # Ekstrahuj tekst z PDF
+        logger.info("Ekstrakcja treści z PDF: %s", toc_pdf_url)
+        pdf_text = self._require_text(self.pdf_extractor.extract_text_from_url(toc_pdf_url), toc_pdf_url)
+
+        # Wywołaj LLM z tools
+        logger.info("Generowanie pytań przez LLM z dostępem do Tavily...")
+        messages = self._agent_messages(title, author, isbn, subject, pdf_text)
+
+        # Wykonaj wywołanie z możliwością użycia tools
+        response = self.llm_with_tools.invoke(messages)
+
+        # Jeśli LLM chce użyć tool, wykonaj to (maksymalnie 3 iteracje)
+        iteration = 0
+        while self._search_calls(response) and iteration < MAX_TOOL_ITERATIONS:
+            tool_calls = self._search_calls(response)
+            results = []
+            for tool_call in tool_calls:
+                try:
+                    results.append(self.tavily_tool.invoke(tool_call.get("args", {})))
+                except Exception as e:
+                    results.append(e)
+
+            # Dodaj wyniki tool do konwersacji
+            messages.append(response)
+            messages.extend(self._tool_messages(tool_calls, results))
+
+            # Kontynuuj konwersację
+            response = self.llm_with_tools.invoke(messages)
+            iteration += 1
+
+        return self._parse_agent_response(response)
+
+    async def agenerate_questions(
+        self,
+        title: str,
+        author: str,
+        isbn: str,
+        subject: str,
+        toc_pdf_url: str
+    ) -> BookQuestionsResponse:
+        """
+        Asynchroniczna wersja generate_questions (ainvoke, async Tavily, async PDF).
+
+        Nie zajmuje wątku na czas generowania - setki generowań mogą czekać
+        na LLM w jednej pętli zdarzeń.
+        """
+        logger.info("Ekstrakcja treści z PDF: %s", toc_pdf_url)
+        pdf_text = self._require_text(await self.pdf_extractor.aextract_text_from_url(toc_pdf_url), toc_pdf_url)
+
+        logger.info("Generowanie pytań przez LLM z dostępem do Tavily...")
+        messages = self._agent_messages(title, author, isbn, subject, pdf_text)
+        response = await self.llm_with_tools.ainvoke(messages)
+
+        iteration = 0
+        while self._search_calls(response) and iteration < MAX_TOOL_ITERATIONS:
+            tool_calls = self._search_calls(response)
+            # Wyszukiwania z jednej odpowiedzi LLM wykonywane równolegle
+            results = await asyncio.gather(
+                *[self.tavily_tool.ainvoke(tool_call.get("args", {})) for tool_call in tool_calls],
+                return_exceptions=True
+            )
+
+            messages.append(response)
+            messages.extend(self._tool_messages(tool_calls, results))
+            response = await self.llm_with_tools.ainvoke(messages)
+            iteration += 1
+
+        return self._parse_agent_response(response)
+
+    def generate_questions_simple(
+        self,
+        title: str,
+        author: str,
+        isbn: str,
+        subject: str,
+        toc_pdf_url: str
+    ) -> BookQuestionsResponse:
+        """
+        Uproszczona wersja bez agenta - bezpośrednie wywołanie LLM.
+        Użyj tego jeśli agent nie działa poprawnie.
+        """
+        # Ekstrahuj tekst z PDF
+        pdf_text = self._require_text(self.pdf_extractor.extract_text_from_url(toc_pdf_url), toc_pdf_url)
+
+        # Wywołaj LLM bezpośrednio
+        messages = self._simple_messages(title, author, isbn, subject, pdf_text)
+        response = self.llm.invoke(messages)
+        return self._parse_simple_response(response)
+
+    async def agenerate_questions_simple(
+        self,
+        title: str,
+        author: str,
+        isbn: str,
+        subject: str,
+        toc_pdf_url: str
+    ) -> BookQuestionsResponse:
+        """Asynchroniczna wersja generate_questions_simple"""
+        pdf_text = self._require_text(await self.pdf_extractor.aextract_text_from_url(toc_pdf_url), toc_pdf_url)
+
+        messages = self._simple_messages(title, author, isbn, subject, pdf_text)
+        response = await self.llm.ainvoke(messages)
+        return self._parse_simple_response(response)
@@ -0,0 +1,128 @@
+"""
+Równoległa ekstrakcja tekstu stron PDF z wczesnym zatrzymaniem.
+
+pdfplumber.extract_text jest kosztowne (CPU, trzyma GIL), a prompt używa
+tylko pierwszych ~8000 znaków tekstu. Strony są więc dzielone na małe
+zakresy parsowane w puli procesów, tekst wraca strumieniowo w kolejności
+stron, a ekstrakcja kończy się, gdy zebrano max_chars znaków - pozostałe
+zakresy są anulowane.
+
+Moduł nie importuje Django - procesy robocze (spawn) ładują tylko pdfplumber.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from typing import IO, Iterator, List, Optional, Tuple, Union
+
+import pdfplumber
+
+# Liczba stron parsowanych przez jedno zadanie w puli
+PAGES_PER_CHUNK = 2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_page_pool(workers: int) -> Executor:
+    """Wspólna pula procesów do parsowania stron (tworzona przy pierwszym użyciu)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def page_count(path: str) -> int:
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    """Tekst stron [start, stop) - uruchamiane w procesie roboczym"""
+    with pdfplumber.open(path, pages=list(range(start + 1, stop + 1))) as pdf:
+        return [page.extract_text() or '' for page in pdf.pages]
+
+
+def _iter_document(pdf, total: int, max_chars: Optional[int]) -> Iterator[Tuple[int, str]]:
+    """Strony otwartego dokumentu po kolei, do max_chars znaków"""
+    chars = 0
+    for index, page in enumerate(pdf.pages[:total]):
+        text = page.extract_text() or ''
+        yield index, text
+        chars += len(text)
+        if max_chars and chars >= max_chars:
+            return
+
+
+def iter_pages(source: Union[str, IO[bytes]], max_pages: int, max_chars: Optional[int] = None,
+               executor: Optional[Executor] = None, workers: int = 1,
+               pages_per_chunk: int = PAGES_PER_CHUNK,
+               document_pages: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Strumień (numer strony, tekst) w kolejności stron.
+
+    Bez executora strony są parsowane po kolei w bieżącym procesie, a source
+    może być też obiektem pliku (plik tymczasowy, HTTPRangeFile).
+    Z executorem source musi być ścieżką; w locie jest najwyżej `workers`
+    zakresów stron, kolejne są zlecane dopiero po odebraniu wyników, więc
+    po osiągnięciu max_chars nic więcej nie jest parsowane.
+    """
+    if executor is None:
+        with pdfplumber.open(source) as pdf:
+            yield from _iter_document(pdf, min(len(pdf.pages), max_pages), max_chars)
+        return
+
+    if document_pages is None:
+        document_pages = page_count(source)
+    total = min(document_pages, max_pages)
+    chars = 0
+    ranges = [(start, min(start + pages_per_chunk, total)) for start in range(0, total, pages_per_chunk)]
+    next_range = 0
+    running = {}
+    # Zakresy gotowe, ale czekające na wcześniejsze strony
+    finished = {}
+    next_page = 0
+    try:
+        while next_page < total:
+            # Zakresy czekające na wcześniejsze strony też się liczą - inaczej
+            # wolny pierwszy zakres pozwoliłby zlecić wszystkie następne
+            while next_range < len(ranges) and len(running) + len(finished) < workers:
+                start, stop = ranges[next_range]
+                running[executor.submit(extract_page_range, source, start, stop)] = start
+                next_range += 1
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished[running.pop(future)] = future.result()
+
+            while next_page in finished:
+                for text in finished.pop(next_page):
+                    yield next_page, text
+                    next_page += 1
+                    chars += len(text)
+                    if max_chars and chars >= max_chars:
+                        return
+    finally:
+        for future in running:
+            future.cancel()
+
+
+def extract_pages(source: Union[str, IO[bytes]], max_pages: int, max_chars: Optional[int] = None,
+                  executor: Optional[Executor] = None, workers: int = 1) -> Tuple[List[str], int]:
+    """Tekst stron (do max_pages lub max_chars znaków) i liczba stron dokumentu"""
+    if executor is None:
+        # Jedno otwarcie dokumentu - ważne dla plików czytanych zakresami HTTP
+        with pdfplumber.open(source) as pdf:
+            document_pages = len(pdf.pages)
+            pages = [text for _, text in _iter_document(pdf, min(document_pages, max_pages), max_chars)]
+        return pages, document_pages
+
+    document_pages = page_count(source)
+    pages = [
+        text for _, text in iter_pages(source, max_pages, max_chars, executor=executor,
+                                       workers=workers, document_pages=document_pages)
+    ]
+    return pages, document_pages
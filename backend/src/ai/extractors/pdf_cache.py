@@ -0,0 +1,137 @@
+"""
+Trwały cache tekstu wyekstrahowanego z PDF.
+
+Ten sam Book.toc_pdf_url jest przetwarzany przy każdym generowaniu pytań,
+a pobranie i parsowanie PDF kosztuje sekundy. Cache trzyma tekst stron na
+dysku, więc powtórna ekstrakcja to odczyt jednego pliku.
+
+Układ katalogu PDF_CACHE_DIR:
+- urls/<sha256(url)>.json      ETag, Last-Modified i hash treści dla URL
+- pages/<hash[:2]>/<hash>.zst  tekst stron PDF (JSON skompresowany zstd)
+
+Tekst jest adresowany hashem treści PDF, więc ten sam plik pod różnymi
+URL-ami (albo niezmieniony plik serwowany bez ETag) jest parsowany raz.
+Wpis URL jest rewalidowany warunkowym żądaniem (If-None-Match /
+If-Modified-Since) po PDF_CACHE_REVALIDATE_AFTER sekundach.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+import zstandard
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedURL:
+    """Stan ostatniego pobrania URL"""
+    url: str
+    content_hash: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    checked_at: float = 0.0
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+@dataclass
+class CachedPages:
+    """Tekst pierwszych stron PDF"""
+    pages: List[str]
+    # Liczba stron całego dokumentu
+    page_count: int
+
+    def covers(self, max_pages: int, max_chars: Optional[int] = None) -> bool:
+        """
+        Czy zapisane strony wystarczają dla ekstrakcji max_pages stron.
+
+        Ekstrakcja zatrzymana wcześnie (max_chars) też wystarcza, jeśli
+        zapisany tekst ma co najmniej max_chars znaków.
+        """
+        if len(self.pages) >= min(max_pages, self.page_count):
+            return True
+        return bool(max_chars) and sum(len(text) for text in self.pages) >= max_chars
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class PDFTextCache:
+    """Cache tekstu stron PDF na dysku"""
+
+    def __init__(self, directory: Optional[str] = None, revalidate_after: Optional[int] = None,
+                 compression_level: int = 10):
+        self.directory = directory or settings.PDF_CACHE_DIR
+        self.revalidate_after = (
+            settings.PDF_CACHE_REVALIDATE_AFTER if revalidate_after is None else revalidate_after)
+        self.compression_level = compression_level
+
+    def _url_path(self, url: str) -> str:
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, 'urls', f'{digest}.json')
+
+    def _pages_path(self, digest: str) -> str:
+        return os.path.join(self.directory, 'pages', digest[:2], f'{digest}.zst')
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        # Zapis do pliku tymczasowego + rename - równoległe procesy nie widzą połowy pliku.
+        # Błąd zapisu nie przerywa ekstrakcji - tekst po prostu nie trafi do cache.
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        except OSError as e:
+            logger.warning('PDF cache write failed for %s: %s', path, e)
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning('PDF cache write failed for %s: %s', path, e)
+            os.unlink(tmp_path)
+
+    def get_url(self, url: str) -> Optional[CachedURL]:
+        try:
+            with open(self._url_path(url), 'r', encoding='utf-8') as f:
+                return CachedURL(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def set_url(self, entry: CachedURL) -> None:
+        self._write_atomic(self._url_path(entry.url), json.dumps(asdict(entry)).encode('utf-8'))
+
+    def touch_url(self, entry: CachedURL) -> None:
+        """Zapisz udaną rewalidację (304 Not Modified)"""
+        entry.checked_at = time.time()
+        self.set_url(entry)
+
+    def is_fresh(self, entry: CachedURL) -> bool:
+        """Czy wpis można użyć bez pytania serwera"""
+        return time.time() - entry.checked_at < self.revalidate_after
+
+    def get_pages(self, digest: str) -> Optional[CachedPages]:
+        try:
+            with open(self._pages_path(digest), 'rb') as f:
+                data = zstandard.ZstdDecompressor().decompress(f.read())
+            return CachedPages(**json.loads(data))
+        except (OSError, ValueError, TypeError, zstandard.ZstdError):
+            return None
+
+    def set_pages(self, digest: str, pages: CachedPages) -> None:
+        data = json.dumps(asdict(pages), ensure_ascii=False).encode('utf-8')
+        compressed = zstandard.ZstdCompressor(level=self.compression_level).compress(data)
+        self._write_atomic(self._pages_path(digest), compressed)
@@ -0,0 +1,313 @@
+"""
+Pobieranie PDF bez buforowania całego pliku w pamięci.
+
+- wspólne sesje HTTP (pula połączeń keep-alive, ponowienia dla 5xx)
+- strumieniowy zapis do pliku tymczasowego (SpooledTemporaryFile - małe
+  pliki w pamięci, duże na dysku) z limitem rozmiaru PDF_MAX_DOWNLOAD_BYTES
+- dla dużych PDF na serwerach obsługujących Range: HTTPRangeFile pobiera
+  tylko bloki czytane przez parser (xref na końcu pliku + pierwsze strony)
+- wersje async (adownload_pdf, aprobe_pdf) na httpx.AsyncClient - jeden
+  klient z pulą połączeń na pętlę zdarzeń
+"""
+import asyncio
+import hashlib
+import io
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import IO, Dict, Mapping, Optional
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Rozmiar kawałka przy strumieniowym pobieraniu
+CHUNK_SIZE = 64 * 1024
+
+_local = threading.local()
+# Klient httpx jest związany z pętlą zdarzeń - jeden na pętlę
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class PDFTooLargeError(ValueError):
+    """PDF przekracza PDF_MAX_DOWNLOAD_BYTES"""
+
+
+def get_session() -> requests.Session:
+    """Sesja HTTP z pulą połączeń (jedna na wątek)"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        pool_size = getattr(settings, 'PDF_HTTP_POOL_SIZE', 10)
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                              allowed_methods=('GET', 'HEAD')),
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Klient httpx z pulą połączeń dla bieżącej pętli asyncio"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        pool_size = getattr(settings, 'PDF_HTTP_POOL_SIZE', 10)
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=httpx.AsyncHTTPTransport(retries=2),
+            follow_redirects=True,
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def _max_bytes(max_bytes: Optional[int]) -> int:
+    return max_bytes or getattr(settings, 'PDF_MAX_DOWNLOAD_BYTES', 50 * 1024 * 1024)
+
+
+@dataclass
+class PDFDownload:
+    """Wynik pobrania; file jest None dla 304 Not Modified"""
+    status_code: int
+    headers: Mapping[str, str]
+    file: Optional[IO[bytes]] = None
+    content_hash: Optional[str] = None
+    size: int = 0
+
+    def __post_init__(self):
+        self._digest = hashlib.sha256()
+
+    def write(self, chunk: bytes, max_bytes: int) -> None:
+        """Dopisz kawałek treści (z limitem rozmiaru i liczeniem hasha)"""
+        self.size += len(chunk)
+        if self.size > max_bytes:
+            raise PDFTooLargeError(f'PDF przekracza limit {max_bytes} bajtów')
+        self._digest.update(chunk)
+        self.file.write(chunk)
+
+    def finish(self) -> 'PDFDownload':
+        self.file.flush()
+        self.file.seek(0)
+        self.content_hash = self._digest.hexdigest()
+        return self
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def download_pdf(url: str, headers: Optional[Dict[str, str]] = None,
+                 max_bytes: Optional[int] = None, named: bool = False,
+                 timeout: int = 30) -> PDFDownload:
+    """
+    Pobierz PDF strumieniowo do pliku tymczasowego.
+
+    named=True zapisuje od razu do pliku na dysku z nazwą (potrzebne, gdy
+    PDF czytają procesy robocze). Hash treści jest liczony w trakcie pobierania.
+    """
+    max_bytes = _max_bytes(max_bytes)
+    with get_session().get(url, headers=headers or {}, stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            return PDFDownload(304, response.headers)
+        response.raise_for_status()
+
+        download = _start_download(response.status_code, response.headers, max_bytes, named)
+        try:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                download.write(chunk, max_bytes)
+        except BaseException:
+            download.close()
+            raise
+        return download.finish()
+
+
+async def adownload_pdf(url: str, headers: Optional[Dict[str, str]] = None,
+                        max_bytes: Optional[int] = None, named: bool = False,
+                        timeout: int = 30) -> PDFDownload:
+    """Asynchroniczna wersja download_pdf (httpx)"""
+    max_bytes = _max_bytes(max_bytes)
+    client = get_async_client()
+    async with client.stream('GET', url, headers=headers or {}, timeout=timeout) as response:
+        if response.status_code == 304:
+            return PDFDownload(304, response.headers)
+        response.raise_for_status()
+
+        download = _start_download(response.status_code, response.headers, max_bytes, named)
+        try:
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                download.write(chunk, max_bytes)
+        except BaseException:
+            download.close()
+            raise
+        return download.finish()
+
+
+def _start_download(status_code: int, headers: Mapping[str, str], max_bytes: int,
+                    named: bool) -> PDFDownload:
+    """Sprawdź Content-Length i otwórz plik tymczasowy na treść"""
+    content_length = headers.get('Content-Length')
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise PDFTooLargeError(f'PDF ma {content_length} bajtów (limit {max_bytes})')
+
+    if named:
+        pdf_file = tempfile.NamedTemporaryFile(suffix='.pdf')
+    else:
+        pdf_file = tempfile.SpooledTemporaryFile(
+            max_size=getattr(settings, 'PDF_SPOOL_MAX_MEMORY', 4 * 1024 * 1024))
+    return PDFDownload(status_code, headers, pdf_file)
+
+
+@dataclass
+class RemotePDF:
+    """Metadane PDF z odpowiedzi na HEAD"""
+    status_code: int
+    size: int = 0
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    accepts_ranges: bool = False
+
+    @property
+    def identity(self) -> Optional[str]:
+        """
+        Identyfikator wersji pliku bez pobierania treści (ETag lub
+        Last-Modified + rozmiar) - klucz cache dla PDF czytanych zakresami.
+        """
+        validator = self.etag or self.last_modified
+        if not validator:
+            return None
+        return 'range-' + hashlib.sha256(f'{validator}|{self.size}'.encode('utf-8')).hexdigest()
+
+    @property
+    def range_validator(self) -> Optional[str]:
+        """Walidator dla If-Range (słaby ETag nie jest tam dozwolony)"""
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+
+def _remote_pdf(status_code: int, headers: Mapping[str, str]) -> Optional[RemotePDF]:
+    if status_code == 304:
+        return RemotePDF(304)
+    if status_code >= 400:
+        return None
+    content_length = headers.get('Content-Length', '')
+    return RemotePDF(
+        status_code=status_code,
+        size=int(content_length) if content_length.isdigit() else 0,
+        etag=headers.get('ETag'),
+        last_modified=headers.get('Last-Modified'),
+        accepts_ranges=headers.get('Accept-Ranges', '').lower() == 'bytes',
+    )
+
+
+def probe_pdf(url: str, headers: Optional[Dict[str, str]] = None, timeout: int = 30) -> Optional[RemotePDF]:
+    """HEAD: rozmiar, walidatory i obsługa Range; None gdy serwer nie obsługuje HEAD"""
+    response = get_session().head(url, headers=headers or {}, timeout=timeout, allow_redirects=True)
+    return _remote_pdf(response.status_code, response.headers)
+
+
+async def aprobe_pdf(url: str, headers: Optional[Dict[str, str]] = None,
+                     timeout: int = 30) -> Optional[RemotePDF]:
+    """Asynchroniczna wersja probe_pdf"""
+    response = await get_async_client().head(url, headers=headers or {}, timeout=timeout)
+    return _remote_pdf(response.status_code, response.headers)
+
+
+class HTTPRangeFile(io.RawIOBase):
+    """
+    Plik tylko do odczytu czytany zakresami HTTP (Range: bytes=...).
+
+    Bloki block_size są pobierane przy pierwszym odczycie i trzymane w małym
+    LRU - parser PDF skacze między xref na końcu pliku a obiektami stron.
+    If-Range pilnuje, żeby wszystkie bloki pochodziły z tej samej wersji pliku.
+    """
+
+    def __init__(self, url: str, size: int, validator: Optional[str] = None,
+                 block_size: int = 64 * 1024, max_blocks: int = 64,
+                 max_bytes: Optional[int] = None, timeout: int = 30):
+        super().__init__()
+        self.url = url
+        self.size = size
+        self.validator = validator
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.max_bytes = _max_bytes(max_bytes)
+        self.timeout = timeout
+        self.bytes_fetched = 0
+        self._pos = 0
+        self._blocks: 'OrderedDict[int, bytes]' = OrderedDict()
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self.size + offset
+        else:
+            raise ValueError(f'Invalid whence: {whence}')
+        self._pos = max(self._pos, 0)
+        return self._pos
+
+    def _block(self, index: int) -> bytes:
+        block = self._blocks.get(index)
+        if block is not None:
+            self._blocks.move_to_end(index)
+            return block
+
+        start = index * self.block_size
+        end = min(start + self.block_size, self.size) - 1
+        headers = {'Range': f'bytes={start}-{end}'}
+        if self.validator:
+            headers['If-Range'] = self.validator
+        with get_session().get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 206:
+                # Serwer zignorował Range albo plik się zmienił - nie czytamy całego body
+                raise IOError(f'Range request for {self.url} returned {response.status_code}')
+            block = response.content
+
+        self.bytes_fetched += len(block)
+        if self.bytes_fetched > self.max_bytes:
+            raise PDFTooLargeError(f'Pobrano ponad {self.max_bytes} bajtów zakresami')
+        self._blocks[index] = block
+        if len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+        return block
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast('B')
+        written = 0
+        # Wypełnij cały bufor (krótszy odczyt tylko na końcu pliku)
+        while written < len(view) and self._pos < self.size:
+            index, offset = divmod(self._pos, self.block_size)
+            chunk = self._block(index)[offset:offset + len(view) - written]
+            if not chunk:
+                break
+            view[written:written + len(chunk)] = chunk
+            written += len(chunk)
+            self._pos += len(chunk)
+        return written
@@ -1,18 +1,190 @@
-import pdfplumber
-import requests
-from typing import Optional
-import io
+import asyncio
+import logging
+import time
+from typing import IO, Dict, List, Optional, Tuple
+
+import httpx
+from django.conf import settings
+
+from ai.extractors import page_extraction, pdf_download
+from ai.extractors.pdf_cache import CachedPages, CachedURL, PDFTextCache
+
+logger = logging.getLogger(__name__)
 
 
 class PDFExtractor:
     """Extractor do pobierania i parsowania treści z PDF."""
 
-    def __init__(self, max_pages: int = 50):
+    def __init__(self, max_pages: int = 50, cache: Optional[PDFTextCache] = None,
+                 max_chars: Optional[int] = None):
         """
         Args:
             max_pages: Maksymalna liczba stron do ekstrakcji (dla wydajności)
+            cache: Cache tekstu stron (domyślnie PDFTextCache w PDF_CACHE_DIR,
+                wyłączony gdy PDF_CACHE_DIR jest puste)
+            max_chars: Po zebraniu tylu znaków kolejne strony nie są parsowane
+                (domyślnie PDF_EXTRACT_MAX_CHARS - tyle trafia do promptu)
         """
         self.max_pages = max_pages
+        if cache is None and getattr(settings, 'PDF_CACHE_DIR', None):
+            cache = PDFTextCache()
+        self.cache = cache
+        self.max_chars = max_chars or getattr(settings, 'PDF_EXTRACT_MAX_CHARS', None)
+
+    def _extract_pages(self, pdf_file: IO[bytes], max_pages: int,
+                       max_chars: Optional[int] = None) -> CachedPages:
+        """Parsuje pierwsze max_pages stron PDF (równolegle, gdy PDF_EXTRACT_WORKERS > 1)"""
+        workers = getattr(settings, 'PDF_EXTRACT_WORKERS', 1)
+        if workers > 1 and getattr(pdf_file, 'name', None):
+            # Procesy robocze otwierają PDF z pliku - nie kopiujemy bajtów do każdego zadania
+            pages, page_count = page_extraction.extract_pages(
+                pdf_file.name, max_pages, max_chars,
+                executor=page_extraction.get_page_pool(workers), workers=workers)
+        else:
+            pages, page_count = page_extraction.extract_pages(pdf_file, max_pages, max_chars)
+        return CachedPages(pages=pages, page_count=page_count)
+
+    def _remember_url(self, pdf_url: str, digest: str, etag: Optional[str],
+                      last_modified: Optional[str]) -> None:
+        if self.cache:
+            self.cache.set_url(CachedURL(
+                url=pdf_url,
+                content_hash=digest,
+                etag=etag,
+                last_modified=last_modified,
+                checked_at=time.time(),
+            ))
+
+    def _cached_pages(self, digest: str, max_pages: int, max_chars: Optional[int]) -> Optional[CachedPages]:
+        pages = self.cache.get_pages(digest) if self.cache else None
+        if pages is None or not pages.covers(max_pages, max_chars):
+            return None
+        return pages
+
+    def _lookup(self, pdf_url: str, max_pages: int,
+                max_chars: Optional[int]) -> Tuple[Optional[CachedURL], Optional[CachedPages]]:
+        entry = self.cache.get_url(pdf_url) if self.cache else None
+        cached = self._cached_pages(entry.content_hash, max_pages, max_chars) if entry else None
+        return entry, cached
+
+    def _get_pages(self, pdf_url: str, max_pages: int, max_chars: Optional[int] = None) -> List[str]:
+        """
+        Tekst pierwszych max_pages stron - z cache albo z pobranego PDF.
+
+        Świeży wpis w cache nie wymaga żadnego żądania. Starszy jest
+        rewalidowany warunkowo (304 = odczyt z cache). Gdy serwer jest
+        niedostępny, zwracany jest tekst z cache (jeśli jest).
+        """
+        entry, cached = self._lookup(pdf_url, max_pages, max_chars)
+        if cached and self.cache.is_fresh(entry):
+            return cached.pages[:max_pages]
+
+        headers = entry.conditional_headers() if cached else {}
+        try:
+            pages = self._fetch_pages(pdf_url, headers, max_pages, max_chars)
+        except (OSError, pdf_download.PDFTooLargeError) as e:
+            if cached:
+                logger.warning("PDF revalidation failed for %s, using cached text: %s", pdf_url, e)
+                return cached.pages[:max_pages]
+            raise
+        return self._fetched_or_cached(pages, entry, cached, max_pages)
+
+    async def _aget_pages(self, pdf_url: str, max_pages: int, max_chars: Optional[int] = None) -> List[str]:
+        """Asynchroniczna wersja _get_pages (pobieranie httpx; parsowanie i cache na dysku poza pętlą)"""
+        entry, cached = await asyncio.to_thread(self._lookup, pdf_url, max_pages, max_chars)
+        if cached and self.cache.is_fresh(entry):
+            return cached.pages[:max_pages]
+
+        headers = entry.conditional_headers() if cached else {}
+        try:
+            pages = await self._afetch_pages(pdf_url, headers, max_pages, max_chars)
+        except (OSError, httpx.HTTPError, pdf_download.PDFTooLargeError) as e:
+            if cached:
+                logger.warning("PDF revalidation failed for %s, using cached text: %s", pdf_url, e)
+                return cached.pages[:max_pages]
+            raise
+        return await asyncio.to_thread(self._fetched_or_cached, pages, entry, cached, max_pages)
+
+    def _fetched_or_cached(self, pages: Optional[CachedPages], entry: Optional[CachedURL],
+                           cached: Optional[CachedPages], max_pages: int) -> List[str]:
+        if pages is None:
+            # 304 Not Modified
+            self.cache.touch_url(entry)
+            return cached.pages[:max_pages]
+        return pages.pages[:max_pages]
+
+    def _use_ranges(self, remote: Optional[pdf_download.RemotePDF]) -> bool:
+        range_min_bytes = getattr(settings, 'PDF_RANGE_MIN_BYTES', 0)
+        return bool(remote and remote.accepts_ranges and remote.size >= range_min_bytes
+                    and remote.identity)
+
+    def _fetch_pages(self, pdf_url: str, headers: Dict[str, str], max_pages: int,
+                     max_chars: Optional[int]) -> Optional[CachedPages]:
+        """Pobierz i sparsuj PDF; None gdy serwer odpowiedział 304"""
+        if getattr(settings, 'PDF_RANGE_MIN_BYTES', 0):
+            remote = pdf_download.probe_pdf(pdf_url, headers)
+            if remote and remote.status_code == 304 and headers:
+                return None
+            if self._use_ranges(remote):
+                try:
+                    return self._fetch_pages_by_range(pdf_url, remote, max_pages, max_chars)
+                except OSError as e:
+                    logger.warning("Range requests failed for %s, downloading whole file: %s", pdf_url, e,
+                                   exc_info=True)
+
+        workers = getattr(settings, 'PDF_EXTRACT_WORKERS', 1)
+        with pdf_download.download_pdf(pdf_url, headers, named=workers > 1) as download:
+            if download.status_code == 304 and headers:
+                return None
+            return self._pages_from_download(pdf_url, download, max_pages, max_chars)
+
+    async def _afetch_pages(self, pdf_url: str, headers: Dict[str, str], max_pages: int,
+                            max_chars: Optional[int]) -> Optional[CachedPages]:
+        """Asynchroniczna wersja _fetch_pages; parsowanie (CPU) w wątku, pobieranie w pętli"""
+        if getattr(settings, 'PDF_RANGE_MIN_BYTES', 0):
+            remote = await pdf_download.aprobe_pdf(pdf_url, headers)
+            if remote and remote.status_code == 304 and headers:
+                return None
+            if self._use_ranges(remote):
+                # Odczyt zakresami jest sterowany przez parser (synchroniczny)
+                try:
+                    return await asyncio.to_thread(
+                        self._fetch_pages_by_range, pdf_url, remote, max_pages, max_chars)
+                except OSError as e:
+                    logger.warning("Range requests failed for %s, downloading whole file: %s", pdf_url, e,
+                                   exc_info=True)
+
+        workers = getattr(settings, 'PDF_EXTRACT_WORKERS', 1)
+        with await pdf_download.adownload_pdf(pdf_url, headers, named=workers > 1) as download:
+            if download.status_code == 304 and headers:
+                return None
+            return await asyncio.to_thread(
+                self._pages_from_download, pdf_url, download, max_pages, max_chars)
+
+    def _pages_from_download(self, pdf_url: str, download: pdf_download.PDFDownload,
+                             max_pages: int, max_chars: Optional[int]) -> CachedPages:
+        pages = self._cached_pages(download.content_hash, max_pages, max_chars)
+        if pages is None:
+            pages = self._extract_pages(download.file, max_pages, max_chars)
+            if self.cache:
+                self.cache.set_pages(download.content_hash, pages)
+        self._remember_url(pdf_url, download.content_hash,
+                           download.headers.get('ETag'), download.headers.get('Last-Modified'))
+        return pages
+
+    def _fetch_pages_by_range(self, pdf_url: str, remote: pdf_download.RemotePDF, max_pages: int,
+                              max_chars: Optional[int]) -> CachedPages:
+        """Duży PDF: parsuj pierwsze strony, pobierając tylko czytane bloki"""
+        pages = self._cached_pages(remote.identity, max_pages, max_chars)
+        if pages is None:
+            range_file = pdf_download.HTTPRangeFile(pdf_url, remote.size, remote.range_validator)
+            page_texts, page_count = page_extraction.extract_pages(range_file, max_pages, max_chars)
+            pages = CachedPages(pages=page_texts, page_count=page_count)
+            logger.debug("Fetched %d of %d bytes from %s", range_file.bytes_fetched, remote.size, pdf_url)
+            if self.cache:
+                self.cache.set_pages(remote.identity, pages)
+        self._remember_url(pdf_url, remote.identity, remote.etag, remote.last_modified)
+        return pages
 
     def extract_text_from_url(self, pdf_url: str) -> Optional[str]:
         """
@@ -25,28 +197,35 @@ class PDFExtractor:
             Tekst z PDF lub None w przypadku błędu
         """
         try:
-            # Pobierz PDF
-            response = requests.get(pdf_url, timeout=30)
-            response.raise_for_status()
-
-            # Otwórz PDF z pdfplumber
-            pdf_bytes = io.BytesIO(response.content)
+            # Ogranicz liczbę stron dla wydajności
+            text_parts = [
+                page_text for page_text in self._get_pages(pdf_url, self.max_pages, self.max_chars)
+                if page_text
+            ]
+            full_text = "\n\n".join(text_parts)
+            return full_text if full_text.strip() else None
 
-            text_parts = []
-            with pdfplumber.open(pdf_bytes) as pdf:
-                # Ogranicz liczbę stron dla wydajności
-                pages_to_extract = min(len(pdf.pages), self.max_pages)
+        except Exception as e:
+            logger.warning("Error extracting PDF from %s: %s", pdf_url, e, exc_info=True)
+            return None
 
-                for i, page in enumerate(pdf.pages[:pages_to_extract]):
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_parts.append(page_text)
+    async def aextract_text_from_url(self, pdf_url: str) -> Optional[str]:
+        """
+        Asynchroniczna wersja extract_text_from_url.
 
+        Pobieranie nie blokuje pętli zdarzeń; parsowanie stron (CPU) działa
+        w wątku albo w puli procesów.
+        """
+        try:
+            text_parts = [
+                page_text for page_text in await self._aget_pages(pdf_url, self.max_pages, self.max_chars)
+                if page_text
+            ]
             full_text = "\n\n".join(text_parts)
             return full_text if full_text.strip() else None
 
         except Exception as e:
-            print(f"Error extracting PDF from {pdf_url}: {e}")
+            logger.warning("Error extracting PDF from %s: %s", pdf_url, e, exc_info=True)
             return None
 
     def extract_table_of_contents(self, pdf_url: str) -> Optional[str]:
@@ -60,22 +239,14 @@ class PDFExtractor:
             Tekst spisu treści lub None
         """
         try:
-            response = requests.get(pdf_url, timeout=30)
-            response.raise_for_status()
-
-            pdf_bytes = io.BytesIO(response.content)
-
-            text_parts = []
-            with pdfplumber.open(pdf_bytes) as pdf:
-                # Spis treści jest zwykle w pierwszych 10 stronach
-                for page in pdf.pages[:10]:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_parts.append(page_text)
-
+            # Spis treści jest zwykle w pierwszych 10 stronach
+            text_parts = [
+                page_text for page_text in self._get_pages(pdf_url, 10)
+                if page_text
+            ]
             toc_text = "\n\n".join(text_parts)
             return toc_text if toc_text.strip() else None
 
         except Exception as e:
-            print(f"Error extracting TOC from {pdf_url}: {e}")
+            logger.warning("Error extracting TOC from %s: %s", pdf_url, e, exc_info=True)
             return None
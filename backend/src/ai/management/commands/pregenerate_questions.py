@@ -0,0 +1,94 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ai.pregeneration import QuestionPoolPipeline
+
+
+class Command(BaseCommand):
+    help = 'Top up the question bank of every book to the target size in background worker processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target',
+            type=int,
+            help='Target number of questions per book (default: QUESTION_BANK_TARGET_SIZE)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Number of worker processes / concurrent LLM calls (default: QUESTION_PREGEN_WORKERS)',
+        )
+        parser.add_argument(
+            '--max-retries',
+            type=int,
+            help='Retries per book before giving up (default: QUESTION_PREGEN_MAX_RETRIES)',
+        )
+        parser.add_argument(
+            '--backoff',
+            type=float,
+            help='Base retry delay in seconds, doubled on every attempt (default: QUESTION_PREGEN_BACKOFF)',
+        )
+        parser.add_argument(
+            '--book',
+            type=int,
+            action='append',
+            dest='book_ids',
+            help='Only process this book id (can be repeated)',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and check the banks again every --interval seconds',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=300,
+            help='Seconds between passes in --loop mode',
+        )
+
+    def handle(self, *args, **options):
+        pipeline = QuestionPoolPipeline(
+            target=options['target'],
+            workers=options['workers'],
+            max_retries=options['max_retries'],
+            backoff=options['backoff'],
+            on_progress=self._report_progress,
+        )
+
+        if not options['loop']:
+            self._run_pass(pipeline, options['book_ids'])
+            return
+
+        # Pula procesów żyje między przebiegami - generatory zostają rozgrzane
+        executor = pipeline.create_executor()
+        try:
+            while True:
+                self._run_pass(pipeline, options['book_ids'], executor)
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Stopping...'))
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def _run_pass(self, pipeline, book_ids, executor=None):
+        metrics = pipeline.run(book_ids=book_ids, executor=executor)
+        if not metrics.books_total:
+            self.stdout.write('All question banks are at the target size.')
+            return
+
+        style = self.style.SUCCESS if not metrics.books_failed else self.style.WARNING
+        self.stdout.write(style(
+            f'Done: {metrics.books_done}/{metrics.books_total} books topped up, '
+            f'{metrics.books_failed} failed, {metrics.questions_created} questions created '
+            f'in {metrics.elapsed:.0f}s'
+        ))
+
+    def _report_progress(self, metrics):
+        self.stdout.write(
+            f'[{metrics.elapsed:6.0f}s] books {metrics.books_done + metrics.books_failed}/{metrics.books_total} '
+            f'| questions +{metrics.questions_created} '
+            f'| running {metrics.in_flight}, queued {metrics.queued} '
+            f'| retries {metrics.retries}, failed {metrics.books_failed}'
+        )
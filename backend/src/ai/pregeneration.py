@@ -0,0 +1,202 @@
+"""
+Generowanie pytań w tle - uzupełnianie banku pytań każdej książki.
+
+Każda książka jest uzupełniana do QUESTION_BANK_TARGET_SIZE pytań, zanim
+gracze zaczną na niej mecz, więc start meczu tylko losuje pytania z banku
+(quiz.question_bank) i nie czeka na pobranie PDF ani odpowiedź LLM.
+
+- kolejka lokalna: zadania (książka, próba) w kopcu wg czasu, od którego
+  można je uruchomić (ponowienia czekają na swój backoff)
+- procesy robocze: ProcessPoolExecutor, każdy proces korzysta z puli
+  generatora (ai.agent.generator_pool - klienci LLM i Tavily tworzeni raz)
+- procesy robocze tylko generują pytania (PDFExtractor + LLM); zapis do
+  bazy robi proces główny
+- błąd lub same duplikaty: ponowienie z wykładniczym backoffem, po
+  max_retries nieudanych próbach książka jest pomijana w tym przebiegu
+
+Uruchamiane komendą: python manage.py pregenerate_questions
+"""
+import heapq
+import logging
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+import django
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count
+
+from quiz.models import Book
+from quiz.question_bank import bank_size, book_data, store_generated_questions
+
+logger = logging.getLogger(__name__)
+
+
+def generate_book_questions(data: Dict) -> List[Dict]:
+    """Wygeneruj pytania dla książki - uruchamiane w procesie roboczym"""
+    from ai.agent.generator_pool import get_generator_pool
+
+    result = get_generator_pool().generate_questions(use_agent=False, **data)
+    return [q.model_dump() for q in result.questions]
+
+
+@dataclass(order=True)
+class PregenerationJob:
+    """Jedno wywołanie generatora dla książki"""
+    not_before: float
+    book_id: int = field(compare=False)
+    attempt: int = field(default=0, compare=False)
+
+
+@dataclass
+class PregenerationMetrics:
+    """Postęp przebiegu pipeline'u"""
+    books_total: int = 0
+    books_done: int = 0
+    books_failed: int = 0
+    rounds_ok: int = 0
+    rounds_failed: int = 0
+    retries: int = 0
+    questions_created: int = 0
+    queued: int = 0
+    in_flight: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def as_dict(self) -> Dict:
+        data = asdict(self)
+        data.pop('started_at')
+        data['elapsed'] = round(self.elapsed, 1)
+        minutes = self.elapsed / 60
+        data['questions_per_minute'] = round(self.questions_created / minutes, 1) if minutes else 0.0
+        return data
+
+
+class QuestionPoolPipeline:
+    """Uzupełnia banki pytań książek do docelowego rozmiaru"""
+
+    def __init__(
+        self,
+        target: Optional[int] = None,
+        workers: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        on_progress: Optional[Callable[[PregenerationMetrics], None]] = None,
+    ):
+        self.target = target or settings.QUESTION_BANK_TARGET_SIZE
+        # Limit równoległych wywołań LLM (i procesów roboczych)
+        self.workers = workers or settings.QUESTION_PREGEN_WORKERS
+        self.max_retries = settings.QUESTION_PREGEN_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = settings.QUESTION_PREGEN_BACKOFF if backoff is None else backoff
+        self.on_progress = on_progress
+
+    def create_executor(self) -> Executor:
+        """
+        Pula procesów roboczych.
+
+        Procesy są uruchamiane przez spawn (bez kopiowania połączeń do bazy
+        z procesu głównego) i inicjalizują Django przed pierwszym zadaniem.
+        """
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+
+    def books_below_target(self, book_ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+        """{book_id: liczba pytań} dla książek z bankiem poniżej celu"""
+        books = Book.objects.annotate(question_count=Count('questions')).filter(
+            question_count__lt=self.target)
+        if book_ids:
+            books = books.filter(id__in=book_ids)
+        return dict(books.values_list('id', 'question_count'))
+
+    def run(self, book_ids: Optional[Iterable[int]] = None,
+            executor: Optional[Executor] = None) -> PregenerationMetrics:
+        """Jeden przebieg: uzupełnij wszystkie książki poniżej celu"""
+        pending = self.books_below_target(book_ids)
+        metrics = PregenerationMetrics(books_total=len(pending))
+        if not pending:
+            return metrics
+
+        logger.info('Pregenerating questions for %d books (target %d, %d workers)',
+                    len(pending), self.target, self.workers)
+        queue = [PregenerationJob(0.0, book_id) for book_id in sorted(pending)]
+        heapq.heapify(queue)
+
+        own_executor = executor is None
+        if own_executor:
+            executor = self.create_executor()
+        running = {}
+        try:
+            while queue or running:
+                now = time.monotonic()
+                while queue and len(running) < self.workers and queue[0].not_before <= now:
+                    job = heapq.heappop(queue)
+                    book = Book.objects.select_related('subject').filter(id=job.book_id).first()
+                    if book is None:
+                        continue  # Książka usunięta w trakcie przebiegu
+                    running[executor.submit(generate_book_questions, book_data(book))] = job
+
+                metrics.queued, metrics.in_flight = len(queue), len(running)
+                # Czekaj na wynik albo do chwili, gdy następne zadanie może ruszyć
+                timeout = None
+                if queue and len(running) < self.workers:
+                    timeout = max(0.0, queue[0].not_before - now)
+                if not running:
+                    if timeout:
+                        time.sleep(timeout)
+                    continue
+
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    self._handle_result(job, future, queue, metrics)
+                    metrics.queued, metrics.in_flight = len(queue), len(running)
+                    if self.on_progress:
+                        self.on_progress(metrics)
+        finally:
+            if own_executor:
+                executor.shutdown(cancel_futures=True)
+
+        logger.info('Question pregeneration finished: %s', metrics.as_dict())
+        return metrics
+
+    def _handle_result(self, job: PregenerationJob, future, queue: List[PregenerationJob],
+                       metrics: PregenerationMetrics) -> None:
+        close_old_connections()
+        try:
+            questions = future.result()
+            book = Book.objects.filter(id=job.book_id).first()
+            if book is None:
+                return
+            created = store_generated_questions(book, questions)
+            if not created:
+                raise ValueError('LLM zwrócił wyłącznie pytania, które są już w banku')
+        except Exception as e:
+            metrics.rounds_failed += 1
+            if job.attempt >= self.max_retries:
+                metrics.books_failed += 1
+                logger.error('Giving up on book %s after %d attempts: %s',
+                             job.book_id, job.attempt + 1, e)
+                return
+            delay = self.backoff * 2 ** job.attempt
+            metrics.retries += 1
+            heapq.heappush(queue, PregenerationJob(
+                time.monotonic() + delay, job.book_id, job.attempt + 1))
+            logger.warning('Question generation for book %s failed (attempt %d), retrying in %.0fs: %s',
+                           job.book_id, job.attempt + 1, delay, e)
+            return
+
+        metrics.rounds_ok += 1
+        metrics.questions_created += len(created)
+        if bank_size(book) >= self.target:
+            metrics.books_done += 1
+        else:
+            heapq.heappush(queue, PregenerationJob(time.monotonic(), job.book_id))
@@ -0,0 +1,587 @@
+import asyncio
+import itertools
+import json
+import multiprocessing
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+import requests
+from django.test import SimpleTestCase, TestCase, override_settings
+from langchain_core.messages import ToolMessage
+from requests.structures import CaseInsensitiveDict
+
+from quiz.models import Book, Question, Subject
+
+from .agent.generator_pool import GeneratorPool
+from .agent.question_generator import BookQuestionGenerator, BookQuestionsResponse
+from .extractors import page_extraction, pdf_download
+from .extractors.pdf_cache import CachedPages, PDFTextCache, content_hash
+from .extractors.pdf_extractor import PDFExtractor
+from .pregeneration import QuestionPoolPipeline
+
+
+def _generated(prefix, count=10):
+    return [
+        {
+            'question': f'{prefix} {i}',
+            'option_a': 'a',
+            'option_b': 'b',
+            'option_c': 'c',
+            'option_d': 'd',
+            'correct_answer': 'A',
+        }
+        for i in range(count)
+    ]
+
+
+class QuestionPoolPipelineTest(TestCase):
+    """Tests for the background question pregeneration pipeline."""
+
+    def setUp(self):
+        self.subject = Subject.objects.create(name='Fizyka', color='#8B5CF6', icon_name='atom')
+        self.book = Book.objects.create(
+            title='Mechanika', author='Autor', isbn='111', subject=self.subject,
+            toc_pdf_url='https://example.com/toc.pdf')
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.executor.shutdown)
+        self.rounds = itertools.count()
+
+    def _fresh_questions(self, book_data):
+        return _generated(f'{book_data["title"]} round {next(self.rounds)}')
+
+    def test_tops_up_books_to_target(self):
+        """Test that a book is generated for until its bank reaches the target."""
+        full_book = Book.objects.create(
+            title='Pełna', author='Autor', isbn='222', subject=self.subject,
+            toc_pdf_url='https://example.com/full.pdf')
+        Question.objects.bulk_create([
+            Question(book=full_book, question_text=f'q{i}', option_a='a', option_b='b',
+                     option_c='c', option_d='d', correct_answer='a')
+            for i in range(20)
+        ])
+
+        with patch('ai.pregeneration.generate_book_questions', side_effect=self._fresh_questions):
+            metrics = QuestionPoolPipeline(target=20, workers=2).run(executor=self.executor)
+
+        self.assertEqual(Question.objects.filter(book=self.book).count(), 20)
+        self.assertEqual(Question.objects.filter(book=full_book).count(), 20)
+        self.assertEqual(metrics.books_total, 1)
+        self.assertEqual(metrics.books_done, 1)
+        self.assertEqual(metrics.rounds_ok, 2)
+        self.assertEqual(metrics.questions_created, 20)
+        self.assertEqual(Question.objects.filter(book=self.book).first().correct_answer, 'a')
+
+    def test_retries_failed_generation(self):
+        """Test that a failed round is retried and counted in the metrics."""
+        results = [ValueError('PDF timeout'), _generated('retry')]
+
+        with patch('ai.pregeneration.generate_book_questions', side_effect=results):
+            metrics = QuestionPoolPipeline(
+                target=10, workers=1, max_retries=2, backoff=0).run(executor=self.executor)
+
+        self.assertEqual(metrics.retries, 1)
+        self.assertEqual(metrics.rounds_failed, 1)
+        self.assertEqual(metrics.books_done, 1)
+        self.assertEqual(Question.objects.filter(book=self.book).count(), 10)
+
+    def test_gives_up_after_max_retries(self):
+        """Test that a book is skipped once retries are exhausted, including duplicate-only rounds."""
+        with patch('ai.pregeneration.generate_book_questions', return_value=_generated('same', 5)):
+            metrics = QuestionPoolPipeline(
+                target=10, workers=1, max_retries=1, backoff=0).run(executor=self.executor)
+
+        self.assertEqual(metrics.books_failed, 1)
+        self.assertEqual(metrics.rounds_ok, 1)
+        self.assertEqual(Question.objects.filter(book=self.book).count(), 5)
+
+    def test_concurrency_limit(self):
+        """Test that no more rounds run at once than the worker limit."""
+        for i in range(3):
+            Book.objects.create(
+                title=f'Tom {i}', author='Autor', isbn=f'3{i}', subject=self.subject,
+                toc_pdf_url='https://example.com/toc.pdf')
+        in_flight = []
+
+        def track(metrics):
+            in_flight.append(metrics.in_flight)
+
+        with patch('ai.pregeneration.generate_book_questions', side_effect=self._fresh_questions):
+            metrics = QuestionPoolPipeline(
+                target=10, workers=2, on_progress=track).run(executor=self.executor)
+
+        self.assertEqual(metrics.books_done, 4)
+        self.assertTrue(all(count <= 2 for count in in_flight))
+
+
+def _make_pdf(page_texts, padding=0):
+    """Minimalny PDF z jedną linią tekstu na stronę (padding - komentarz przed obiektami)"""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None,
+               '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for text in page_texts:
+        stream = f'BT /F1 12 Tf 72 720 Td ({text}) Tj ET'
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>')
+        kids.append(f'{len(objects)} 0 R')
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {len(kids)} >>'
+
+    data = b'%PDF-1.4\n' + (b'%' + b'x' * padding + b'\n' if padding else b'')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f'{number} 0 obj\n{body}\nendobj\n'.encode('latin-1')
+    xref = len(data)
+    data += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    for offset in offsets:
+        data += f'{offset:010d} 00000 n \n'.encode()
+    data += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return data
+
+
+class _FakeResponse:
+    def __init__(self, status_code=200, body=b'', headers=None):
+        self.status_code = status_code
+        self.content = body
+        self.headers = CaseInsensitiveDict(headers or {})
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code))
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _FakePDFServer:
+    """Serwer PDF w pamięci: ETag, 304, HEAD i Range"""
+
+    def __init__(self, body=b'%PDF-1.4 toc', etag='"v1"', accept_ranges=False, send_length=True):
+        self.body = body
+        self.etag = etag
+        self.accept_ranges = accept_ranges
+        self.send_length = send_length
+        self.status_code = 200
+        self.requests = []
+
+    def _headers(self):
+        headers = {'ETag': self.etag} if self.etag else {}
+        if self.send_length:
+            headers['Content-Length'] = str(len(self.body))
+        if self.accept_ranges:
+            headers['Accept-Ranges'] = 'bytes'
+        return headers
+
+    def _respond(self, method, headers):
+        headers = headers or {}
+        self.requests.append((method, headers))
+        if self.status_code >= 500:
+            raise requests.ConnectionError('server down')
+        if self.etag and headers.get('If-None-Match') == self.etag:
+            return _FakeResponse(304)
+        return None
+
+    def head(self, url, headers=None, **kwargs):
+        return self._respond('HEAD', headers) or _FakeResponse(200, b'', self._headers())
+
+    def get(self, url, headers=None, **kwargs):
+        response = self._respond('GET', headers)
+        if response:
+            return response
+        if 'Range' in headers and self.accept_ranges:
+            start, end = (int(part) for part in headers['Range'][len('bytes='):].split('-'))
+            return _FakeResponse(206, self.body[start:end + 1])
+        return _FakeResponse(200, self.body, self._headers())
+
+
+@override_settings(PDF_RANGE_MIN_BYTES=0, PDF_EXTRACT_WORKERS=1)
+class PDFTextCacheTest(SimpleTestCase):
+    """Tests for the on-disk PDF text cache used by PDFExtractor."""
+
+    url = 'https://example.com/toc.pdf'
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache = PDFTextCache(directory=tmp_dir.name, revalidate_after=3600)
+        self.extractor = PDFExtractor(max_pages=30, cache=self.cache)
+        patcher = patch.object(PDFExtractor, '_extract_pages',
+                               return_value=CachedPages(pages=['Spis treści', '', 'Rozdział 1'], page_count=3))
+        self.extract_pages = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.server = _FakePDFServer()
+        patcher = patch('ai.extractors.pdf_download.get_session', return_value=self.server)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fresh_entry_skips_download_and_parse(self):
+        """Test that a repeated extraction is served from disk."""
+        first = self.extractor.extract_text_from_url(self.url)
+        second = self.extractor.extract_text_from_url(self.url)
+
+        self.assertEqual(first, 'Spis treści\n\nRozdział 1')
+        self.assertEqual(second, first)
+        self.assertEqual(len(self.server.requests), 1)
+        self.extract_pages.assert_called_once()
+
+    def test_stale_entry_is_revalidated(self):
+        """Test that an old entry sends If-None-Match and reuses the text on 304."""
+        self.extractor.extract_text_from_url(self.url)
+        entry = self.cache.get_url(self.url)
+        entry.checked_at = time.time() - 7200
+        self.cache.set_url(entry)
+
+        text = self.extractor.extract_text_from_url(self.url)
+
+        self.assertEqual(text, 'Spis treści\n\nRozdział 1')
+        self.assertEqual(self.server.requests[-1], ('GET', {'If-None-Match': '"v1"'}))
+        self.extract_pages.assert_called_once()
+        self.assertTrue(self.cache.is_fresh(self.cache.get_url(self.url)))
+
+    def test_same_content_under_new_url_is_not_parsed_again(self):
+        """Test that page text is addressed by the PDF content hash."""
+        self.extractor.extract_text_from_url(self.url)
+        self.extractor.extract_text_from_url('https://mirror.example.com/toc.pdf')
+
+        self.assertEqual(len(self.server.requests), 2)
+        self.extract_pages.assert_called_once()
+
+    def test_stale_entry_served_when_server_unavailable(self):
+        """Test that cached text is used when revalidation fails."""
+        self.extractor.extract_text_from_url(self.url)
+        self.cache.revalidate_after = 0
+
+        self.server.status_code = 503
+        text = self.extractor.extract_text_from_url(self.url)
+
+        self.assertEqual(text, 'Spis treści\n\nRozdział 1')
+
+
+class PDFDownloadTest(SimpleTestCase):
+    """Tests for streaming and range-based PDF downloads."""
+
+    url = 'https://example.com/big.pdf'
+
+    def setUp(self):
+        self.pdf = _make_pdf(['Spis tresci', 'Rozdzial 1', 'Rozdzial 2'], padding=20000)
+        self.server = _FakePDFServer(self.pdf, accept_ranges=True)
+        patcher = patch('ai.extractors.pdf_download.get_session', return_value=self.server)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_streamed_download_hashes_content(self):
+        """Test that the streamed file and hash match the response body."""
+        with pdf_download.download_pdf(self.url) as download:
+            self.assertEqual(download.file.read(), self.pdf)
+            self.assertEqual(download.content_hash, content_hash(self.pdf))
+
+    def test_size_cap_from_content_length(self):
+        """Test that an oversized PDF is rejected before reading the body."""
+        with self.assertRaises(pdf_download.PDFTooLargeError):
+            pdf_download.download_pdf(self.url, max_bytes=1000)
+
+    def test_size_cap_while_streaming(self):
+        """Test that the cap holds when the server sends no Content-Length."""
+        self.server.send_length = False
+
+        with self.assertRaises(pdf_download.PDFTooLargeError):
+            pdf_download.download_pdf(self.url, max_bytes=1000)
+
+    def test_range_file_reads_only_needed_blocks(self):
+        """Test that parsing the first page through range requests skips the padding."""
+        range_file = pdf_download.HTTPRangeFile(self.url, len(self.pdf), '"v1"', block_size=1024)
+
+        pages, page_count = page_extraction.extract_pages(range_file, max_pages=1)
+
+        self.assertEqual(pages, ['Spis tresci'])
+        self.assertEqual(page_count, 3)
+        self.assertLess(range_file.bytes_fetched, len(self.pdf) / 2)
+        self.assertTrue(all(headers.get('If-Range') == '"v1"' for _, headers in self.server.requests))
+
+    @override_settings(PDF_RANGE_MIN_BYTES=1, PDF_CACHE_DIR='')
+    def test_extractor_uses_ranges_for_large_pdf(self):
+        """Test that the extractor never downloads a large PDF in full when ranges work."""
+        text = PDFExtractor(max_pages=2).extract_text_from_url(self.url)
+
+        self.assertIn('Rozdzial 1', text)
+        methods = [(method, 'Range' in headers) for method, headers in self.server.requests]
+        self.assertEqual(methods[0], ('HEAD', False))
+        self.assertTrue(all(has_range for method, has_range in methods[1:]))
+
+    @override_settings(PDF_RANGE_MIN_BYTES=1, PDF_CACHE_DIR='', PDF_EXTRACT_WORKERS=1)
+    def test_extractor_downloads_when_ranges_unsupported(self):
+        """Test the streamed download fallback for servers without Accept-Ranges."""
+        self.server.accept_ranges = False
+
+        text = PDFExtractor(max_pages=2).extract_text_from_url(self.url)
+
+        self.assertIn('Rozdzial 1', text)
+        self.assertEqual([method for method, _ in self.server.requests], ['HEAD', 'GET'])
+
+
+class PageExtractionTest(SimpleTestCase):
+    """Tests for the parallel, early-stopping page extraction."""
+
+    def setUp(self):
+        pdf_file = tempfile.NamedTemporaryFile(suffix='.pdf')
+        self.addCleanup(pdf_file.close)
+        pdf_file.write(_make_pdf([f'Page {i}' for i in range(10)]))
+        pdf_file.flush()
+        self.path = pdf_file.name
+
+    def test_sequential_stops_at_max_chars(self):
+        """Test that in-process extraction stops once enough text is gathered."""
+        pages, page_count = page_extraction.extract_pages(self.path, max_pages=30, max_chars=20)
+
+        self.assertEqual(pages, ['Page 0', 'Page 1', 'Page 2', 'Page 3'])
+        self.assertEqual(page_count, 10)
+
+    def test_parallel_pages_are_streamed_in_order(self):
+        """Test that page ranges finishing out of order are yielded in page order."""
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            streamed = list(page_extraction.iter_pages(
+                self.path, max_pages=7, executor=executor, workers=3))
+
+        self.assertEqual(streamed, [(i, f'Page {i}') for i in range(7)])
+
+    def test_parallel_early_stop_skips_remaining_ranges(self):
+        """Test that no further page ranges are parsed after reaching max_chars."""
+        with ThreadPoolExecutor(max_workers=2) as executor, \
+                patch('ai.extractors.page_extraction.extract_page_range',
+                      wraps=page_extraction.extract_page_range) as extract_range:
+            pages, _ = page_extraction.extract_pages(
+                self.path, max_pages=30, max_chars=20, executor=executor, workers=2)
+
+        self.assertEqual(pages, ['Page 0', 'Page 1', 'Page 2', 'Page 3'])
+        self.assertLessEqual(extract_range.call_count, 3)
+
+    def test_process_pool(self):
+        """Test extraction in spawned worker processes."""
+        with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn')) as executor:
+            pages, _ = page_extraction.extract_pages(self.path, max_pages=5, executor=executor, workers=2)
+
+        self.assertEqual(pages, [f'Page {i}' for i in range(5)])
+
+
+class _FakeGenerator:
+    instances = 0
+
+    def __init__(self):
+        type(self).instances += 1
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def _run(self, kind, **book):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        return kind, book['title']
+
+    def generate_questions(self, **book):
+        return self._run('agent', **book)
+
+    def generate_questions_simple(self, **book):
+        return self._run('simple', **book)
+
+    async def _arun(self, kind, **book):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        return kind, book['title']
+
+    async def agenerate_questions(self, **book):
+        return await self._arun('agent', **book)
+
+    async def agenerate_questions_simple(self, **book):
+        return await self._arun('simple', **book)
+
+
+@patch('ai.agent.generator_pool.BookQuestionGenerator', _FakeGenerator)
+class GeneratorPoolTest(SimpleTestCase):
+    """Tests for the process-wide question generator pool."""
+
+    def setUp(self):
+        _FakeGenerator.instances = 0
+        self.pool = GeneratorPool(max_concurrency=2)
+
+    def test_generator_is_reused(self):
+        """Test that all calls share one warm generator."""
+        self.pool.generate_questions(title='A')
+        self.pool.generate_questions(use_agent=False, title='B')
+
+        self.assertEqual(_FakeGenerator.instances, 1)
+
+    def test_concurrency_is_bounded(self):
+        """Test that no more than max_concurrency generations run at once."""
+        threads = [
+            threading.Thread(target=self.pool.generate_questions, kwargs={'title': str(i)})
+            for i in range(6)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.pool.get_generator().max_running, 2)
+
+    async def test_agenerate_questions(self):
+        """Test the async API and the simple (no agent) mode."""
+        results = await asyncio.gather(*[
+            self.pool.agenerate_questions(use_agent=False, title=str(i)) for i in range(4)
+        ])
+
+        self.assertEqual(results, [('simple', str(i)) for i in range(4)])
+        self.assertEqual(self.pool.get_generator().max_running, 2)
+
+    async def test_sync_and_async_share_the_limit(self):
+        """Test that blocking and async generations together stay within max_concurrency."""
+        threads = [
+            threading.Thread(target=self.pool.generate_questions, kwargs={'title': str(i)})
+            for i in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        await asyncio.gather(*[self.pool.agenerate_questions(title=str(i)) for i in range(3)])
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.pool.get_generator().max_running, 2)
+
+    async def test_cancelled_waiter_frees_its_place(self):
+        """Test that cancelling a waiting async generation does not leak a place."""
+        waiting = asyncio.ensure_future(self.pool.agenerate_questions(title='x'))
+        async with self.pool._limit, self.pool._limit:
+            await asyncio.sleep(0)
+            waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+
+        results = await asyncio.gather(*[self.pool.agenerate_questions(title=str(i)) for i in range(2)])
+        self.assertEqual(len(results), 2)
+
+
+class _FakeAsyncChat:
+    """LLM, który najpierw prosi o wyszukiwanie, a potem zwraca JSON z pytaniami"""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.calls = []
+
+    def invoke(self, messages):
+        raise AssertionError('synchronous invoke used in the async path')
+
+    async def ainvoke(self, messages):
+        self.calls.append(list(messages))
+        if len(self.calls) == 1:
+            return MagicMock(content='', tool_calls=[
+                {'name': 'tavily_search', 'args': {'query': 'a'}, 'id': 't1'},
+                {'name': 'tavily_search', 'args': {'query': 'b'}, 'id': 't2'},
+            ])
+        return MagicMock(content=self.answer, tool_calls=[])
+
+
+class AsyncQuestionGenerationTest(SimpleTestCase):
+    """Tests for the ainvoke-based generation path."""
+
+    def setUp(self):
+        answer = json.dumps({
+            'book_title': 'Mechanika', 'book_author': 'Autor', 'book_isbn': '111', 'subject': 'Fizyka',
+            'questions': _generated('Pytanie', count=2),
+        })
+        self.generator = BookQuestionGenerator.__new__(BookQuestionGenerator)
+        self.generator.llm = self.generator.llm_with_tools = _FakeAsyncChat(answer)
+        self.generator.tavily_tool = MagicMock()
+        self.generator.tavily_tool.ainvoke = AsyncMock(return_value={'results': []})
+        self.generator.pdf_extractor = MagicMock()
+        self.generator.pdf_extractor.aextract_text_from_url = AsyncMock(return_value='Spis treści')
+        self.book = {'title': 'Mechanika', 'author': 'Autor', 'isbn': '111', 'subject': 'Fizyka',
+                     'toc_pdf_url': 'https://example.com/toc.pdf'}
+
+    async def test_agent_runs_search_calls_and_parses_answer(self):
+        """Test that tool calls are awaited and their results sent back to the LLM."""
+        result = await self.generator.agenerate_questions(**self.book)
+
+        self.assertIsInstance(result, BookQuestionsResponse)
+        self.assertEqual(len(result.questions), 2)
+        self.assertEqual(self.generator.tavily_tool.ainvoke.await_count, 2)
+        tool_messages = [m for m in self.generator.llm.calls[1] if isinstance(m, ToolMessage)]
+        self.assertEqual([m.tool_call_id for m in tool_messages], ['t1', 't2'])
+        self.generator.pdf_extractor.aextract_text_from_url.assert_awaited_once_with(self.book['toc_pdf_url'])
+
+    async def test_failed_search_is_logged_and_skipped(self):
+        """Test that a failing search call is logged and left out of the tool results."""
+        self.generator.tavily_tool.ainvoke.side_effect = [{'results': []}, OSError('timeout')]
+
+        with self.assertLogs('ai.agent.question_generator', level='WARNING'):
+            await self.generator.agenerate_questions(**self.book)
+
+        tool_messages = [m for m in self.generator.llm.calls[1] if isinstance(m, ToolMessage)]
+        self.assertEqual([m.tool_call_id for m in tool_messages], ['t1'])
+
+    async def test_missing_pdf_text(self):
+        """Test that generation fails fast when the PDF yields no text."""
+        self.generator.pdf_extractor.aextract_text_from_url.return_value = None
+
+        with self.assertRaises(ValueError):
+            await self.generator.agenerate_questions_simple(**self.book)
+
+
+@override_settings(PDF_RANGE_MIN_BYTES=0, PDF_EXTRACT_WORKERS=1)
+class AsyncPDFExtractionTest(SimpleTestCase):
+    """Tests for the httpx-based PDF fetch."""
+
+    url = 'https://example.com/toc.pdf'
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache = PDFTextCache(directory=tmp_dir.name, revalidate_after=0)
+        self.pdf = _make_pdf(['Spis tresci', 'Rozdzial 1'])
+        self.requests = []
+
+    def _handler(self, request):
+        self.requests.append(request)
+        if request.headers.get('If-None-Match') == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=self.pdf, headers={'ETag': '"v1"'})
+
+    async def test_download_parse_and_revalidate(self):
+        """Test that the async path parses the PDF and revalidates with If-None-Match."""
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self._handler))
+        extractor = PDFExtractor(max_pages=5, cache=self.cache)
+
+        with patch('ai.extractors.pdf_download.get_async_client', return_value=client):
+            first = await extractor.aextract_text_from_url(self.url)
+            second = await extractor.aextract_text_from_url(self.url)
+        await client.aclose()
+
+        self.assertEqual(first, 'Spis tresci\n\nRozdzial 1')
+        self.assertEqual(second, first)
+        self.assertEqual(self.requests[1].headers['If-None-Match'], '"v1"')
+
+    async def test_size_cap(self):
+        """Test that the async download enforces the size limit."""
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self._handler))
+
+        with patch('ai.extractors.pdf_download.get_async_client', return_value=client):
+            with self.assertRaises(pdf_download.PDFTooLargeError):
+                await pdf_download.adownload_pdf(self.url, max_bytes=100)
+        await client.aclose()
@@ -3,7 +3,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from quiz.models import Book
-from ai.agent.question_generator import BookQuestionGenerator
+from ai.agent.generator_pool import get_generator_pool
 
 
 class GenerateQuestionsView(APIView):
@@ -23,29 +23,18 @@ class GenerateQuestionsView(APIView):
             # Pobierz książkę
             book = Book.objects.get(id=book_id)
 
-            # Inicjalizuj generator
-            generator = BookQuestionGenerator()
-
             # Sprawdź czy używać agenta czy prostego LLM
             use_agent = request.data.get('use_agent', True)
 
-            # Generuj pytania
-            if use_agent:
-                result = generator.generate_questions(
-                    title=book.title,
-                    author=book.author,
-                    isbn=book.isbn,
-                    subject=book.subject.name,
-                    toc_pdf_url=book.toc_pdf_url
-                )
-            else:
-                result = generator.generate_questions_simple(
-                    title=book.title,
-                    author=book.author,
-                    isbn=book.isbn,
-                    subject=book.subject.name,
-                    toc_pdf_url=book.toc_pdf_url
-                )
+            # Generuj pytania (współdzielony, rozgrzany generator procesu)
+            result = get_generator_pool().generate_questions(
+                use_agent=bool(use_agent),
+                title=book.title,
+                author=book.author,
+                isbn=book.isbn,
+                subject=book.subject.name,
+                toc_pdf_url=book.toc_pdf_url
+            )
 
             # Zwróć odpowiedź (result jest już dict po model_dump())
             return Response(
@@ -1,8 +1,13 @@
 from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework import authentication, exceptions as rest_exceptions
 
+from .user_cache import get_cached_user, password_md5
+
 
 def enforce_csrf(request):
     check = authentication.CSRFCheck(request)
@@ -36,3 +41,27 @@ class CustomAuthentication(JWTAuthentication):
             enforce_csrf(request)
 
         return self.get_user(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        """JWTAuthentication.get_user z użytkownikiem z cache (auth_api/user_cache.py)"""
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = get_cached_user(user_id, settings.AUTH_USER_CACHE_TIMEOUT)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != password_md5(user):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
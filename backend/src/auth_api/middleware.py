@@ -1,12 +1,16 @@
+from urllib.parse import parse_qs
+
+from channels.middleware import BaseMiddleware
 from django.utils.deprecation import MiddlewareMixin
 from django.conf import settings
-from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
-from .authenticate import CustomAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from src.db_executor import database_sync_to_async
+from .user_cache import get_cached_user
 import logging
 
-User = get_user_model()
-
 logger = logging.getLogger(__name__)
 
 
@@ -17,3 +21,42 @@ class CSRFMiddleware(MiddlewareMixin):
         if csrf_cookie:
             request.META["HTTP_X_CSRFTOKEN"] = csrf_cookie
         return None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Uwierzytelnianie WebSocket tokenem JWT z query string (?token=...).
+
+    Token dostępu jest weryfikowany raz (podpis, typ, wygaśnięcie), a
+    użytkownik pochodzi z tego samego cache co w CustomAuthentication
+    (AUTH_USER_CACHE_TIMEOUT) - fala ponownych połączeń po wdrożeniu nie
+    odpytuje bazy dla każdego gniazda. Ustawia scope['user'] (AnonymousUser,
+    gdy token jest błędny) i scope['auth_error'] z powodem odrzucenia.
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        scope["user"], scope["auth_error"] = await self.authenticate(scope)
+        return await super().__call__(scope, receive, send)
+
+    async def authenticate(self, scope):
+        query = parse_qs(scope.get("query_string", b"").decode())
+        raw_token = query.get("token", [None])[0]
+        if not raw_token:
+            return AnonymousUser(), "No token provided"
+
+        try:
+            token = AccessToken(raw_token)
+        except TokenError as e:
+            return AnonymousUser(), f"Invalid token: {e}"
+
+        user_id = token.payload.get(api_settings.USER_ID_CLAIM)
+        if not user_id:
+            return AnonymousUser(), "No user_id in token"
+
+        user = await database_sync_to_async(get_cached_user)(user_id, settings.AUTH_USER_CACHE_TIMEOUT)
+        if user is None:
+            return AnonymousUser(), f"User {user_id} not found"
+        if not user.is_active:
+            return AnonymousUser(), f"User {user_id} is not active"
+        return user, None
@@ -0,0 +1,31 @@
+"""
+Unieważnianie użytkowników w cache uwierzytelniania (auth_api.user_cache).
+
+Każdy zapis i usunięcie User - z widoków, panelu admina, changepassword czy
+shella - podbija wersję uwierzytelniania po commit, więc np. dezaktywowane
+konto przestaje się uwierzytelniać od następnego żądania.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .user_cache import bump_auth_version
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User, dispatch_uid="auth_user_cache_save")
+def invalidate_saved_user(sender, instance, update_fields=None, **kwargs):
+    # Samo last_login (update_last_login) nie zmienia danych uwierzytelniania
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    user_id = instance.pk
+    # Po commit - równoległe żądanie mogłoby zapisać stare dane pod nową wersją
+    transaction.on_commit(lambda: bump_auth_version(user_id))
+
+
+@receiver(post_delete, sender=User, dispatch_uid="auth_user_cache_delete")
+def invalidate_deleted_user(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: bump_auth_version(user_id))
@@ -1,22 +1,35 @@
 import json
 from unittest.mock import patch, MagicMock
-from django.test import TestCase, Client
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.tokens import default_token_generator
 from django.urls import reverse
 from django.conf import settings
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
-from rest_framework_simplejwt.tokens import RefreshToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken, OutstandingToken
 from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
 
+from .middleware import JWTAuthMiddleware
+from .user_cache import user_key
+
 User = get_user_model()
 
 
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "shared"},
+        "local": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "local"},
+    }
+)
 class AuthenticationTestCase(APITestCase):
     """Base test case with common setup for authentication tests."""
 
     def setUp(self):
+        for alias in ("default", "local"):
+            caches[alias].clear()
         self.client = APIClient()
         self.user_data = {
             "email": "testuser@example.com",
@@ -546,3 +559,110 @@ class IntegrationTest(AuthenticationTestCase):
         # Logout
         logout_response = self.client.post(reverse("logout"))
         self.assertEqual(logout_response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(DB_EXECUTOR_WORKERS=0)
+class JWTAuthMiddlewareTest(AuthenticationTestCase):
+    """Test cases for WebSocket JWT authentication."""
+
+    def connect(self, query_string):
+        scopes = []
+
+        async def app(scope, receive, send):
+            scopes.append(scope)
+
+        async_to_sync(JWTAuthMiddleware(app))(
+            {"type": "websocket", "query_string": query_string.encode()}, None, None)
+        return scopes[0]
+
+    def test_valid_token_sets_user(self):
+        """Test that a valid access token populates scope['user']."""
+        scope = self.connect(f"token={AccessToken.for_user(self.user)}")
+
+        self.assertEqual(scope["user"], self.user)
+        self.assertIsNone(scope["auth_error"])
+
+    def test_reconnect_does_not_query_database(self):
+        """Test that a reconnect takes the user from the authentication cache."""
+        query_string = f"token={AccessToken.for_user(self.user)}"
+        self.connect(query_string)
+
+        with self.assertNumQueries(0):
+            scope = self.connect(query_string)
+        self.assertEqual(scope["user"].id, self.user.id)
+
+    def test_invalid_or_missing_token_is_anonymous(self):
+        """Test that a bad token leaves an anonymous user and an error reason."""
+        for query_string in ("", "token=invalid"):
+            scope = self.connect(query_string)
+            self.assertFalse(scope["user"].is_authenticated)
+            self.assertTrue(scope["auth_error"])
+
+    def test_refresh_token_is_rejected(self):
+        """Test that only access tokens open a WebSocket."""
+        scope = self.connect(f"token={RefreshToken.for_user(self.user)}")
+
+        self.assertFalse(scope["user"].is_authenticated)
+        self.assertIn("Invalid token", scope["auth_error"])
+
+    def test_inactive_user_is_anonymous(self):
+        """Test that an inactive user cannot open a WebSocket."""
+        scope = self.connect(f"token={AccessToken.for_user(self.inactive_user)}")
+
+        self.assertFalse(scope["user"].is_authenticated)
+
+
+class CustomAuthenticationCacheTest(AuthenticationTestCase):
+    """Test cases for the cached user in REST authentication."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def test_repeated_requests_do_not_query_user(self):
+        """Test that authentication is served from the cache after the first request."""
+        self.client.get(reverse("user"))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("user"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_account_change_reloads_user(self):
+        """Test that changing the e-mail invalidates the cached user."""
+        self.client.get(reverse("user"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("change_email"), {"new_email": "changed@example.com"})
+        response = self.client.get(reverse("user"))
+
+        self.assertEqual(response.data["email"], "changed@example.com")
+
+    def test_deleted_user_is_rejected(self):
+        """Test that a deleted account stops authenticating right away."""
+        self.client.get(reverse("user"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(reverse("delete_user"))
+        response = self.client.get(reverse("user"))
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_outside_views_is_rejected(self):
+        """Test that deactivating a user directly (admin, shell) invalidates the cached user."""
+        self.client.get(reverse("user"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.get(pk=self.user.pk)
+            user.is_active = False
+            user.save()
+        response = self.client.get(reverse("user"))
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_holds_no_password_hash(self):
+        """Test that the cached entry keeps only the fields authentication needs."""
+        self.client.get(reverse("user"))
+
+        entry = caches["default"].get(user_key(self.user.id))
+        self.assertNotIn("password", entry)
+        self.assertNotIn(self.user.password, str(entry))
@@ -0,0 +1,74 @@
+"""
+Uwierzytelnieni użytkownicy w cache (src.cache: pamięć procesu przed Redis).
+
+Z cache korzystają CustomAuthentication (każde żądanie REST) i
+JWTAuthMiddleware (handshake WebSocket), więc w stanie ustalonym
+uwierzytelnienie nie odpytuje bazy. W cache są tylko pola potrzebne do
+uwierzytelnienia (bez skrótu hasła); pozostałe pola instancji są odroczone
+i wczytywane z bazy przy pierwszym dostępie.
+
+Klucz zawiera id użytkownika i jego wersję uwierzytelniania. Każdy zapis i
+usunięcie użytkownika (widoki, admin, changepassword, shell) podbija wersję
+po commit (auth_api.signals), a wylogowanie ze wszystkich urządzeń -
+bump_auth_version() w widoku. Kolejne żądanie wczyta użytkownika z bazy;
+inne procesy widzą nową wersję najpóźniej po LOCAL_CACHE_TIMEOUT sekundach.
+"""
+from typing import Dict, Optional
+
+from django.contrib.auth import get_user_model
+from django.db import router
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from src import cache
+
+User = get_user_model()
+
+CACHED_FIELDS = ("id", "email", "username", "first_name", "last_name", "is_active", "is_staff", "is_superuser")
+
+
+def _version_namespace(user_id) -> str:
+    return f"auth_user:{user_id}"
+
+
+def user_key(user_id) -> str:
+    return f"auth_user:{user_id}:v{cache.get_version(_version_namespace(user_id))}"
+
+
+def _load_fields(user_id) -> Optional[Dict]:
+    row = (
+        User.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+        .values(*CACHED_FIELDS, "password")
+        .first()
+    )
+    if row is None:
+        return None
+    password = row.pop("password")
+    # CHECK_REVOKE_TOKEN porównuje tylko md5 skrótu hasła
+    row["password_md5"] = get_md5_hash_password(password) if api_settings.CHECK_REVOKE_TOKEN else None
+    return row
+
+
+def get_cached_user(user_id, timeout: int) -> Optional[User]:
+    """Użytkownik o podanym id (None - brak w bazie, nie jest zapisywany)"""
+    fields = cache.get_or_build(user_key(user_id), lambda: _load_fields(user_id), timeout)
+    if fields is None:
+        return None
+    fields = dict(fields)
+    password_md5 = fields.pop("password_md5")
+    # from_db oczekuje wartości w kolejności pól modelu
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in fields]
+    user = User.from_db(router.db_for_read(User), names, [fields[name] for name in names])
+    user._cached_password_md5 = password_md5
+    return user
+
+
+def password_md5(user) -> str:
+    """md5 skrótu hasła (CHECK_REVOKE_TOKEN) bez wczytywania odroczonego pola password"""
+    cached = getattr(user, "_cached_password_md5", None)
+    return cached if cached is not None else get_md5_hash_password(user.password)
+
+
+def bump_auth_version(user_id) -> None:
+    """Unieważnij zapisanego użytkownika po zmianie konta lub odwołaniu sesji"""
+    cache.bump_version(_version_namespace(user_id))
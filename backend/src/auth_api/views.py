@@ -14,9 +14,11 @@ from rest_framework_simplejwt.tokens import (
 from django.conf import settings
 from rest_framework_simplejwt.views import TokenRefreshView
 from mail.mail_service import Email
+from quiz.user_summary import invalidate_user_summary
 from .authenticate import CustomAuthentication
 from .exceptions import UserNotActive
 from .permissions import AllowUnauthenticated
+from .user_cache import bump_auth_version
 from .serializers import (
     ChangeEmailSerializer,
     ChangePasswordSerializer,
@@ -205,6 +207,7 @@ class LogoutAllView(APIView):
         tokens = OutstandingToken.objects.filter(user_id=request.user.id)
         for token in tokens:
             t, _ = BlacklistedToken.objects.get_or_create(token=token)
+        bump_auth_version(request.user.id)
 
         res_data = {"message": "Successfully logged out"}
 
@@ -220,6 +223,10 @@ class UserDetailsView(RetrieveUpdateAPIView):
     def get_object(self):
         return self.request.user
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        invalidate_user_summary(serializer.instance.id)
+
 
 class PasswordResetRequestView(APIView):
     permission_classes = [AllowAny]
@@ -289,6 +296,7 @@ class ChangeEmailView(APIView):
         if serializer.is_valid():
             request.user.email = serializer.validated_data["new_email"]
             request.user.save()
+            invalidate_user_summary(request.user.id)
             return Response(
                 {"message": "Email updated successfully"}, status=status.HTTP_200_OK
             )
@@ -317,7 +325,9 @@ class DeleteUserView(APIView):
 
     def delete(self, request):
         user = request.user
+        user_id = user.id
         user.delete()
+        invalidate_user_summary(user_id)
         return Response(
             {"message": "User deleted successfully"}, status=status.HTTP_204_NO_CONTENT
         )
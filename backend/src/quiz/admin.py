@@ -1,16 +1,33 @@
 from django.contrib import admin
+from .catalog import invalidate_catalog
 from .models import Subject, Book
 
 
+class CatalogAdmin(admin.ModelAdmin):
+    """Zmiany katalogu w adminie unieważniają cache list (quiz/catalog.py)"""
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        invalidate_catalog()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_catalog()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        invalidate_catalog()
+
+
 @admin.register(Subject)
-class SubjectAdmin(admin.ModelAdmin):
+class SubjectAdmin(CatalogAdmin):
     list_display = ['name', 'color', 'icon_name']
     search_fields = ['name']
     list_filter = ['color']
 
 
 @admin.register(Book)
-class BookAdmin(admin.ModelAdmin):
+class BookAdmin(CatalogAdmin):
     list_display = ['title', 'author', 'isbn', 'subject', 'toc_pdf_url']
     search_fields = ['title', 'author', 'isbn']
     list_filter = ['subject']
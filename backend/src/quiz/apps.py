@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class QuizConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'quiz'
+
+    def ready(self):
+        from src.db_pool import start_pool_health_checks
+        from . import signals  # noqa: F401
+        from .log import start_queue_listeners
+
+        start_queue_listeners()
+        start_pool_health_checks()
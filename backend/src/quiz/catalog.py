@@ -0,0 +1,52 @@
+"""
+Cache katalogu (przedmioty i książki) dla SubjectListView i BookListView.
+
+Katalog zmienia się tylko przez import (generate_data_from_json) i panel
+admina, więc odpowiedzi list są trzymane w cache dwupoziomowym (src.cache:
+LRU w pamięci procesu przed Redis) pod kluczami z wersją katalogu.
+invalidate_catalog() podbija wersję - wszystkie stare wpisy przestają być
+czytane naraz. Każda odpowiedź ma ETag; klient z aktualnym If-None-Match
+dostaje 304 bez treści.
+"""
+import hashlib
+from typing import Callable
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from src import cache
+from src.encoding import dumps
+
+CATALOG_NAMESPACE = 'catalog'
+
+
+def catalog_key(name: str) -> str:
+    return f'{CATALOG_NAMESPACE}:v{cache.get_version(CATALOG_NAMESPACE)}:{name}'
+
+
+def invalidate_catalog() -> None:
+    """
+    Unieważnij wszystkie zapisane odpowiedzi katalogu (import, admin).
+
+    Wewnątrz transakcji (zapis w adminie) wersja jest podbijana po
+    commit - inaczej równoległe żądanie zapisałoby stare dane pod nową wersją.
+    """
+    transaction.on_commit(lambda: cache.bump_version(CATALOG_NAMESPACE))
+
+
+def _entry(build: Callable[[], list]) -> dict:
+    data = list(build())
+    return {'etag': '"%s"' % hashlib.md5(dumps(data)).hexdigest(), 'data': data}
+
+
+def catalog_response(request, name: str, build: Callable[[], list]) -> Response:
+    """Odpowiedź listy katalogu z cache; 304 gdy If-None-Match zgadza się z ETag"""
+    entry = cache.get_or_build(catalog_key(name), lambda: _entry(build), settings.CATALOG_CACHE_TIMEOUT)
+    headers = {'ETag': entry['etag'], 'Cache-Control': 'private, no-cache'}
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if '*' in etags or entry['etag'] in [etag.removeprefix('W/') for etag in etags]:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(entry['data'], headers=headers)
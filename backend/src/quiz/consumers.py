@@ -3,98 +3,105 @@ WebSocket consumers for real-time multiplayer matches.
 """
 import json
 import asyncio
+import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from jwt import decode as jwt_decode
-from django.conf import settings
-from collections import defaultdict
+from src.db_executor import DatabaseLaneMixin, database_sync_to_async
+from src.encoding import JSONFrameMixin
 
-from .models import Match, MatchQuestion, Question, UserRanking, Book, Subject
-from .serializers import QuestionSerializer, QuestionWithAnswerSerializer, MatchQuestionWithAnswerSerializer
+from .models import Match, Question, UserRanking, Book, Subject
+from .match_clock import match_clock
+from .match_state import NO_ANSWER, get_match_state, match_questions, persist_result
+from .match_seeding import aseed_match_questions
+from .scheduler import cancel_heartbeat, get_scheduler, schedule_heartbeat
+from .log import match_logger
+from .user_summary import invalidate_user_summary
 
 User = get_user_model()
 
-# Globalna kolejka matchmaking (w produkcji użyj Redis)
-matchmaking_queue = defaultdict(list)  # {book_id: [match_id, ...]}
+logger = logging.getLogger(__name__)
+# Synchronizacja timera (co sekundę na mecz) - próbkowana w LOGGING
+timer_logger = logging.getLogger(__name__ + '.timer')
 
+# Czas wyświetlania wyniku pytania przed następnym pytaniem (sekundy)
+RESULT_DISPLAY_TIME = 3.0
 
-class MatchConsumer(AsyncWebsocketConsumer):
+
+# Terminy meczu w harmonogramie workera (quiz.scheduler). Callbacki nie
+# odwołują się do consumera - wysyłają event do grupy meczu, więc termin
+# działa także po rozłączeniu gracza, który go ustawił.
+
+def schedule_question(match_id, question_index, deadline):
+    """Koniec czasu na pytanie i synchronizacja timera (od razu, potem co sekundę)"""
+    scheduler = get_scheduler()
+    scheduler.schedule(('question', match_id), deadline, question_deadline_due, match_id, question_index)
+    scheduler.schedule(('timer', match_id), scheduler.clock(), timer_sync_due, match_id, question_index)
+
+
+def cancel_question(match_id):
+    scheduler = get_scheduler()
+    scheduler.cancel(('question', match_id))
+    scheduler.cancel(('timer', match_id))
+
+
+async def question_deadline_due(match_id, question_index):
+    await get_channel_layer().group_send(
+        f'match_{match_id}', {'type': 'question_deadline', 'question_index': question_index})
+
+
+async def question_advance_due(match_id, question_index):
+    await get_channel_layer().group_send(
+        f'match_{match_id}', {'type': 'question_advance', 'question_index': question_index})
+
+
+async def timer_sync_due(match_id, question_index):
+    """
+    Wyślij aktualny czas pytania i zaplanuj kolejny tick za sekundę.
+
+    Czas jest liczony z zegara meczu w pamięci (match_clock). Ticki kończą
+    się, gdy zegar zostanie zatrzymany (wynik pytania), usunięty (koniec
+    meczu) lub gdy minie czas - wtedy pytanie zamyka question_deadline.
+    """
+    clock = match_clock.get(match_id)
+    if clock is None or clock.stopped or clock.question_index != question_index:
+        return
+    time_left = clock.time_left()
+    timer_logger.debug('Timer sync: time_left=%s, question_index=%s', time_left, question_index,
+                       extra={'match_id': match_id})
+    if time_left > 0:
+        get_scheduler().schedule_in(('timer', match_id), 1, timer_sync_due, match_id, question_index)
+    await get_channel_layer().group_send(
+        f'match_{match_id}',
+        {
+            'type': 'timer_sync',
+            'time_left': time_left,
+            'question_index': question_index,
+        }
+    )
+
+
+class MatchConsumer(DatabaseLaneMixin, JSONFrameMixin, AsyncWebsocketConsumer):
     """Consumer dla real-time meczów multiplayer"""
 
     async def connect(self):
         """Połączenie WebSocket z autentykacją JWT"""
         self.match_id = self.scope['url_route']['kwargs']['match_id']
         self.match = None
+        # Stan meczu ze wspólnego magazynu (quiz.match_state)
+        self.state = None
         self.user = None
         self.match_group_name = f'match_{self.match_id}'
-        # Śledzenie czasu rozpoczęcia każdego pytania {question_index: timestamp}
-        self.question_start_time = {}
-        # Flaga, aby upewnić się, że timer sync loop jest uruchamiany tylko raz
-        self._timer_loop_started = False
-        self._timer_task = None
-
-        # Autentykacja przez JWT token w query string
-        query_string = self.scope.get('query_string', b'').decode()
-
-        # Parsuj query string - obsłuż URL encoding
-        token = None
-        if query_string:
-            params = query_string.split('&')
-            for param in params:
-                if param.startswith('token='):
-                    token = param.split('=', 1)[1]
-                    # URL decode jeśli potrzeba
-                    import urllib.parse
-                    token = urllib.parse.unquote(token)
-                    break
-
-        if not token:
-            print(
-                f"MatchConsumer: No token provided. Query string: {query_string}")
-            await self.close(code=4001)
-            return
+        # Logger z kontekstem meczu (user_id uzupełniany po autentykacji)
+        self.log = match_logger(logger, match_id=self.match_id)
 
-        try:
-            # Weryfikacja tokena
-            validated_token = UntypedToken(token)
-            decoded_data = jwt_decode(
-                token, settings.SECRET_KEY, algorithms=["HS256"])
-            user_id = decoded_data.get('user_id')
-
-            if not user_id:
-                print(f"MatchConsumer: No user_id in token")
-                await self.close(code=4001)
-                return
-
-            self.user = await self.get_user(user_id)
-            if not self.user:
-                print(f"MatchConsumer: User {user_id} not found")
-                await self.close(code=4001)
-                return
-
-            if not self.user.is_active:
-                print(f"MatchConsumer: User {user_id} is not active")
-                await self.close(code=4001)
-                return
-
-        except TokenError as e:
-            print(f"MatchConsumer: TokenError: {str(e)}")
-            await self.close(code=4001)
-            return
-        except InvalidToken as e:
-            print(f"MatchConsumer: InvalidToken: {str(e)}")
-            await self.close(code=4001)
-            return
-        except Exception as e:
-            import traceback
-            print(
-                f"MatchConsumer: Exception during auth: {type(e).__name__}: {str(e)}")
-            print(traceback.format_exc())
+        # Użytkownik z JWTAuthMiddleware (token z query string)
+        self.user = self.scope.get('user')
+        if not self.user or not self.user.is_authenticated:
+            self.log.info('Authentication failed: %s', self.scope.get('auth_error'))
             await self.close(code=4001)
             return
+        self.log.extra['user_id'] = self.user.id
 
         # Sprawdź czy mecz istnieje
         self.match = await self.get_match(self.match_id)
@@ -106,30 +113,34 @@ class MatchConsumer(AsyncWebsocketConsumer):
         if self.match.status == 'finished':
             # WAŻNE: Zaakceptuj socket PRZED wysyłaniem wiadomości
             await self.accept()
-            await self.send(text_data=json.dumps({
+            await self.send_json({
                 'type': 'match:already_ended',
                 'message': 'Ten mecz już się zakończył.',
-            }))
+            })
             # Poczekaj chwilę aby upewnić się, że wiadomość została wysłana
             await asyncio.sleep(0.1)
             await self.close()
             return
 
-        # Sprawdź czy użytkownik jest uczestnikiem lub może dołączyć (matchmaking)
+        # Sprawdź czy użytkownik jest uczestnikiem - gracza 2 przydziela akceptacja
+        # powiadomienia lub kolejka matchmakingu (quiz/matchmaking.py)
         is_player1 = self.match.player1_id == self.user.id
         is_player2 = self.match.player2_id == self.user.id if self.match.player2_id else False
 
-        # Jeśli mecz czeka na przeciwnika i użytkownik nie jest player1, może dołączyć jako player2
         if not is_player1 and not is_player2:
-            if self.match.status == 'waiting' and not self.match.player2_id:
-                # Dołącz jako player2 (matchmaking)
-                self.match.player2_id = self.user.id
-                await database_sync_to_async(self.match.save)()
-                is_player2 = True
-            else:
-                await self.accept()
-                await self.close()
-                return
+            await self.accept()
+            await self.close()
+            return
+
+        # Stan meczu (Redis / pamięć) - dalej źródło prawdy zamiast Match z bazy
+        store = get_match_state()
+        self.state = await store.load(self.match.id)
+        # Przed startem mecz zmieniają też widoki REST i NotificationConsumer
+        # (dołączenie, akceptacja zaproszenia) - wtedy stan jest wczytywany od nowa
+        if self.state.status in ('waiting', 'ready') and (
+                self.state.status != self.match.status or self.state.player2_id != self.match.player2_id):
+            await store.delete(self.match.id)
+            self.state = await store.load(self.match.id)
 
         # Dołącz do grupy meczu
         await self.channel_layer.group_add(
@@ -151,29 +162,24 @@ class MatchConsumer(AsyncWebsocketConsumer):
         )
 
         # Jeśli mecz jest już aktywny, wyślij aktualne pytanie do tego gracza
-        if self.match.status == 'active':
-            print(
-                f"MatchConsumer: Player {self.user.id} joining active match {self.match.id}, sending current question")
+        if self.state.status == 'active':
+            self.log.debug('Joining active match, sending current question')
             # Poczekaj chwilę, aby upewnić się, że połączenie jest w pełni ustanowione
             await asyncio.sleep(0.2)
-            current_question = await self.get_next_question(self.match)
-            if current_question:
-                question_data = await self.get_question_data(current_question)
+            question_data = self.state.question_data(self.state.current_question_index)
+            if question_data:
                 # Dodaj current_question_index do danych
-                question_data['current_question_index'] = self.match.current_question_index
-                print(
-                    f"MatchConsumer: Sending current question (index={self.match.current_question_index}) to joining player {self.user.id}")
+                question_data['current_question_index'] = self.state.current_question_index
+                self.log.debug('Sending current question (index=%s) to joining player', self.state.current_question_index)
                 # Wysyłaj bezpośrednio do gracza, który dołącza później
-                await self.send(text_data=json.dumps({
+                await self.send_json({
                     'type': 'match:start',
                     'data': question_data,
-                }))
-                print(
-                    f"MatchConsumer: Sent current question to joining player {self.user.id}")
+                })
+                self.log.debug('Sent current question to joining player')
                 # NIE uruchamiaj timer sync loop tutaj - powinien być już uruchomiony przez player1
             else:
-                print(
-                    f"MatchConsumer: ERROR - No current question found for match {self.match.id}, index={self.match.current_question_index}")
+                self.log.error('No current question found, index=%s', self.state.current_question_index)
 
         # Jeśli obaj gracze są połączeni, powiadom o znalezieniu przeciwnika
         if self.match.player2_id:
@@ -187,49 +193,31 @@ class MatchConsumer(AsyncWebsocketConsumer):
             )
 
             # Jeśli mecz jest w stanie ready, automatycznie generuj pytania i startuj
-            if self.match.status == 'ready':
+            if self.state.status == 'ready':
                 # Poczekaj chwilę, aby obaj gracze się połączyli
                 await asyncio.sleep(1)
                 await self.start_match()
 
-        # Rozpocznij timer sync jeśli mecz jest aktywny
-        # WAŻNE: Timer sync loop powinien być uruchamiany TYLKO przez player1
-        # NIE uruchamiaj go dla player2, który dołącza później
-        if self.match.status == 'active':
-            if self.match.player1_id == self.user.id and not self._timer_loop_started:
-                # Anuluj poprzedni timer task jeśli istnieje
-                if self._timer_task:
-                    try:
-                        self._timer_task.cancel()
-                    except:
-                        pass
-                self._timer_loop_started = True
-                self._timer_task = asyncio.create_task(self.timer_sync_loop())
-                print(
-                    f"MatchConsumer: User {self.user.id} (player1) - Started timer sync loop in connect() for active match")
-            else:
-                print(
-                    f"MatchConsumer: User {self.user.id} (player2 or already started) - NOT starting timer sync loop in connect()")
+        # Terminy aktywnego pytania mogły nie istnieć w tym procesie (np. po
+        # restarcie workera) - deadline jest zapisany w stanie meczu
+        # WAŻNE: Terminy odtwarza TYLKO player1, żeby timer sync nie był wysyłany podwójnie
+        if self.state.status == 'active' and self.match.player1_id == self.user.id:
+            if not get_scheduler().pending(('question', self.match.id)):
+                clock = match_clock.start_question(
+                    self.match.id, self.state.current_question_index, deadline=self.state.deadline)
+                schedule_question(self.match.id, clock.question_index, clock.deadline)
+                self.log.info('Scheduled question deadline in connect() for active match')
 
-        # Rozpocznij heartbeat loop
-        self._heartbeat_task = asyncio.create_task(self.heartbeat_loop())
+        # Heartbeat w harmonogramie workera
+        schedule_heartbeat(self.channel_name)
 
     async def disconnect(self, close_code):
         """Rozłączenie"""
-        # Anuluj taski
-        if hasattr(self, '_timer_task') and self._timer_task is not None:
-            try:
-                self._timer_task.cancel()
-            except:
-                pass
-        if hasattr(self, '_heartbeat_task') and self._heartbeat_task is not None:
-            try:
-                self._heartbeat_task.cancel()
-            except:
-                pass
+        # Terminy meczu zostają w harmonogramie - dotyczą obu graczy
+        cancel_heartbeat(self.channel_name)
 
         # Jeśli mecz jest aktywny i gracz się rozłącza, powiadom przeciwnika
-        if hasattr(self, 'match') and self.match and self.match.status == 'active':
+        if self.state and self.state.status == 'active':
             if hasattr(self, 'user') and self.user:
                 # Sprawdź czy to gracz 1 czy 2
                 opponent_id = None
@@ -263,8 +251,7 @@ class MatchConsumer(AsyncWebsocketConsumer):
         try:
             data = json.loads(text_data)
             event_type = data.get('type')
-            print(
-                f"MatchConsumer: receive() from user {self.user.id if self.user else 'unknown'}, type={event_type}")
+            self.log.debug('receive() type=%s', event_type)
 
             if event_type == 'match:ready':
                 await self.handle_ready()
@@ -274,136 +261,107 @@ class MatchConsumer(AsyncWebsocketConsumer):
             elif event_type == 'match:join':
                 await self.handle_join()
         except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({'type': 'error', 'message': 'Invalid JSON'}))
+            await self.send_json({'type': 'error', 'message': 'Invalid JSON'})
 
     async def handle_ready(self):
         """Gracz gotowy"""
-        print(
-            f"MatchConsumer: handle_ready() called for user {self.user.id if self.user else 'unknown'}")
-        if not self.match or not self.user:
-            print(f"MatchConsumer: handle_ready() - no match or user, returning")
+        self.log.debug('handle_ready() called')
+        if not self.match or not self.user or not self.state:
+            self.log.debug('handle_ready() - no match or user, returning')
             return
 
-        # Użyj bezpośredniego wywołania
-        match = await database_sync_to_async(Match.objects.get)(id=self.match.id)
-        self.match = match
-        print(
-            f"MatchConsumer: handle_ready() - match {match.id} status={match.status}, player2_id={match.player2_id}")
+        # Aktualny stan meczu (bez odczytu z bazy)
+        self.state = await get_match_state().load(self.match.id)
+        state = self.state
+        self.log.debug('handle_ready() - status=%s, player2_id=%s', state.status, state.player2_id)
 
-        if match.status == 'waiting' and match.player2_id:
+        if state.status == 'waiting' and state.player2_id:
             # Generuj pytania i startuj mecz
-            print(
-                f"MatchConsumer: handle_ready() - match waiting with player2, starting match")
+            self.log.debug('handle_ready() - match waiting with player2, starting match')
             await self.start_match()
             return
 
-        if match.status == 'active':
-            print(
-                f"MatchConsumer: handle_ready() - match active, getting current question index={match.current_question_index}")
-            
+        if state.status == 'active':
+            index = state.current_question_index
+            self.log.debug('handle_ready() - match active, current question index=%s', index)
+
             # Sprawdź czy aktualny wynik pytania powinien być przetworzony
             # (edge case: gracze reconnect po odpowiedziach ale przed przetworzeniem wyniku)
-            match_question = await database_sync_to_async(
-                lambda: MatchQuestion.objects.select_related('question').filter(
-                    match=match,
-                    question_order=match.current_question_index
-                ).first()
-            )()
-            
-            if match_question:
-                if (match_question.player1_answer and match_question.player2_answer and 
-                    match_question.player1_correct is None and match_question.player2_correct is None):
+            if state.both_answered(index) and f'result:{index}' not in state.claims:
+                commit = await get_match_state().commit_answers(self.match.id, index, {})
+                if commit.claimed:
                     # Obaj odpowiedzieli ale wynik nie został przetworzony
-                    print(
-                        f"MatchConsumer: handle_ready() - found unprocessed result for question {match.current_question_index}, processing")
-                    await self.process_question_result(match_question)
+                    self.log.info('handle_ready() - found unprocessed result for question %s, processing', index)
+                    await self.process_question_result(commit.state, index)
                     return  # process_question_result wyśle następne pytanie lub zakończy mecz
-            
-            current_question = await self.get_next_question(match)
-            if current_question:
-                question_data = await self.get_question_data(current_question)
-                question_data['current_question_index'] = match.current_question_index
-                print(
-                    f"MatchConsumer: handle_ready() - sending match:question to user {self.user.id}")
-                await self.send(text_data=json.dumps({
+
+            question_data = state.question_data(index)
+            if question_data:
+                question_data['current_question_index'] = index
+                self.log.debug('handle_ready() - sending match:question')
+                await self.send_json({
                     'type': 'match:question',
                     'data': question_data,
-                }))
-                print(
-                    f"MatchConsumer: handle_ready() - match:question SENT to user {self.user.id}")
+                })
+                self.log.debug('handle_ready() - match:question sent')
             else:
-                print(
-                    f"MatchConsumer: handle_ready() - ERROR: no question found for index={match.current_question_index}")
+                self.log.error('handle_ready() - no question found for index=%s', index)
         else:
-            print(
-                f"MatchConsumer: handle_ready() - match status {match.status} not handled")
+            self.log.debug('handle_ready() - match status %s not handled', state.status)
 
     async def handle_answer(self, answer):
         """Obsługa odpowiedzi gracza"""
-        print(
-            f"MatchConsumer: handle_answer called for user {self.user.id} with answer {answer}")
-        if not self.match or not self.user or answer not in ['a', 'b', 'c', 'd']:
-            print(
-                f"MatchConsumer: handle_answer - invalid input: match={self.match}, user={self.user}, answer={answer}")
+        self.log.debug('handle_answer called with answer %s', answer)
+        if not self.match or not self.user or not self.state or answer not in ['a', 'b', 'c', 'd']:
+            self.log.debug('handle_answer - invalid input: answer=%s', answer)
+            return
+
+        player = self.state.player_number(self.user.id)
+        if player is None:
             return
 
+        # Zapisz odpowiedź - jedna atomowa operacja: zapis, sprawdzenie czy obaj
+        # odpowiedzieli, przejęcie wyniku i punkty (commit_answers)
+        index = self.state.current_question_index
+        self.log.debug('Saving answer for question %s', index)
+        commit = await get_match_state().commit_answers(self.match.id, index, {player: answer})
+        state = commit.state
+        if state is None:
+            self.log.warning('Failed to save answer')
+            return
+        self.state = state
+
         # Sprawdź czy mecz już się zakończył
-        self.match = await database_sync_to_async(Match.objects.get)(id=self.match.id)
-        if self.match.status == 'finished':
-            print(
-                f"MatchConsumer: handle_answer - match {self.match.id} already finished")
-            await self.send(text_data=json.dumps({
+        if state.status == 'finished':
+            self.log.debug('handle_answer - match already finished')
+            await self.send_json({
                 'type': 'match:already_ended',
                 'message': 'Ten mecz już się zakończył.',
-            }))
+            })
             return
 
-        if self.match.status != 'active':
-            print(
-                f"MatchConsumer: handle_answer - match {self.match.id} not active (status={self.match.status})")
+        if state.status != 'active':
+            self.log.debug('handle_answer - match not active (status=%s)', state.status)
             return
 
-        # Anuluj timeout dla tego pytania jeśli istnieje
-        if hasattr(self, '_question_timeout_task'):
-            self._question_timeout_task.cancel()
-
-        # Zapisz odpowiedź
-        print(
-            f"MatchConsumer: Saving answer for user {self.user.id}, match {self.match.id}, question {self.match.current_question_index}")
-        match_question = await self.save_answer(self.match, self.user, answer)
-
-        if not match_question:
-            print(
-                f"MatchConsumer: Failed to save answer for user {self.user.id}")
+        if not commit.recorded:
+            self.log.debug('handle_answer - answer for question %s already recorded or question changed, ignoring', index)
             return
 
-        print(
-            f"MatchConsumer: Answer saved successfully for user {self.user.id}")
-
-        # WAŻNE: Odśwież obiekt z bazy, aby mieć najnowsze dane (w tym odpowiedź przeciwnika)
-        # Używamy select_related('question') aby załadować relację question w jednym zapytaniu
-        match_question = await database_sync_to_async(
-            lambda: MatchQuestion.objects.select_related('question').get(
-                match=self.match,
-                question_order=self.match.current_question_index
-            )
-        )()
-
-        print(
-            f"MatchConsumer: Refreshed match_question - player1_answer={match_question.player1_answer}, player2_answer={match_question.player2_answer}")
+        self.log.debug('Answer saved')
 
         # Sprawdź czy obaj gracze odpowiedzieli
-        if match_question.player1_answer and match_question.player2_answer:
-            # Gracz który widzi że obaj odpowiedzieli przetwarza wynik
-            # Zabezpieczenie przed race condition jest w process_question_result (atomowy update)
-            print(
-                f"MatchConsumer: Both players answered for match {self.match.id}, question {match_question.question_order}")
-            print(f"MatchConsumer: User {self.user.id} will process result")
-            await self.process_question_result(match_question)
+        if commit.claimed:
+            # Wynik przejmuje consumer, którego odpowiedź była druga - rozstrzyga
+            # to commit_answers, więc nie ma wyścigu między graczami
+            self.log.debug('Both players answered question %s', index)
+            self.log.debug('Processing result')
+            await self.process_question_result(state, index)
+        elif state.both_answered(index):
+            self.log.debug('Question %s already processed by another player, skipping', index)
         else:
             # Powiadom przeciwnika, że odpowiedziałeś
-            print(
-                f"MatchConsumer: Player {self.user.id} answered, waiting for opponent. player1_answer={match_question.player1_answer}, player2_answer={match_question.player2_answer}")
+            self.log.debug('Answered, waiting for opponent. player1_answer=%s, player2_answer=%s', state.answer(index, 1), state.answer(index, 2))
             await self.channel_layer.group_send(
                 self.match_group_name,
                 {
@@ -411,10 +369,7 @@ class MatchConsumer(AsyncWebsocketConsumer):
                     'user_id': self.user.id,
                 }
             )
-            print(
-                f"MatchConsumer: Sent opponent_answered event to group {self.match_group_name}")
-            # Rozpocznij timeout dla przeciwnika (jeśli jeszcze nie odpowiedział)
-            await self.start_question_timeout()
+            self.log.debug('Sent opponent_answered event')
 
     async def handle_join(self):
         """Dołącz do kolejki matchmaking"""
@@ -426,275 +381,121 @@ class MatchConsumer(AsyncWebsocketConsumer):
         if not self.match or not self.match.player2_id:
             return
 
-        # Odśwież mecz z bazy, aby mieć najnowszy status
-        self.match = await database_sync_to_async(Match.objects.get)(id=self.match.id)
+        store = get_match_state()
+        self.state = await store.load(self.match.id)
 
         # Sprawdź czy mecz już nie jest aktywny (zabezpieczenie przed wielokrotnym startem)
-        if self.match.status == 'active':
-            print(
-                f"Mecz {self.match.id} już jest aktywny, wysyłam aktualne pytanie do gracza {self.user.id}")
+        if self.state.status == 'active':
+            self.log.debug('Match already active, sending current question')
             # Wyślij aktualne pytanie do tego gracza (np. gdy dołącza później)
-            current_question = await self.get_next_question(self.match)
-            if current_question:
-                question_data = await self.get_question_data(current_question)
+            question_data = self.state.question_data(self.state.current_question_index)
+            if question_data:
                 # Dodaj current_question_index do danych, aby frontend mógł zsynchronizować
-                question_data['current_question_index'] = self.match.current_question_index
-                await self.send(text_data=json.dumps({
+                question_data['current_question_index'] = self.state.current_question_index
+                await self.send_json({
                     'type': 'match:start',
                     'data': question_data,
-                }))
-                print(
-                    f"MatchConsumer: Sent current question (index={self.match.current_question_index}) to late-joining player {self.user.id}")
+                })
+                self.log.debug('Sent current question (index=%s) to late-joining player', self.state.current_question_index)
             else:
-                print(
-                    f"MatchConsumer: No current question found for match {self.match.id}")
+                self.log.error('No current question found')
             return
 
-        # Sprawdź czy pytania już istnieją
-        questions_exist = await database_sync_to_async(
-            MatchQuestion.objects.filter(match=self.match).exists
-        )()
-
-        if not questions_exist:
-            print(
-                f"MatchConsumer: Generating questions for match {self.match.id}")
-            # Generuj pytania
+        if not self.state.questions:
+            self.log.info('Generating questions')
+            # Generuj pytania (idempotentne - drugi gracz dostaje istniejące sloty)
             await self.generate_match_questions()
-            print(
-                f"MatchConsumer: Questions generated for match {self.match.id}")
+            questions = await database_sync_to_async(match_questions)(self.match.id)
+            await store.update(self.match.id, questions=questions)
+            self.state.questions = questions
+            self.log.info('Questions generated')
         else:
-            print(
-                f"MatchConsumer: Questions already exist for match {self.match.id}")
+            self.log.debug('Questions already exist')
 
-        # Odśwież mecz z bazy po generowaniu pytań
-        self.match = await database_sync_to_async(Match.objects.get)(id=self.match.id)
+        questions_count = self.state.question_count
+        self.log.debug('Match has %s questions', questions_count)
+        if not questions_count:
+            self.log.error('No first question found, questions_count=%s', questions_count)
+            return
 
-        # Start meczu - użyj update aby uniknąć race condition
+        # Start meczu - tylko jeden consumer wykonuje przejście (drugi dostaje match_start z grupy)
+        if not await store.claim(self.match.id, 'start'):
+            self.log.debug('Match already started by another consumer, skipping')
+            return
+
+        # Ustaw termin pierwszego pytania - rozsyłany do wszystkich consumerów
+        clock = match_clock.start_question(self.match.id, 0)
+        await store.update(self.match.id, status='active', current_question_index=0,
+                           deadline=clock.deadline)
+        self.state.status, self.state.current_question_index = 'active', 0
+
+        # Zapis przejścia do bazy
         from django.utils import timezone
-        updated = await database_sync_to_async(Match.objects.filter(
-            id=self.match.id,
-            status__in=['waiting', 'ready']
-        ).update)(
+        await database_sync_to_async(Match.objects.filter(id=self.match.id).update)(
             status='active',
-            started_at=timezone.now()
+            started_at=timezone.now(),
+            current_question_index=0,
         )
-
-        if updated == 0:
-            print(
-                f"MatchConsumer: Match {self.match.id} already active, skipping status update")
-        else:
-            print(
-                f"MatchConsumer: Match {self.match.id} status updated to active")
-
-        # Odśwież obiekt meczu
-        self.match = await database_sync_to_async(Match.objects.get)(id=self.match.id)
-
-        # Upewnij się, że current_question_index jest 0 na początku
-        if self.match.current_question_index != 0:
-            print(
-                f"MatchConsumer: Resetting current_question_index from {self.match.current_question_index} to 0")
-            await database_sync_to_async(Match.objects.filter(id=self.match.id).update)(
-                current_question_index=0
-            )
-            self.match = await database_sync_to_async(Match.objects.get)(id=self.match.id)
-
-        # Sprawdź ile pytań zostało utworzonych
-        questions_count = await self.get_match_questions_count(self.match)
-        print(
-            f"MatchConsumer: Match {self.match.id} has {questions_count} questions, current_question_index={self.match.current_question_index}")
+        self.log.info('Match status updated to active')
 
         # Wyślij pierwsze pytanie
-        first_question = await self.get_next_question(self.match)
-        if first_question:
-            print(
-                f"MatchConsumer: Sending first question for match {self.match.id}")
-            question_data = await self.get_question_data(first_question)
-            # Dodaj current_question_index do danych (pierwsze pytanie = 0)
-            question_data['current_question_index'] = 0
-
-            # Ustaw czas rozpoczęcia pierwszego pytania
-            from django.utils import timezone
-            self.question_start_time[0] = timezone.now()
+        self.log.debug('Sending first question')
+        question_data = self.state.question_data(0)
+        # Dodaj current_question_index do danych (pierwsze pytanie = 0)
+        question_data['current_question_index'] = 0
 
-            await self.channel_layer.group_send(
-                self.match_group_name,
-                {
-                    'type': 'match_start',
-                    'data': question_data,
-                }
-            )
-            print(
-                f"MatchConsumer: First question sent to group {self.match_group_name}")
-            # Rozpocznij timeout dla pierwszego pytania
-            await self.start_question_timeout()
-        else:
-            print(
-                f"MatchConsumer: ERROR - No first question found for match {self.match.id}, current_question_index={self.match.current_question_index}, questions_count={questions_count}")
+        await self.channel_layer.group_send(
+            self.match_group_name,
+            {
+                'type': 'match_start',
+                'data': question_data,
+                'deadline': clock.deadline,
+            }
+        )
+        self.log.debug('First question sent')
+        # Termin pierwszego pytania
+        schedule_question(self.match.id, 0, clock.deadline)
 
     async def generate_match_questions(self):
         """Generuj pytania dla meczu"""
-        # Sprawdź czy pytania już istnieją (zabezpieczenie przed duplikatami)
-        existing_questions = await database_sync_to_async(
-            MatchQuestion.objects.filter(match=self.match).count
-        )()
-
-        if existing_questions > 0:
-            print(
-                f"Pytania dla meczu {self.match.id} już istnieją ({existing_questions} pytań), pomijam generowanie")
-            return
-
-        from ai.agent.question_generator import BookQuestionGenerator
-
-        def _generate_questions():
-            generator = BookQuestionGenerator()
-            return generator.generate_questions_simple(
-                title=self.match.book.title,
-                author=self.match.book.author,
-                isbn=self.match.book.isbn,
-                subject=self.match.book.subject.name,
-                toc_pdf_url=self.match.book.toc_pdf_url
-            )
-
         try:
-            print(
-                f"MatchConsumer: Starting question generation for match {self.match.id}")
-            # Uruchom generowanie w osobnym wątku (to może zająć trochę czasu)
-            result = await asyncio.to_thread(_generate_questions)
-            print(
-                f"MatchConsumer: Generated {len(result.questions)} questions from AI")
-
-            # Zapisz pytania do bazy
-            questions = []
-            for q_data in result.questions[:10]:  # Maksymalnie 10 pytań
-                question = await database_sync_to_async(Question.objects.create)(
-                    book=self.match.book,
-                    question_text=q_data.question,
-                    option_a=q_data.option_a,
-                    option_b=q_data.option_b,
-                    option_c=q_data.option_c,
-                    option_d=q_data.option_d,
-                    correct_answer=q_data.correct_answer.lower(),
-                )
-                questions.append(question)
-            print(
-                f"MatchConsumer: Created {len(questions)} Question objects in database")
-
-            # Utwórz MatchQuestion dla każdego pytania - użyj get_or_create aby uniknąć duplikatów
-            created_count = 0
-            for idx, question in enumerate(questions):
-                # Sprawdź czy już istnieje przed utworzeniem
-                exists = await database_sync_to_async(
-                    MatchQuestion.objects.filter(
-                        match=self.match,
-                        question_order=idx
-                    ).exists
-                )()
-
-                if not exists:
-                    await database_sync_to_async(MatchQuestion.objects.create)(
-                        match=self.match,
-                        question=question,
-                        question_order=idx,
-                    )
-                    created_count += 1
-                else:
-                    print(
-                        f"MatchConsumer: MatchQuestion for match {self.match.id}, order {idx} already exists, skipping")
-
-            print(
-                f"MatchConsumer: Created {created_count} MatchQuestion objects for match {self.match.id}")
-        except Exception as e:
-            print(f"Błąd podczas generowania pytań: {e}")
-            import traceback
-            traceback.print_exc()
+            self.log.debug('Seeding questions')
+            # Pytania z banku książki (LLM tylko gdy bank jest za mały);
+            # sloty zapisywane jednym bulk_create w transakcji, istniejące
+            # sloty (drugi gracz był pierwszy) nie są nadpisywane
+            slots = await aseed_match_questions(self.match)
+            self.log.info('Match has %s questions', slots)
+        except Exception:
+            self.log.exception('Błąd podczas generowania pytań')
             # W przypadku błędu, użyj istniejących pytań jeśli są
             pass
 
-    async def process_question_result(self, match_question):
-        """Przetwarzanie wyniku pytania po odpowiedzi obu graczy"""
-        print(
-            f"MatchConsumer: process_question_result called by user {self.user.id} for match {self.match.id}, question_order={match_question.question_order}")
-
-        # Odśwież obiekt z bazy, aby mieć najnowsze dane
-        match_question = await database_sync_to_async(
-            lambda: MatchQuestion.objects.select_related('question').get(
-                match=self.match,
-                question_order=self.match.current_question_index
-            )
-        )()
-
-        # Sprawdź czy obaj gracze odpowiedzieli
-        if not match_question.player1_answer or not match_question.player2_answer:
-            print(
-                f"MatchConsumer: Not both players answered yet. player1_answer={match_question.player1_answer}, player2_answer={match_question.player2_answer}")
-            return
-
-        # Oblicz poprawność odpowiedzi
-        correct_answer = match_question.question.correct_answer
-        player1_correct = match_question.player1_answer == correct_answer
-        player2_correct = match_question.player2_answer == correct_answer
-
-        # ATOMOWE ZABEZPIECZENIE przed race condition:
-        # Użyj update() z warunkiem - tylko jeden gracz może zaktualizować
-        # Jeśli updated == 0, to znaczy że inny gracz już zaktualizował
-        updated = await database_sync_to_async(
-            lambda: MatchQuestion.objects.filter(
-                id=match_question.id,
-                player1_correct__isnull=True,
-                player2_correct__isnull=True
-            ).update(
-                player1_correct=player1_correct,
-                player2_correct=player2_correct
-            )
-        )()
-
-        if updated == 0:
-            print(
-                f"MatchConsumer: Question {match_question.question_order} already processed by another player, skipping")
-            return
-
-        print(f"MatchConsumer: User {self.user.id} successfully claimed processing for question {match_question.question_order}")
-
-        # Anuluj timeout dla tego pytania
-        if hasattr(self, '_question_timeout_task'):
-            self._question_timeout_task.cancel()
+    async def process_question_result(self, state, index):
+        """
+        Przetwarzanie wyniku pytania po odpowiedzi obu graczy.
 
-        # Odśwież match_question po update
-        match_question = await database_sync_to_async(
-            lambda: MatchQuestion.objects.select_related('question').get(id=match_question.id)
-        )()
+        Wywoływane tylko przez consumer, który przejął wynik w commit_answers
+        (punkty są już naliczone w stanie meczu).
+        """
+        self.log.debug('process_question_result for question %s', index)
 
-        # Zaktualizuj wyniki meczu atomowo
-        from django.db.models import F
-        score_updates = {}
-        if player1_correct:
-            score_updates['player1_score'] = F('player1_score') + 1
-        if player2_correct:
-            score_updates['player2_score'] = F('player2_score') + 1
+        # Anuluj termin tego pytania
+        cancel_question(self.match.id)
 
-        if score_updates:
-            await database_sync_to_async(
-                lambda: Match.objects.filter(id=self.match.id).update(**score_updates)
-            )()
+        self.state = state
+        player1_correct = state.is_correct(index, 1)
+        player2_correct = state.is_correct(index, 2)
+        self.log.info('Question %s scores - player1=%s, player2=%s', index, state.player1_score, state.player2_score)
 
-        # Odśwież self.match z bazy
-        self.match = await database_sync_to_async(Match.objects.get)(id=self.match.id)
-        print(
-            f"MatchConsumer: Scores updated - player1={self.match.player1_score}, player2={self.match.player2_score}")
+        # Zapis przejścia do bazy (odpowiedzi, poprawność, wyniki)
+        await database_sync_to_async(persist_result)(state, index)
 
         # Wyślij wyniki z POPRAWNĄ ODPOWIEDZIĄ (dopiero teraz!)
         # WAŻNE: Wysyłamy SUROWE dane bez personalizacji - każdy consumer personalizuje je dla swojego użytkownika
-        serializer = MatchQuestionWithAnswerSerializer(match_question)
-        raw_result_data = serializer.data
-        raw_result_data['player1_answer'] = match_question.player1_answer
-        raw_result_data['player2_answer'] = match_question.player2_answer
-        raw_result_data['player1_correct'] = match_question.player1_correct
-        raw_result_data['player2_correct'] = match_question.player2_correct
-
-        print(
-            f"MatchConsumer: Sending match_result to group {self.match_group_name} for question {match_question.question_order}")
-        print(
-            f"MatchConsumer: Result data - player1_correct={match_question.player1_correct}, player2_correct={match_question.player2_correct}")
+        raw_result_data = state.result_data(index)
+
+        self.log.debug('Sending match_result for question %s', index)
+        self.log.debug('Result data - player1_correct=%s, player2_correct=%s', player1_correct, player2_correct)
 
         # Wyślij wynik do grupy (wszystkich graczy) - każdy consumer personalizuje dane
         await self.channel_layer.group_send(
@@ -704,103 +505,112 @@ class MatchConsumer(AsyncWebsocketConsumer):
                 'raw_data': raw_result_data,
             }
         )
-        print(
-            f"MatchConsumer: match_result sent to group {self.match_group_name}")
-
-        # WAŻNE: Uruchom opóźnione przejście do następnego pytania w osobnym task'u
-        # Nie używaj await asyncio.sleep() tutaj - to blokowałoby consumera gracza który przetwarza wynik,
-        # uniemożliwiając mu otrzymanie własnego match_result przed upływem 3 sekund!
-        async def delayed_advance():
-            await asyncio.sleep(3.0)
-            await self.advance_match()
-        
-        asyncio.create_task(delayed_advance())
+        self.log.debug('match_result sent')
+
+        # Opóźnione przejście do następnego pytania - termin w harmonogramie
+        # (event question_advance do grupy), nie sleep w tym consumerze
+        get_scheduler().schedule_in(
+            ('advance', self.match.id), RESULT_DISPLAY_TIME, question_advance_due, self.match.id, index)
 
-    async def advance_match(self):
+    async def advance_match(self, index):
         """Przejście do następnego pytania lub zakończenie meczu"""
-        questions_count = await self.get_match_questions_count(self.match)
-        print(
-            f"MatchConsumer: advance_match called for match {self.match.id}, current_index={self.match.current_question_index}, total={questions_count}")
+        store = get_match_state()
+        questions_count = self.state.question_count
+        self.log.debug('advance_match current_index=%s, total=%s', index, questions_count)
 
-        if self.match.current_question_index >= questions_count - 1:
+        if index >= questions_count - 1:
             # Zakończ mecz
-            print(
-                f"MatchConsumer: Match {self.match.id} finished, ending match")
+            self.log.debug('Last question answered, ending match')
             await self.end_match()
+            return
+
+        if not await store.claim(self.match.id, f'advance:{index}'):
+            return
+
+        # Następne pytanie
+        next_index = index + 1
+        # Ustaw termin nowego pytania - rozsyłany do wszystkich consumerów
+        clock = match_clock.start_question(self.match.id, next_index)
+        await store.update(self.match.id, current_question_index=next_index, deadline=clock.deadline)
+        self.state.current_question_index = next_index
+        await database_sync_to_async(Match.objects.filter(id=self.match.id).update)(
+            current_question_index=next_index
+        )
+        self.log.info('Moving to next question, new index=%s', next_index)
+
+        question_data = self.state.question_data(next_index)
+        self.log.debug('Sending next question')
+        await self.channel_layer.group_send(
+            self.match_group_name,
+            {
+                'type': 'match_question',
+                'data': {
+                    **question_data,
+                    'current_question_index': next_index,
+                },
+                'deadline': clock.deadline,
+            }
+        )
+        # Termin następnego pytania
+        schedule_question(self.match.id, next_index, clock.deadline)
+
+    async def finish_match(self, winner_id, player1_bonus=0, player2_bonus=0):
+        """
+        Przejście do 'finished' - stan meczu i jeden zapis do bazy.
+
+        Zwraca False, gdy mecz zakończył już inny consumer.
+        """
+        store = get_match_state()
+        if not await store.claim(self.match.id, 'end'):
+            return False
+        if player1_bonus or player2_bonus:
+            self.state = await store.add_scores(self.match.id, player1_bonus, player2_bonus)
         else:
-            # Następne pytanie
-            self.match.current_question_index += 1
-            await database_sync_to_async(self.match.save)()
-            print(
-                f"MatchConsumer: Moving to next question, new index={self.match.current_question_index}")
-
-            next_question = await self.get_next_question(self.match)
-            if next_question:
-                question_data = await self.get_question_data(next_question)
-                print(
-                    f"MatchConsumer: Sending next question to group {self.match_group_name}")
-
-                # Ustaw czas rozpoczęcia nowego pytania
-                from django.utils import timezone
-                self.question_start_time[self.match.current_question_index] = timezone.now(
-                )
-
-                await self.channel_layer.group_send(
-                    self.match_group_name,
-                    {
-                        'type': 'match_question',
-                        'data': {
-                            **question_data,
-                            'current_question_index': self.match.current_question_index,
-                        },
-                    }
-                )
-                # Rozpocznij timeout dla następnego pytania
-                await self.start_question_timeout()
-            else:
-                print(
-                    f"MatchConsumer: ERROR - No next question found for match {self.match.id}, index={self.match.current_question_index}")
+            self.state = await store.get(self.match.id)
+        await store.update(self.match.id, status='finished')
+        self.state.status = 'finished'
+
+        from django.utils import timezone
+        self.match.status = 'finished'
+        self.match.winner_id = winner_id
+        self.match.player1_score = self.state.player1_score
+        self.match.player2_score = self.state.player2_score
+        await database_sync_to_async(Match.objects.filter(id=self.match.id).update)(
+            status='finished',
+            finished_at=timezone.now(),
+            winner_id=winner_id,
+            player1_score=self.state.player1_score,
+            player2_score=self.state.player2_score,
+        )
+        return True
 
     async def end_match(self):
         """Zakończenie meczu"""
-        self.match.status = 'finished'
-        from django.utils import timezone
-        self.match.finished_at = timezone.now()
-
-        # Określ zwycięzcę - użyj player1_id i player2_id zamiast bezpośredniego dostępu do obiektów
-        print(
-            f"MatchConsumer: end_match - Determining winner for match {self.match.id}")
-        print(
-            f"MatchConsumer: Scores - player1={self.match.player1_score}, player2={self.match.player2_score}")
-        if self.match.player1_score > self.match.player2_score:
-            self.match.winner_id = self.match.player1_id
-            print(
-                f"MatchConsumer: Player1 wins (score {self.match.player1_score} vs {self.match.player2_score})")
-        elif self.match.player2_score > self.match.player1_score:
-            self.match.winner_id = self.match.player2_id
-            print(
-                f"MatchConsumer: Player2 wins (score {self.match.player2_score} vs {self.match.player1_score})")
-        else:
+        state = await get_match_state().get(self.match.id)
+
+        # Określ zwycięzcę na podstawie wyników ze stanu meczu
+        self.log.debug('end_match - determining winner')
+        self.log.debug('Scores - player1=%s, player2=%s', state.player1_score, state.player2_score)
+        winner_id = state.winner_id()
+        if winner_id is None:
             # Remis - winner pozostaje None
-            self.match.winner_id = None
-            print(
-                f"MatchConsumer: Draw (score {self.match.player1_score} vs {self.match.player2_score})")
+            self.log.debug('Draw (score %s vs %s)', state.player1_score, state.player2_score)
+        else:
+            self.log.debug('Player %s wins (score %s vs %s)', winner_id, state.player1_score, state.player2_score)
 
-        await database_sync_to_async(self.match.save)()
-        # Odśwież mecz z bazy, aby mieć pewność że winner_id jest zapisany
-        self.match = await database_sync_to_async(Match.objects.get)(id=self.match.id)
-        print(f"MatchConsumer: After save - winner_id={self.match.winner_id}")
+        if not await self.finish_match(winner_id):
+            self.log.debug('Match already finished, skipping')
+            return
+        self.log.info('Match finished, winner_id=%s', self.match.winner_id)
 
         # Zaktualizuj rankingi
         await self.update_rankings()
 
         # Wyślij końcowe wyniki
-        final_data = await self.get_final_match_data(self.match)
+        final_data = self.get_final_match_data(self.state)
 
-        print(
-            f"MatchConsumer: Sending match:end to group {self.match_group_name} for match {self.match.id}")
-        print(
-            f"MatchConsumer: Final data - player1_score={self.match.player1_score}, player2_score={self.match.player2_score}, winner_id={self.match.winner_id}")
+        self.log.debug('Sending match:end')
+        self.log.debug('Final data - player1_score=%s, player2_score=%s, winner_id=%s', final_data['player1_score'], final_data['player2_score'], final_data['winner_id'])
 
         await self.channel_layer.group_send(
             self.match_group_name,
@@ -809,8 +619,7 @@ class MatchConsumer(AsyncWebsocketConsumer):
                 'data': final_data,
             }
         )
-        print(
-            f"MatchConsumer: match:end sent to group {self.match_group_name}")
+        self.log.debug('match:end sent')
 
     async def update_rankings(self):
         """Aktualizacja rankingów po zakończeniu meczu"""
@@ -831,44 +640,51 @@ class MatchConsumer(AsyncWebsocketConsumer):
             subject = await self.get_subject(self.match.subject_id)
             if subject:
                 # Zaktualizuj rankingi dla zwycięzcy i przegranego
-                await self.update_user_ranking(winner, subject, True)
-                await self.update_user_ranking(loser, subject, False)
+                for player, won in ((winner, True), (loser, False)):
+                    if await self.update_user_ranking(player, subject, won):
+                        # Pierwszy mecz z przedmiotu - powiadomienia o jego meczach (NotificationConsumer)
+                        await self.channel_layer.group_send(
+                            f'user_{player.id}',
+                            {'type': 'subject_ranked', 'subject_id': subject.id}
+                        )
 
     # WebSocket event handlers (wysyłane do klientów)
 
     async def match_joined(self, event):
         """Gracz dołączył do meczu"""
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'match:joined',
             'user_id': event['user_id'],
             'username': event['username'],
-        }))
+        })
 
     async def player_ready(self, event):
         """Gracz gotowy"""
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'match:player_ready',
             'user_id': event['user_id'],
-        }))
+        })
 
     async def opponent_answered(self, event):
         """Przeciwnik odpowiedział"""
         # Wysyłaj do wszystkich graczy w grupie (każdy powinien widzieć, że przeciwnik odpowiedział)
         # Sprawdź tylko, czy to nie jest nasza własna odpowiedź
         if event['user_id'] != self.user.id:
-            print(
-                f"MatchConsumer: Sending opponent_answered to user {self.user.id} (opponent {event['user_id']} answered)")
-            await self.send(text_data=json.dumps({
+            self.log.debug('Sending opponent_answered (opponent %s answered)', event['user_id'])
+            await self.send_json({
                 'type': 'match:opponent_answered',
-            }))
+            })
         else:
-            print(
-                f"MatchConsumer: Ignoring opponent_answered event - it's our own answer (user {self.user.id})")
+            self.log.debug('Ignoring opponent_answered event - own answer')
 
     async def match_result(self, event):
         """Wynik pytania (z poprawną odpowiedzią!) - personalizowany dla każdego gracza"""
         raw_data = event.get('raw_data', event.get('data', {}))
-        
+
+        # Pytanie zakończone - zatrzymaj zegar (ticki timer sync zakończą się same)
+        if self.match and raw_data.get('question_order') is not None:
+            match_clock.stop_question(self.match.id, raw_data['question_order'])
+
         # Personalizuj dane dla tego użytkownika
         personalized_data = dict(raw_data)
         if self.user.id == self.match.player1_id:
@@ -882,119 +698,75 @@ class MatchConsumer(AsyncWebsocketConsumer):
             personalized_data['opponent_answer'] = raw_data.get('player1_answer')
             personalized_data['opponent_correct'] = raw_data.get('player1_correct')
         
-        print(f"MatchConsumer: match_result handler for user {self.user.id} - your_correct={personalized_data.get('your_correct')}")
+        self.log.debug('match_result handler - your_correct=%s', personalized_data.get('your_correct'))
         
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'match:result',
             'data': personalized_data,
-        }))
+        })
 
     async def match_question(self, event):
         """Nowe pytanie (BEZ poprawnej odpowiedzi!)"""
-        print(
-            f"MatchConsumer: match_question handler called for user {self.user.id}")
-        # Odśwież mecz z bazy, aby mieć aktualny current_question_index
-        if hasattr(self, 'match') and self.match:
-            self.match = await database_sync_to_async(
-                lambda: Match.objects.select_related(
-                    'player1', 'player2', 'book', 'subject').get(id=self.match.id)
-            )()
-            # Upewnij się, że current_question_index jest w danych
-            question_data = event.get('data', {})
-            if isinstance(question_data, dict):
-                question_data['current_question_index'] = self.match.current_question_index
-            await self.send(text_data=json.dumps({
-                'type': 'match:question',
-                'data': question_data,
-            }))
-        else:
-            await self.send(text_data=json.dumps({
-                'type': 'match:question',
-                'data': event.get('data', {}),
-            }))
+        self.log.debug('match_question handler called')
+        # Indeks i termin pytania przychodzą w evencie - bez odczytu meczu z bazy
+        question_data = event.get('data', {})
+        if self.state and isinstance(question_data, dict) and 'current_question_index' in question_data:
+            self.state.current_question_index = question_data['current_question_index']
+            self.state.deadline = event.get('deadline')
+        await self.send_json({
+            'type': 'match:question',
+            'data': question_data,
+        })
         # Rozpocznij timeout dla nowego pytania (tylko dla tego gracza)
-        if hasattr(self, 'match') and self.match and self.match.status == 'active':
-            print(
-                f"MatchConsumer: match_question - User {self.user.id}, match.player1_id={self.match.player1_id}, is_player1={self.match.player1_id == self.user.id}")
-            # Ustaw czas rozpoczęcia nowego pytania
-            from django.utils import timezone
-            question_index = self.match.current_question_index
-            self.question_start_time[question_index] = timezone.now()
-            print(
-                f"MatchConsumer: User {self.user.id} - Set question_start_time[{question_index}] = {self.question_start_time[question_index]}")
-            await self.start_question_timeout()
-            # Uruchom timer sync loop dla nowego pytania
-            # WAŻNE: Timer sync loop powinien być uruchamiany TYLKO przez player1
-            if self.match.player1_id == self.user.id:
-                if self._timer_task:
-                    try:
-                        self._timer_task.cancel()
-                        print(
-                            f"MatchConsumer: User {self.user.id} - Cancelled previous timer task")
-                    except:
-                        pass
-                self._timer_task = asyncio.create_task(self.timer_sync_loop())
-                print(
-                    f"MatchConsumer: User {self.user.id} (player1) - Started timer sync loop for question {question_index}")
-            else:
-                print(
-                    f"MatchConsumer: User {self.user.id} (player2) - NOT starting timer sync loop (only player1 should)")
+        if self.state and self.state.status == 'active':
+            self.log.debug('match_question - is_player1=%s', self.match.player1_id == self.user.id)
+            # Ustaw termin nowego pytania (deadline z eventu, jeśli jest)
+            question_index = self.state.current_question_index
+            clock = match_clock.start_question(
+                self.match.id, question_index, deadline=event.get('deadline'))
+            self.log.debug('Question %s deadline=%s', question_index, clock.deadline)
 
     async def match_end(self, event):
         """Koniec meczu"""
-        print(
-            f"MatchConsumer: match_end handler called for user {self.user.id}, match {self.match.id if hasattr(self, 'match') and self.match else 'unknown'}")
-        await self.send(text_data=json.dumps({
+        if hasattr(self, 'match') and self.match:
+            match_clock.clear(self.match.id)
+            cancel_question(self.match.id)
+            get_scheduler().cancel(('advance', self.match.id))
+        if self.state:
+            self.state.status = 'finished'
+        self.log.debug('match_end handler called')
+        await self.send_json({
             'type': 'match:end',
             'data': event['data'],
-        }))
-        print(f"MatchConsumer: match:end sent to user {self.user.id}")
+        })
+        self.log.debug('match:end sent')
 
     async def match_found(self, event):
         """Znaleziono przeciwnika"""
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'match:found',
             'player1_id': event['player1_id'],
             'player2_id': event['player2_id'],
-        }))
+        })
 
     async def match_start(self, event):
         """Start meczu z pierwszym pytaniem"""
-        print(
-            f"MatchConsumer: match_start handler called for user {self.user.id}")
-        await self.send(text_data=json.dumps({
+        self.log.debug('match_start handler called')
+        await self.send_json({
             'type': 'match:start',
             'data': event['data'],
-        }))
+        })
         # Rozpocznij timeout dla pierwszego pytania (tylko dla tego gracza)
-        if hasattr(self, 'match') and self.match and self.match.status == 'active':
-            # Odśwież mecz z bazy, aby mieć aktualny current_question_index
-            self.match = await database_sync_to_async(Match.objects.get)(id=self.match.id)
-            print(
-                f"MatchConsumer: match_start - User {self.user.id}, match.player1_id={self.match.player1_id}, is_player1={self.match.player1_id == self.user.id}")
-            # Ustaw czas rozpoczęcia pierwszego pytania
-            from django.utils import timezone
-            self.question_start_time[0] = timezone.now()
-            print(
-                f"MatchConsumer: User {self.user.id} - Set question_start_time[0] = {self.question_start_time[0]}")
-            await self.start_question_timeout()
-            # Uruchom timer sync loop dla pierwszego pytania
-            # WAŻNE: Timer sync loop powinien być uruchamiany TYLKO przez player1
-            if self.match.player1_id == self.user.id:
-                if self._timer_task:
-                    try:
-                        self._timer_task.cancel()
-                        print(
-                            f"MatchConsumer: User {self.user.id} - Cancelled previous timer task")
-                    except:
-                        pass
-                self._timer_loop_started = True
-                self._timer_task = asyncio.create_task(self.timer_sync_loop())
-                print(
-                    f"MatchConsumer: User {self.user.id} (player1) - Started timer sync loop for question 0")
-            else:
-                print(
-                    f"MatchConsumer: User {self.user.id} (player2) - NOT starting timer sync loop (only player1 should)")
+        if self.match and self.state:
+            # Event oznacza przejście do 'active' - bez odczytu meczu z bazy
+            self.state.status = 'active'
+            self.state.current_question_index = 0
+            self.state.deadline = event.get('deadline')
+            self.log.debug('match_start - is_player1=%s', self.match.player1_id == self.user.id)
+            # Ustaw termin pierwszego pytania (deadline z eventu, jeśli jest)
+            clock = match_clock.start_question(
+                self.match.id, 0, deadline=event.get('deadline'))
+            self.log.debug('Question 0 deadline=%s', clock.deadline)
 
     # Helper methods
 
@@ -1023,114 +795,38 @@ class MatchConsumer(AsyncWebsocketConsumer):
         except Match.DoesNotExist:
             return None
 
-    @database_sync_to_async
-    def save_answer(self, match, user, answer):
-        """Zapisz odpowiedź gracza"""
-        try:
-            # Używamy select_related('question') aby załadować relację question w jednym zapytaniu
-            match_question = MatchQuestion.objects.select_related('question').get(
-                match=match,
-                question_order=match.current_question_index
-            )
-
-            if user.id == match.player1_id:
-                match_question.player1_answer = answer
-            elif user.id == match.player2_id:
-                match_question.player2_answer = answer
-
-            from django.utils import timezone
-            match_question.answered_at = timezone.now()
-            match_question.save()
-
-            return match_question
-        except MatchQuestion.DoesNotExist:
-            return None
-
-    @database_sync_to_async
-    def get_match_questions_count(self, match):
-        """Pobierz liczbę pytań w meczu"""
-        return MatchQuestion.objects.filter(match=match).count()
-
-    @database_sync_to_async
-    def get_next_question(self, match):
-        """Pobierz następne pytanie"""
-        try:
-            # Używamy select_related('question') aby załadować relację question w jednym zapytaniu
-            match_question = MatchQuestion.objects.select_related('question').get(
-                match=match,
-                question_order=match.current_question_index
-            )
-            return match_question.question
-        except MatchQuestion.DoesNotExist:
-            return None
-
-    async def get_question_data(self, question):
-        """Pobierz dane pytania (BEZ poprawnej odpowiedzi!)"""
-        serializer = QuestionSerializer(question)
-        return serializer.data
-
-    async def get_result_data(self, match_question):
-        """Pobierz dane wyniku (Z poprawną odpowiedzią!)"""
-        serializer = MatchQuestionWithAnswerSerializer(match_question)
-        data = serializer.data
-
-        # Dodaj informacje o tym, który gracz to jesteś
-        if self.user.id == self.match.player1_id:
-            data['your_answer'] = match_question.player1_answer
-            data['your_correct'] = match_question.player1_correct
-            data['opponent_answer'] = match_question.player2_answer
-            data['opponent_correct'] = match_question.player2_correct
-        else:
-            data['your_answer'] = match_question.player2_answer
-            data['your_correct'] = match_question.player2_correct
-            data['opponent_answer'] = match_question.player1_answer
-            data['opponent_correct'] = match_question.player1_correct
-
-        return data
-
-    async def get_final_match_data(self, match):
-        """Pobierz końcowe dane meczu"""
-        match_questions = await database_sync_to_async(list)(
-            MatchQuestion.objects.filter(
-                match=match).select_related('question')
-        )
-
+    def get_final_match_data(self, state):
+        """Końcowe dane meczu ze stanu meczu"""
         results = []
-        for mq in match_questions:
-            # Użyj database_sync_to_async do serializacji, aby uniknąć SynchronousOnlyOperation
-            def serialize_match_question():
-                serializer = MatchQuestionWithAnswerSerializer(mq)
-                return serializer.data
-
-            data = await database_sync_to_async(serialize_match_question)()
-
-            if self.user.id == match.player1_id:
-                data['your_answer'] = mq.player1_answer
-                data['your_correct'] = mq.player1_correct
-                data['opponent_answer'] = mq.player2_answer
-                data['opponent_correct'] = mq.player2_correct
+        for index in range(state.question_count):
+            data = state.result_data(index)
+
+            if self.user.id == self.match.player1_id:
+                data['your_answer'] = data['player1_answer']
+                data['your_correct'] = data['player1_correct']
+                data['opponent_answer'] = data['player2_answer']
+                data['opponent_correct'] = data['player2_correct']
             else:
-                data['your_answer'] = mq.player2_answer
-                data['your_correct'] = mq.player2_correct
-                data['opponent_answer'] = mq.player1_answer
-                data['opponent_correct'] = mq.player1_correct
+                data['your_answer'] = data['player2_answer']
+                data['your_correct'] = data['player2_correct']
+                data['opponent_answer'] = data['player1_answer']
+                data['opponent_correct'] = data['player1_correct']
 
             results.append(data)
 
         final_data = {
-            'match_id': match.id,
-            'player1_score': match.player1_score,
-            'player2_score': match.player2_score,
-            'winner_id': match.winner_id if match.winner_id else None,
+            'match_id': state.match_id,
+            'player1_score': state.player1_score,
+            'player2_score': state.player2_score,
+            'winner_id': self.match.winner_id,
             'questions': results,
         }
-        print(
-            f"MatchConsumer: get_final_match_data for user {self.user.id}, match {match.id}: player1_score={final_data['player1_score']}, player2_score={final_data['player2_score']}, winner_id={final_data['winner_id']}")
+        self.log.debug('get_final_match_data: player1_score=%s, player2_score=%s, winner_id=%s', final_data['player1_score'], final_data['player2_score'], final_data['winner_id'])
         return final_data
 
     @database_sync_to_async
     def update_user_ranking(self, user, subject, won):
-        """Aktualizuj ranking użytkownika"""
+        """Aktualizuj ranking użytkownika; True, jeśli ranking w przedmiocie został utworzony"""
         ranking, created = UserRanking.objects.get_or_create(
             user=user,
             subject=subject,
@@ -1143,216 +839,104 @@ class MatchConsumer(AsyncWebsocketConsumer):
         else:
             ranking.losses += 1
 
+        # Leaderboard odświeża sygnał post_save UserRanking (quiz.signals)
         ranking.save()
-
-    async def timer_sync_loop(self):
-        """Pętla synchronizacji timera - wysyła aktualny czas co sekundę"""
-        print(f"MatchConsumer: User {self.user.id} - timer_sync_loop started")
-        while True:
-            try:
-                if not self.match or self.match.status != 'active':
-                    print(
-                        f"MatchConsumer: User {self.user.id} - timer_sync_loop: match not active, breaking")
-                    break
-
-                # Odśwież mecz z bazy, aby mieć aktualny current_question_index
-                self.match = await database_sync_to_async(Match.objects.get)(id=self.match.id)
-                question_index = self.match.current_question_index
-
-                # Pobierz aktualne pytanie
-                # Używamy select_related('question') aby załadować relację question w jednym zapytaniu
-                match_question = await database_sync_to_async(
-                    lambda: MatchQuestion.objects.select_related('question').filter(
-                        match=self.match,
-                        question_order=question_index
-                    ).first()
-                )()
-
-                if not match_question:
-                    print(
-                        f"MatchConsumer: User {self.user.id} - timer_sync_loop: no match_question found, breaking")
-                    break
-
-                # Sprawdź czy obaj gracze odpowiedzieli
-                if match_question.player1_answer and match_question.player2_answer:
-                    # Sprawdź czy wynik został już przetworzony
-                    if match_question.player1_correct is None or match_question.player2_correct is None:
-                        # Wynik nie został przetworzony - przetwórz go teraz
-                        print(
-                            f"MatchConsumer: User {self.user.id} - timer_sync_loop: both players answered but result not processed, processing now")
-                        await self.process_question_result(match_question)
-                    else:
-                        print(
-                            f"MatchConsumer: User {self.user.id} - timer_sync_loop: both players answered and result processed, breaking")
-                    break
-
-                # Oblicz pozostały czas
-                from django.utils import timezone
-                current_time = timezone.now()
-
-                # Pobierz czas rozpoczęcia pytania
-                if question_index not in self.question_start_time:
-                    # Jeśli nie ma czasu rozpoczęcia, ustaw go teraz
-                    self.question_start_time[question_index] = current_time
-                    print(
-                        f"MatchConsumer: User {self.user.id} - timer_sync_loop: set start_time[{question_index}] = {current_time}")
-
-                start_time = self.question_start_time[question_index]
-                elapsed = (current_time - start_time).total_seconds()
-                time_left = max(0, int(60 - elapsed))
-
-                # Wysyłaj timer sync co sekundę
-                print(
-                    f"MatchConsumer: User {self.user.id} - timer_sync_loop: sending time_left={time_left}, question_index={question_index}")
-                await self.channel_layer.group_send(
-                    self.match_group_name,
-                    {
-                        'type': 'timer_sync',
-                        'time_left': time_left,
-                        'question_index': question_index,
-                    }
-                )
-
-                # Jeśli czas się skończył, przerwij pętlę
-                if time_left <= 0:
-                    print(
-                        f"MatchConsumer: User {self.user.id} - timer_sync_loop: time expired, breaking")
-                    break
-
-                await asyncio.sleep(1)
-            except asyncio.CancelledError:
-                print(
-                    f"MatchConsumer: User {self.user.id} - timer_sync_loop: cancelled")
-                break
-            except Exception as e:
-                print(
-                    f"MatchConsumer: User {self.user.id} - Timer sync loop error: {e}")
-                import traceback
-                traceback.print_exc()
-                break
+        invalidate_user_summary(user.id)
+        return created
 
     async def timer_sync(self, event):
         """Handler dla timer sync event"""
-        print(
-            f"MatchConsumer: User {self.user.id} - timer_sync handler: sending time_left={event['time_left']}, question_index={event['question_index']}")
-        await self.send(text_data=json.dumps({
+        timer_logger.debug('timer_sync handler: time_left=%s, question_index=%s', event['time_left'], event['question_index'], extra=self.log.extra)
+        await self.send_json({
             'type': 'match:timer_sync',
             'time_left': event['time_left'],
             'question_index': event['question_index'],
-        }))
+        })
+
+    async def heartbeat(self, event):
+        """Ping z harmonogramu (co HEARTBEAT_INTERVAL sekund)"""
+        if self.state and self.state.status == 'active':
+            await self.send_json({
+                'type': 'ping',
+            })
+
+    async def question_deadline(self, event):
+        """
+        Minął czas na pytanie (termin z harmonogramu).
+
+        Event dostają obaj gracze; za brakujące odpowiedzi zapisywana jest
+        błędna odpowiedź, a wynik przejmuje dokładnie jeden consumer
+        (commit_answers).
+        """
+        if not self.match:
+            return
+        store = get_match_state()
+        state = await store.get(self.match.id)
+        index = event['question_index']
+        if state is None or state.status != 'active' or state.current_question_index != index:
+            return
+        if not state.question_data(index):
+            return
 
-    async def heartbeat_loop(self):
-        """Pętla heartbeat - wysyła ping co 30 sekund"""
-        try:
-            while True:
-                await asyncio.sleep(30)
-                if hasattr(self, 'match') and self.match and self.match.status == 'active':
-                    await self.send(text_data=json.dumps({
-                        'type': 'ping',
-                    }))
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            print(f"Heartbeat loop error: {e}")
-
-    async def start_question_timeout(self):
-        """Rozpocznij timeout dla aktualnego pytania (60 sekund)"""
-        # Anuluj poprzedni timeout jeśli istnieje
-        if hasattr(self, '_question_timeout_task'):
-            self._question_timeout_task.cancel()
-
-        async def timeout_handler():
-            try:
-                await asyncio.sleep(60)  # 60 sekund timeout
-                # Sprawdź czy mecz nadal jest aktywny i czy pytanie nie zostało już odpowiedziane
-                self.match = await database_sync_to_async(Match.objects.get)(id=self.match.id)
-                if self.match.status != 'active':
-                    return
-
-                # Sprawdź aktualne pytanie
-                # Używamy select_related('question') aby załadować relację question w jednym zapytaniu
-                match_question = await database_sync_to_async(
-                    lambda: MatchQuestion.objects.select_related('question').filter(
-                        match=self.match,
-                        question_order=self.match.current_question_index
-                    ).first()
-                )()
-
-                if not match_question:
-                    return
-
-                # Sprawdź czy któryś z graczy nie odpowiedział
-                player1_answered = match_question.player1_answer is not None
-                player2_answered = match_question.player2_answer is not None
-
-                if not player1_answered or not player2_answered:
-                    # Automatycznie odpowiedz dla gracza, który nie odpowiedział
-                    if not player1_answered:
-                        match_question.player1_answer = 'a'  # Domyślna odpowiedź
-                        match_question.player1_correct = False
-                    if not player2_answered:
-                        match_question.player2_answer = 'a'  # Domyślna odpowiedź
-                        match_question.player2_correct = False
-
-                    from django.utils import timezone
-                    match_question.answered_at = timezone.now()
-                    await database_sync_to_async(match_question.save)()
-
-                    # Powiadom o timeout
-                    await self.channel_layer.group_send(
-                        self.match_group_name,
-                        {
-                            'type': 'match_timeout',
-                            'question_index': self.match.current_question_index,
-                            'message': 'Czas na odpowiedź minął.',
-                        }
-                    )
+        # Automatycznie odpowiedz (błędnie) za gracza, który nie odpowiedział
+        missing = {player: NO_ANSWER for player in (1, 2) if state.answer(index, player) is None}
+        if not missing:
+            return
+        commit = await store.commit_answers(self.match.id, index, missing)
+
+        if commit.recorded:
+            # Powiadom o timeout
+            await self.channel_layer.group_send(
+                self.match_group_name,
+                {
+                    'type': 'match_timeout',
+                    'question_index': index,
+                    'message': 'Czas na odpowiedź minął.',
+                }
+            )
 
-                    # Przetwórz wynik pytania
-                    # Atomowy update w process_question_result zapobiega race condition
-                    print(f"MatchConsumer: Timeout - User {self.user.id} will process result")
-                    await self.process_question_result(match_question)
-            except asyncio.CancelledError:
-                pass
-            except Exception as e:
-                print(f"Question timeout handler error: {e}")
+        if commit.claimed:
+            # Przetwórz wynik pytania (commit_answers zapobiega race condition)
+            self.log.info('Question timeout - processing result')
+            await self.process_question_result(commit.state, index)
 
-        self._question_timeout_task = asyncio.create_task(timeout_handler())
+    async def question_advance(self, event):
+        """Koniec wyświetlania wyniku - następne pytanie (przejście wykonuje jeden consumer)"""
+        if not self.match:
+            return
+        # Stan ze wspólnego magazynu - ten consumer mógł nie widzieć seedowania pytań
+        state = await get_match_state().get(self.match.id)
+        if state is None or state.status != 'active':
+            return
+        self.state = state
+        await self.advance_match(event['question_index'])
 
     async def end_match_on_disconnect(self):
         """Zakończ mecz gdy gracz się rozłącza"""
-        if not self.match or self.match.status != 'active':
+        if not self.state or self.state.status != 'active':
             return
 
-        # Odśwież mecz z bazy
-        self.match = await database_sync_to_async(Match.objects.get)(id=self.match.id)
-        if self.match.status != 'active':
+        # Aktualny stan meczu (bez odczytu z bazy)
+        state = await get_match_state().get(self.match.id)
+        if state is None or state.status != 'active':
             return
 
-        # Ustaw zwycięzcę jako gracza, który pozostał - użyj winner_id zamiast winner
+        # Zwycięzcą jest gracz, który pozostał; bonus za pozostałe pytania
+        bonus = max(0, (state.question_count or 10) - state.current_question_index)
         if self.match.player1_id == self.user.id:
             # Player1 się rozłączył, player2 wygrywa
-            self.match.winner_id = self.match.player2_id
-            # Bonus za pozostałe pytania
-            self.match.player2_score += (10 -
-                                         self.match.current_question_index)
+            finished = await self.finish_match(self.match.player2_id, player2_bonus=bonus)
         else:
             # Player2 się rozłączył, player1 wygrywa
-            self.match.winner_id = self.match.player1_id
-            # Bonus za pozostałe pytania
-            self.match.player1_score += (10 -
-                                         self.match.current_question_index)
-
-        self.match.status = 'finished'
-        from django.utils import timezone
-        self.match.finished_at = timezone.now()
-        await database_sync_to_async(self.match.save)()
+            finished = await self.finish_match(self.match.player1_id, player1_bonus=bonus)
+        if not finished:
+            return
 
         # Zaktualizuj rankingi
         await self.update_rankings()
 
         # Wyślij końcowe wyniki
-        final_data = await self.get_final_match_data(self.match)
+        final_data = self.get_final_match_data(self.state)
         await self.channel_layer.group_send(
             self.match_group_name,
             {
@@ -1364,15 +948,15 @@ class MatchConsumer(AsyncWebsocketConsumer):
     async def opponent_disconnect(self, event):
         """Handler dla rozłączenia przeciwnika"""
         if event.get('user_id') != self.user.id:
-            await self.send(text_data=json.dumps({
+            await self.send_json({
                 'type': 'match:opponent_disconnect',
                 'message': event.get('message', 'Przeciwnik rozłączył się.'),
-            }))
+            })
 
     async def match_timeout(self, event):
         """Handler dla timeout pytania"""
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'match:timeout',
             'question_index': event.get('question_index'),
             'message': event.get('message', 'Czas na odpowiedź minął.'),
-        }))
+        })
@@ -0,0 +1,305 @@
+"""
+Ranking graczy utrzymywany przyrostowo (globalny i per przedmiot).
+
+UserRanking w Postgres pozostaje źródłem prawdy. Leaderboard jest jego
+zdenormalizowaną kopią w posortowanych zbiorach Redis, aktualizowaną po
+każdym zapisie UserRanking (quiz.signals, po commit). Dzięki temu strona
+rankingu i pozycja gracza to O(log n) zamiast agregacji całej tabeli.
+Usunięty UserRanking unieważnia rankingi, a usunięte konto jest zdejmowane
+ze wszystkich rankingów.
+"""
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Sum
+from django.utils.module_loading import import_string
+from redis import RedisError, WatchError
+
+from src.redis_client import get_redis
+
+from .models import UserRanking
+
+logger = logging.getLogger(__name__)
+
+# Wynik w zbiorze posortowanym: punkty, a przy remisie liczba wygranych
+WINS_FACTOR = 10 ** 6
+
+# Próby odbudowy przerwanej przez równoległe zmiany rankingu
+REBUILD_ATTEMPTS = 3
+
+# (user_id, points, wins, losses)
+Row = Tuple[int, int, int, int]
+
+
+def _scope(subject_id: Optional[int]) -> str:
+    return f'subject:{subject_id}' if subject_id else 'global'
+
+
+def _score(points: int, wins: int) -> int:
+    return points * WINS_FACTOR + min(wins, WINS_FACTOR - 1)
+
+
+def _entry(position: int, row: Row, subject_id: Optional[int]) -> Dict:
+    user_id, points, wins, losses = row
+    entry = {
+        'position': position,
+        'user_id': user_id,
+        'points': points,
+        'wins': wins,
+        'losses': losses,
+    }
+    if subject_id:
+        entry['subject_id'] = subject_id
+    return entry
+
+
+class BaseLeaderboard:
+    """Wspólna logika: odczyt rankingów z bazy (odbudowa i fallback)"""
+
+    def rows_from_db(self, subject_id: Optional[int] = None) -> List[Row]:
+        """Posortowany ranking policzony bezpośrednio z UserRanking"""
+        if subject_id:
+            rows = UserRanking.objects.filter(subject_id=subject_id).values_list(
+                'user_id', 'points', 'wins', 'losses')
+        else:
+            rows = UserRanking.objects.values('user_id').annotate(
+                total_points=Sum('points'),
+                total_wins=Sum('wins'),
+                total_losses=Sum('losses'),
+            ).values_list('user_id', 'total_points', 'total_wins', 'total_losses')
+        return sorted(rows, key=lambda row: (-row[1], -row[2], row[0]))
+
+    def user_row_from_db(self, user_id: int, subject_id: Optional[int] = None) -> Optional[Row]:
+        rankings = UserRanking.objects.filter(user_id=user_id)
+        if subject_id:
+            rankings = rankings.filter(subject_id=subject_id)
+        totals = rankings.aggregate(
+            points=Sum('points'), wins=Sum('wins'), losses=Sum('losses'))
+        if totals['points'] is None:
+            return None
+        return user_id, totals['points'], totals['wins'], totals['losses']
+
+    def top(self, subject_id: Optional[int] = None, offset: int = 0, limit: int = 50) -> List[Dict]:
+        """Strona rankingu: pozycje offset+1 .. offset+limit"""
+        raise NotImplementedError
+
+    def rank_of(self, user_id: int, subject_id: Optional[int] = None) -> Optional[Dict]:
+        """Pozycja gracza w rankingu lub None, jeśli jeszcze nie grał"""
+        raise NotImplementedError
+
+    def count(self, subject_id: Optional[int] = None) -> int:
+        raise NotImplementedError
+
+    def update_user(self, user_id: int, subject_id: int) -> None:
+        """Odśwież wpisy gracza (przedmiot + globalny) po zmianie UserRanking"""
+        raise NotImplementedError
+
+    def invalidate(self, subject_id: Optional[int] = None) -> None:
+        """Usuń ranking - zostanie odbudowany z bazy przy następnym odczycie"""
+        raise NotImplementedError
+
+    def remove_user(self, user_id: int) -> None:
+        """Usuń gracza ze wszystkich rankingów (usunięte konto)"""
+        raise NotImplementedError
+
+
+class InMemoryLeaderboard(BaseLeaderboard):
+    """Ranking w pamięci procesu (testy, pojedynczy proces)"""
+
+    def __init__(self):
+        # {scope: {user_id: (points, wins, losses)}}
+        self._scopes: Dict[str, Dict[int, Tuple[int, int, int]]] = {}
+
+    def _sorted(self, subject_id) -> List[Row]:
+        scope = _scope(subject_id)
+        if scope not in self._scopes:
+            self._scopes[scope] = {
+                row[0]: row[1:] for row in self.rows_from_db(subject_id)
+            }
+        rows = [(user_id, *stats) for user_id, stats in self._scopes[scope].items()]
+        return sorted(rows, key=lambda row: (-row[1], -row[2], row[0]))
+
+    def top(self, subject_id=None, offset=0, limit=50):
+        rows = self._sorted(subject_id)[offset:offset + limit]
+        return [
+            _entry(offset + idx, row, subject_id)
+            for idx, row in enumerate(rows, start=1)
+        ]
+
+    def rank_of(self, user_id, subject_id=None):
+        for idx, row in enumerate(self._sorted(subject_id), start=1):
+            if row[0] == user_id:
+                return _entry(idx, row, subject_id)
+        return None
+
+    def count(self, subject_id=None):
+        return len(self._sorted(subject_id))
+
+    def update_user(self, user_id, subject_id):
+        for scope_subject_id in (subject_id, None):
+            scope = self._scopes.get(_scope(scope_subject_id))
+            if scope is None:
+                continue  # Zbudowany przy następnym odczycie
+            row = self.user_row_from_db(user_id, scope_subject_id)
+            if row:
+                scope[user_id] = row[1:]
+
+    def invalidate(self, subject_id=None):
+        self._scopes.pop(_scope(subject_id), None)
+
+    def remove_user(self, user_id):
+        for scope in self._scopes.values():
+            scope.pop(user_id, None)
+
+
+class RedisLeaderboard(BaseLeaderboard):
+    """
+    Ranking w Redis współdzielony przez wszystkie procesy.
+
+    Klucze (dla scope = 'global' lub 'subject:<id>'):
+    - leaderboard:<scope>        ZSET user_id -> points * WINS_FACTOR + wins
+    - leaderboard:<scope>:stats  HASH user_id -> "points:wins:losses"
+    - leaderboard:<scope>:ready  znacznik pełnej odbudowy z bazy
+    - leaderboard:<scope>:generation  licznik zmian, obserwowany przez odbudowę
+
+    Odbudowa czyta wiersze z bazy przed zapisem do Redis, więc zmiana
+    rankingu w międzyczasie zostałaby nadpisana starymi danymi. Każda
+    zmiana podbija generację, a odbudowa (WATCH generacji) jest wtedy
+    przerywana i powtarzana.
+
+    Przy błędzie Redis odczyty liczone są z bazy (wolniej, ale poprawnie).
+    """
+
+    def _keys(self, subject_id) -> Tuple[str, str, str]:
+        base = f'leaderboard:{_scope(subject_id)}'
+        return base, f'{base}:stats', f'{base}:ready'
+
+    def _generation_key(self, base: str) -> str:
+        return f'{base}:generation'
+
+    def _ensure_built(self, subject_id) -> None:
+        redis = get_redis()
+        key, stats_key, ready_key = self._keys(subject_id)
+        for _ in range(REBUILD_ATTEMPTS):
+            with redis.pipeline(transaction=True) as pipe:
+                try:
+                    pipe.watch(ready_key, self._generation_key(key))
+                    if pipe.exists(ready_key):
+                        return
+                    rows = self.rows_from_db(subject_id)
+                    pipe.multi()
+                    pipe.delete(key, stats_key)
+                    for user_id, points, wins, losses in rows:
+                        pipe.zadd(key, {user_id: _score(points, wins)})
+                        pipe.hset(stats_key, user_id, f'{points}:{wins}:{losses}')
+                    pipe.set(ready_key, 1)
+                    pipe.execute()
+                except WatchError:
+                    # Zmiana rankingu lub odbudowa w innym procesie - sprawdź ponownie
+                    continue
+            logger.info('Leaderboard %s rebuilt from database (%d rows)',
+                        _scope(subject_id), len(rows))
+            return
+        # WatchError to RedisError - odczyt zostanie policzony z bazy
+        raise WatchError(f'Leaderboard {_scope(subject_id)} rebuild kept conflicting with updates')
+
+    def _rows(self, subject_id, user_ids) -> List[Row]:
+        if not user_ids:
+            return []
+        _, stats_key, _ = self._keys(subject_id)
+        stats = get_redis().hmget(stats_key, user_ids)
+        rows = []
+        for user_id, value in zip(user_ids, stats):
+            points, wins, losses = (int(part) for part in (value or '0:0:0').split(':'))
+            rows.append((int(user_id), points, wins, losses))
+        return rows
+
+    def top(self, subject_id=None, offset=0, limit=50):
+        try:
+            self._ensure_built(subject_id)
+            key, _, _ = self._keys(subject_id)
+            user_ids = get_redis().zrevrange(key, offset, offset + limit - 1)
+            rows = self._rows(subject_id, user_ids)
+        except RedisError as e:
+            logger.warning('Leaderboard unavailable, falling back to database: %s', e)
+            rows = self.rows_from_db(subject_id)[offset:offset + limit]
+        return [
+            _entry(offset + idx, row, subject_id)
+            for idx, row in enumerate(rows, start=1)
+        ]
+
+    def rank_of(self, user_id, subject_id=None):
+        try:
+            self._ensure_built(subject_id)
+            key, _, _ = self._keys(subject_id)
+            rank = get_redis().zrevrank(key, user_id)
+            if rank is None:
+                return None
+            return _entry(rank + 1, self._rows(subject_id, [user_id])[0], subject_id)
+        except RedisError as e:
+            logger.warning('Leaderboard unavailable, falling back to database: %s', e)
+            for idx, row in enumerate(self.rows_from_db(subject_id), start=1):
+                if row[0] == user_id:
+                    return _entry(idx, row, subject_id)
+            return None
+
+    def count(self, subject_id=None):
+        try:
+            self._ensure_built(subject_id)
+            key, _, _ = self._keys(subject_id)
+            return get_redis().zcard(key)
+        except RedisError:
+            return len(self.rows_from_db(subject_id))
+
+    def update_user(self, user_id, subject_id):
+        redis = get_redis()
+        for scope_subject_id in (subject_id, None):
+            key, stats_key, ready_key = self._keys(scope_subject_id)
+            # Generacja przed sprawdzeniem znacznika: trwająca odbudowa zostanie
+            # przerwana, a zakończona jest już widoczna i dostanie zapis poniżej
+            with redis.pipeline(transaction=True) as pipe:
+                pipe.incr(self._generation_key(key))
+                pipe.exists(ready_key)
+                _, ready = pipe.execute()
+            if not ready:
+                continue  # Zbudowany z bazy przy następnym odczycie
+            row = self.user_row_from_db(user_id, scope_subject_id)
+            if not row:
+                continue
+            _, points, wins, losses = row
+            with redis.pipeline(transaction=True) as pipe:
+                pipe.zadd(key, {user_id: _score(points, wins)})
+                pipe.hset(stats_key, user_id, f'{points}:{wins}:{losses}')
+                pipe.execute()
+
+    def invalidate(self, subject_id=None):
+        key, stats_key, ready_key = self._keys(subject_id)
+        with get_redis().pipeline(transaction=True) as pipe:
+            pipe.delete(key, stats_key, ready_key)
+            pipe.incr(self._generation_key(key))
+            pipe.execute()
+
+    def remove_user(self, user_id):
+        redis = get_redis()
+        with redis.pipeline(transaction=False) as pipe:
+            for stats_key in redis.scan_iter(match='leaderboard:*:stats'):
+                key = stats_key.removesuffix(':stats')
+                pipe.incr(self._generation_key(key))
+                pipe.zrem(key, user_id)
+                pipe.hdel(stats_key, user_id)
+            pipe.execute()
+
+
+_leaderboard = None
+_leaderboard_path = None
+
+
+def get_leaderboard() -> BaseLeaderboard:
+    """Zwróć leaderboard skonfigurowany w settings.LEADERBOARD_BACKEND"""
+    global _leaderboard, _leaderboard_path
+    path = settings.LEADERBOARD_BACKEND
+    if _leaderboard is None or _leaderboard_path != path:
+        _leaderboard = import_string(path)()
+        _leaderboard_path = path
+    return _leaderboard
@@ -0,0 +1,75 @@
+"""
+Logowanie consumerów WebSocket (zamiast print()).
+
+Rekordy niosą kontekst meczu (match_id, user_id) jako pola rekordu, a
+komunikaty są formatowane leniwie (argumenty %s) - wyłączony poziom nie
+kosztuje formatowania. Zdarzenia o dużej częstotliwości (synchronizacja
+timera) idą przez osobny logger próbkowany filtrem SampleFilter.
+
+Poziomy, filtry i handlery (także nieblokujący QueueHandler) są
+konfigurowane w LOGGING w src/settings.py.
+"""
+import atexit
+import itertools
+import logging
+from logging.handlers import QueueHandler
+from typing import Any, MutableMapping, Optional, Tuple
+
+# Pola kontekstu dołączane do każdego rekordu (format: %(match_id)s, %(user_id)s)
+CONTEXT_FIELDS = ('match_id', 'user_id')
+
+
+class MatchContextFilter(logging.Filter):
+    """Uzupełnia brakujące pola kontekstu, żeby wspólny format działał dla każdego loggera"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name in CONTEXT_FIELDS:
+            if getattr(record, name, None) is None:
+                setattr(record, name, '-')
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Przepuszcza co rate-ty rekord; WARNING i wyższe zawsze"""
+
+    def __init__(self, rate: int = 1, name: str = ''):
+        super().__init__(name)
+        self.rate = max(1, int(rate))
+        self._counter = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        return next(self._counter) % self.rate == 0
+
+
+class MatchLogger(logging.LoggerAdapter):
+    """Logger z kontekstem meczu; extra przekazane w wywołaniu ma pierwszeństwo"""
+
+    def process(self, msg: Any, kwargs: MutableMapping[str, Any]) -> Tuple[Any, MutableMapping[str, Any]]:
+        kwargs['extra'] = {**self.extra, **kwargs.get('extra', {})}
+        return msg, kwargs
+
+
+def match_logger(logger: logging.Logger, match_id: Optional[int] = None,
+                 user_id: Optional[int] = None) -> MatchLogger:
+    return MatchLogger(logger, {'match_id': match_id, 'user_id': user_id})
+
+
+def start_queue_listeners() -> None:
+    """
+    Uruchom listenery handlerów QueueHandler z LOGGING.
+
+    dictConfig tworzy QueueListener (klucz 'handlers'), ale go nie startuje -
+    robi to QuizConfig.ready(); zatrzymanie przy wyjściu opróżnia kolejkę.
+    """
+    manager = logging.Logger.manager
+    loggers = [logging.getLogger()] + [
+        logger for logger in list(manager.loggerDict.values()) if isinstance(logger, logging.Logger)
+    ]
+    for logger in loggers:
+        for handler in logger.handlers:
+            listener = getattr(handler, 'listener', None)
+            if isinstance(handler, QueueHandler) and listener is not None and listener._thread is None:
+                listener.start()
+                atexit.register(listener.stop)
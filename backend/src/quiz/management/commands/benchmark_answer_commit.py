@@ -0,0 +1,97 @@
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from quiz.match_state import MatchState, get_match_state
+
+# Syntetyczne mecze dostają identyfikatory poza zakresem prawdziwych meczów
+MATCH_ID_OFFSET = 10 ** 9
+
+
+class Command(BaseCommand):
+    help = ('Measure answer-to-result latency of the match state store: two players answer '
+            'every question at the same time and the second answer claims the result.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--matches',
+            type=int,
+            default=200,
+            help='Number of synthetic matches',
+        )
+        parser.add_argument(
+            '--questions',
+            type=int,
+            default=10,
+            help='Questions per match',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=50,
+            help='Matches played at the same time',
+        )
+        parser.add_argument(
+            '--backend',
+            help='Match state store class (default: MATCH_STATE_BACKEND)',
+        )
+
+    def handle(self, *args, **options):
+        store = import_string(options['backend'])() if options['backend'] else get_match_state()
+        self.stdout.write(
+            f'{type(store).__name__}: {options["matches"]} matches x {options["questions"]} questions, '
+            f'concurrency {options["concurrency"]}'
+        )
+        latencies, claims, elapsed = asyncio.run(self._run(store, options))
+
+        expected = options['matches'] * options['questions']
+        style = self.style.SUCCESS if claims == expected else self.style.ERROR
+        self.stdout.write(style(f'Results claimed: {claims}/{expected} (exactly one per question)'))
+        latencies_ms = sorted(latency * 1000 for latency in latencies)
+        self.stdout.write(
+            f'Answer-to-result latency: mean {statistics.fmean(latencies_ms):.3f} ms, '
+            f'p50 {self._percentile(latencies_ms, 50):.3f} ms, '
+            f'p95 {self._percentile(latencies_ms, 95):.3f} ms, '
+            f'p99 {self._percentile(latencies_ms, 99):.3f} ms'
+        )
+        self.stdout.write(f'Throughput: {len(latencies) * 2 / elapsed:.0f} answers/s ({elapsed:.2f}s)')
+
+    async def _run(self, store, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        latencies = []
+        claims = 0
+
+        async def play(match_id):
+            nonlocal claims
+            async with semaphore:
+                await store.init(MatchState(
+                    match_id=match_id, status='active', player1_id=1, player2_id=2,
+                    questions=[
+                        {'id': index, 'question': {'id': index}, 'correct_answer': 'a'}
+                        for index in range(options['questions'])
+                    ],
+                ))
+                try:
+                    for index in range(options['questions']):
+                        started = time.perf_counter()
+                        commits = await asyncio.gather(
+                            store.commit_answers(match_id, index, {1: 'a'}),
+                            store.commit_answers(match_id, index, {2: 'b'}),
+                        )
+                        latencies.append(time.perf_counter() - started)
+                        claims += sum(commit.claimed for commit in commits)
+                        await store.update(match_id, current_question_index=index + 1)
+                finally:
+                    await store.delete(match_id)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(play(MATCH_ID_OFFSET + i) for i in range(options['matches'])))
+        return latencies, claims, time.perf_counter() - started
+
+    @staticmethod
+    def _percentile(values, percent):
+        index = min(len(values) - 1, int(len(values) * percent / 100))
+        return values[index]
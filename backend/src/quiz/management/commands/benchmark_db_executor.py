@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from quiz.match_state import MatchState, persist_result
+from src.db_executor import database_sync_to_async, get_db_executor
+
+# Syntetyczne mecze i pytania mają ujemne identyfikatory - UPDATE nie zmienia żadnego wiersza
+QUESTION_ID_STRIDE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Measure answers/s one worker can persist through the consumers\' database executor: '
+            'channels\' single thread-sensitive thread versus the DB_EXECUTOR_WORKERS pool. '
+            'Run against Postgres; the UPDATEs target negative ids and change no rows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--connections',
+            type=int,
+            default=200,
+            help='Matches played at the same time on this worker',
+        )
+        parser.add_argument(
+            '--questions',
+            type=int,
+            default=10,
+            help='Questions per match',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            nargs='+',
+            default=[0, 4, 8, 16],
+            help='Pool sizes to compare (0 = thread-sensitive, the channels default)',
+        )
+        parser.add_argument(
+            '--db-latency',
+            type=float,
+            default=0.0,
+            help='Extra milliseconds per call, to emulate a database on another host',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{options["connections"]} matches x {options["questions"]} questions, '
+            f'2 answers per persisted result, extra latency {options["db_latency"]} ms'
+        )
+        baseline = None
+        for workers in options['workers']:
+            with override_settings(DB_EXECUTOR_WORKERS=workers):
+                elapsed = asyncio.run(self._run(options))
+                stats = get_db_executor().stats() if workers else None
+            answers = options['connections'] * options['questions'] * 2
+            rate = answers / elapsed
+            baseline = baseline or rate
+            label = f'{workers} pool threads' if workers else 'thread-sensitive'
+            line = f'{label:>18}: {rate:8.0f} answers/s ({rate / baseline:.1f}x)'
+            if stats:
+                line += f', mean wait {stats["mean_wait_ms"]} ms, max wait {stats["max_wait_ms"]} ms'
+            self.stdout.write(line)
+
+    async def _run(self, options):
+        latency = options['db_latency'] / 1000
+
+        def persist(state, index):
+            if latency:
+                time.sleep(latency)
+            persist_result(state, index)
+
+        async def play(match_id):
+            state = MatchState(
+                match_id=match_id, status='active', player1_id=1, player2_id=2,
+                questions=[
+                    {'id': match_id * QUESTION_ID_STRIDE - index, 'question': {'id': index}, 'correct_answer': 'a'}
+                    for index in range(options['questions'])
+                ],
+            )
+            for index in range(options['questions']):
+                state.answers[(index, 1)] = 'a'
+                state.answers[(index, 2)] = 'b'
+                await database_sync_to_async(persist)(state, index)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(play(-1 - i) for i in range(options['connections'])))
+        return time.perf_counter() - started
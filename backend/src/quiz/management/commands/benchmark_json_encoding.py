@@ -0,0 +1,95 @@
+import json
+import time
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from quiz.consumers import MatchConsumer, logger
+from quiz.log import match_logger
+from quiz.match_state import MatchState
+from src.encoding import dumps_text
+from src.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = ('Compare stdlib json and orjson encoding of match:end frames '
+            '(get_final_match_data payloads) and of REST responses.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=20000,
+            help='Encodings per variant',
+        )
+        parser.add_argument(
+            '--questions',
+            type=int,
+            default=10,
+            help='Questions in the synthetic match',
+        )
+
+    def handle(self, *args, **options):
+        frame = {'type': 'match:end', 'data': self._final_match_data(options['questions'])}
+        iterations = options['iterations']
+
+        self.stdout.write(
+            f'match:end frame: {len(dumps_text(frame))} bytes, {iterations} encodings per variant')
+        self._compare('WebSocket frame', iterations,
+                      ('json.dumps', lambda: json.dumps(frame)),
+                      ('orjson', lambda: dumps_text(frame)))
+
+        context = {'response': SimpleNamespace(status_code=200)}
+        stdlib, fast = JSONRenderer(), ORJSONRenderer()
+        self._compare('REST renderer', iterations,
+                      ('JSONRenderer', lambda: stdlib.render(frame, 'application/json', context)),
+                      ('ORJSONRenderer', lambda: fast.render(frame, 'application/json', context)))
+
+    def _final_match_data(self, questions):
+        """Payload zbudowany przez MatchConsumer.get_final_match_data dla syntetycznego meczu"""
+        state = MatchState(
+            match_id=1, status='finished', player1_id=1, player2_id=2, subject_id=1,
+            player1_score=questions // 2, player2_score=questions // 3,
+            questions=[
+                {
+                    'id': index,
+                    'question': {
+                        'id': index,
+                        'question_text': f'Które zdanie najlepiej opisuje rozdział {index + 1}?',
+                        'option_a': 'Bohater wyrusza w podróż do stolicy',
+                        'option_b': 'Narrator wspomina dzieciństwo spędzone na wsi',
+                        'option_c': 'Rodzina przygotowuje się do świąt',
+                        'option_d': 'Przyjaciele kłócą się o spadek',
+                        'question_order': index,
+                    },
+                    'correct_answer': 'b',
+                }
+                for index in range(questions)
+            ],
+        )
+        for index in range(questions):
+            state.answers[(index, 1)] = 'b'
+            state.answers[(index, 2)] = 'abcd'[index % 4]
+
+        consumer = MatchConsumer()
+        consumer.user = SimpleNamespace(id=1)
+        consumer.match = SimpleNamespace(player1_id=1, player2_id=2, winner_id=1)
+        consumer.log = match_logger(logger, match_id=1, user_id=1)
+        return consumer.get_final_match_data(state)
+
+    def _compare(self, label, iterations, baseline, candidate):
+        timings = {}
+        for name, encode in (baseline, candidate):
+            encode()
+            started = time.perf_counter()
+            for _ in range(iterations):
+                encode()
+            timings[name] = time.perf_counter() - started
+
+        (base_name, base_time), (name, elapsed) = timings.items()
+        self.stdout.write(
+            f'{label}: {base_name} {base_time / iterations * 1e6:.1f} us, '
+            f'{name} {elapsed / iterations * 1e6:.1f} us '
+            f'({base_time / elapsed:.1f}x faster)'
+        )
@@ -2,6 +2,7 @@ import json
 import os
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from quiz.catalog import invalidate_catalog
 from quiz.models import Subject, Book
 
 
@@ -54,6 +55,7 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING('Clearing existing data...'))
             Book.objects.all().delete()
             Subject.objects.all().delete()
+            invalidate_catalog()
             self.stdout.write(self.style.SUCCESS('Existing data cleared.'))
 
         # Wczytanie JSON
@@ -184,6 +186,9 @@ class Command(BaseCommand):
             )
         )
 
+        # Nowe przedmioty i książki widoczne od razu w listach (cache katalogu)
+        invalidate_catalog()
+
         self.stdout.write(
             self.style.SUCCESS(
                 f'\n✅ Import completed successfully!'
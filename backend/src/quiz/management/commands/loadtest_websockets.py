@@ -0,0 +1,200 @@
+import asyncio
+import resource
+import statistics
+import threading
+import time
+from collections import Counter
+
+import aiohttp
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework_simplejwt.tokens import AccessToken
+
+User = get_user_model()
+
+USERNAME_PREFIX = 'loadtest_'
+
+
+class Command(BaseCommand):
+    help = ('Open many notification WebSockets at once against a running ASGI server and report '
+            'connect latency, failures and the peak number of Postgres connections. '
+            'Run the stack with docker-compose.loadtest.yml (max_connections=50, DB_POOL=true).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            default='ws://localhost:8000/ws/notifications/',
+            help='WebSocket endpoint',
+        )
+        parser.add_argument(
+            '--sockets',
+            type=int,
+            default=5000,
+            help='Sockets to open',
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=500,
+            help='Distinct load-test users (sockets are spread over them)',
+        )
+        parser.add_argument(
+            '--connect-rate',
+            type=float,
+            default=0,
+            help='Sockets opened per second (0 = all at once, like a reconnect storm)',
+        )
+        parser.add_argument(
+            '--hold',
+            type=float,
+            default=30,
+            help='Seconds to keep the sockets open',
+        )
+        parser.add_argument(
+            '--cleanup',
+            action='store_true',
+            help='Delete the load-test users afterwards',
+        )
+
+    def handle(self, *args, **options):
+        self._raise_file_limit(options['sockets'])
+        tokens = [str(AccessToken.for_user(user)) for user in self._users(options['users'])]
+        connection.close()
+
+        sampler = DatabaseConnectionSampler() if connection.vendor == 'postgresql' else None
+        if sampler:
+            sampler.start()
+        try:
+            report = asyncio.run(self._run(options, tokens))
+        finally:
+            if sampler:
+                sampler.stop()
+
+        latencies = sorted(latency * 1000 for latency in report['latencies'])
+        self.stdout.write(f'Opened {len(latencies)}/{options["sockets"]} sockets '
+                          f'in {report["elapsed"]:.1f}s, {report["dropped"]} closed by the server while held')
+        if latencies:
+            self.stdout.write(
+                f'Connect latency: p50 {self._percentile(latencies, 50):.0f} ms, '
+                f'p95 {self._percentile(latencies, 95):.0f} ms, '
+                f'p99 {self._percentile(latencies, 99):.0f} ms, '
+                f'mean {statistics.fmean(latencies):.0f} ms'
+            )
+        for reason, count in report['failures'].most_common():
+            self.stdout.write(self.style.ERROR(f'Failed: {count} x {reason}'))
+        if sampler:
+            self.stdout.write(
+                f'Postgres connections: peak {sampler.peak} of max_connections {sampler.max_connections} '
+                f'(this command holds 1)'
+            )
+
+        if options['cleanup']:
+            deleted, _ = User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+            self.stdout.write(f'Deleted {deleted} load-test rows')
+
+    def _users(self, count):
+        existing = {
+            user.username: user
+            for user in User.objects.filter(username__startswith=USERNAME_PREFIX)
+        }
+        missing = [
+            User(username=f'{USERNAME_PREFIX}{i}', email=f'{USERNAME_PREFIX}{i}@loadtest.local')
+            for i in range(count) if f'{USERNAME_PREFIX}{i}' not in existing
+        ]
+        for user in missing:
+            user.set_unusable_password()
+        User.objects.bulk_create(missing)
+        return list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('id')[:count])
+
+    async def _run(self, options, tokens):
+        latencies = []
+        failures = Counter()
+        dropped = 0
+        last_opened = None
+        release = asyncio.Event()
+
+        async def hold(session, index):
+            nonlocal dropped, last_opened
+            started = time.perf_counter()
+            try:
+                ws = await session.ws_connect(f'{options["url"]}?token={tokens[index % len(tokens)]}')
+            except Exception as e:
+                failures[type(e).__name__] += 1
+                return
+            try:
+                # Pierwsza ramka (active_users) potwierdza, że connect() przeszedł
+                first = await ws.receive(timeout=30)
+                if first.type != aiohttp.WSMsgType.TEXT:
+                    failures[f'closed {ws.close_code}'] += 1
+                    return
+                last_opened = time.perf_counter()
+                latencies.append(last_opened - started)
+                while not release.is_set():
+                    receive = asyncio.ensure_future(ws.receive())
+                    released = asyncio.ensure_future(release.wait())
+                    done, _ = await asyncio.wait({receive, released}, return_when=asyncio.FIRST_COMPLETED)
+                    for future in {receive, released} - done:
+                        future.cancel()
+                    if receive in done and receive.result().type in (
+                            aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                        dropped += 1
+                        return
+            except asyncio.TimeoutError:
+                failures['no frame within 30s'] += 1
+            finally:
+                await ws.close()
+
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            started = time.perf_counter()
+            tasks = []
+            for index in range(options['sockets']):
+                tasks.append(asyncio.create_task(hold(session, index)))
+                if options['connect_rate']:
+                    await asyncio.sleep(1 / options['connect_rate'])
+            await asyncio.sleep(options['hold'])
+            release.set()
+            await asyncio.gather(*tasks)
+        elapsed = (last_opened or started) - started
+        return {'latencies': latencies, 'failures': failures, 'dropped': dropped, 'elapsed': elapsed}
+
+    def _raise_file_limit(self, sockets):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        needed = sockets + 256
+        if soft < needed:
+            target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            if target < needed:
+                self.stdout.write(self.style.WARNING(
+                    f'Open file limit {target} is below {needed}; raise it with ulimit -n'))
+
+    @staticmethod
+    def _percentile(values, percent):
+        index = min(len(values) - 1, int(len(values) * percent / 100))
+        return values[index]
+
+
+class DatabaseConnectionSampler(threading.Thread):
+    """Co sekundę odczytuje liczbę połączeń z bazą (pg_stat_activity)"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = 0
+        self.max_connections = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        from django.db import connection as thread_connection
+
+        with thread_connection.cursor() as cursor:
+            cursor.execute('SHOW max_connections')
+            self.max_connections = int(cursor.fetchone()[0])
+            while not self._stop_event.wait(1):
+                cursor.execute('SELECT count(*) FROM pg_stat_activity WHERE datname = current_database()')
+                self.peak = max(self.peak, cursor.fetchone()[0])
+        thread_connection.close()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
@@ -0,0 +1,76 @@
+import json
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from quiz.matchmaking import complete_tick, get_matchmaking
+
+logger = logging.getLogger('quiz.matchmaking')
+
+
+class Command(BaseCommand):
+    help = ('Run the matchmaking loop: pair queued players by ranking points every tick '
+            '(settings.MATCHMAKING_TICK) and expire tickets older than MATCHMAKING_MAX_WAIT.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tick',
+            type=float,
+            default=None,
+            help='Seconds between ticks (default: settings.MATCHMAKING_TICK)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run a single tick and exit',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Print queue depth and wait-time statistics and exit',
+        )
+        parser.add_argument(
+            '--stats-every',
+            type=int,
+            default=60,
+            help='Log queue statistics every N ticks (0 disables)',
+        )
+
+    def handle(self, *args, **options):
+        queue = get_matchmaking()
+
+        if options['stats']:
+            self.stdout.write(json.dumps(queue.stats(), indent=2))
+            return
+
+        interval = options['tick'] or settings.MATCHMAKING_TICK
+        stats_every = options['stats_every']
+        self.stdout.write(f'Matchmaking loop started ({type(queue).__name__}, tick {interval}s)')
+
+        ticks = 0
+        while True:
+            started = time.monotonic()
+            try:
+                result = queue.tick()
+                if result.pairs or result.expired:
+                    created = async_to_sync(complete_tick)(result)
+                    logger.info('Tick: %d matches created, %d tickets expired',
+                                created, len(result.expired))
+            except Exception:
+                # Błąd Redis w ticku nie zatrzymuje pętli - transakcja nie zdjęła biletów z kolejki;
+                # nieudane pary complete_tick sam przywraca do kolejki
+                logger.exception('Matchmaking tick failed')
+
+            ticks += 1
+            if stats_every and ticks % stats_every == 0:
+                stats = queue.stats()
+                logger.info('Queue stats: %d waiting in %d queues, mean wait %.1fs, max wait %.1fs, %d expired',
+                            stats['waiting'], len(stats['queues']), stats['mean_wait'],
+                            stats['max_wait'], stats['expired'])
+
+            if options['once']:
+                return
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
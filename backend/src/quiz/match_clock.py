@@ -0,0 +1,75 @@
+"""
+Zegar meczu - terminy pytań trzymane w pamięci procesu.
+
+Zastępuje odpytywanie bazy co sekundę przy synchronizacji timera meczu.
+Termin pytania jest wyliczany raz (przy starcie pytania) i rozsyłany w evencie
+grupy, więc każdy worker ma ten sam deadline bez dodatkowych zapytań.
+"""
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+# Czas na odpowiedź na jedno pytanie (sekundy)
+QUESTION_TIME_LIMIT = 60
+
+
+@dataclass
+class QuestionClock:
+    """Zegar pojedynczego pytania"""
+    question_index: int
+    deadline: float
+    stopped: bool = False
+
+    def time_left(self, now: Optional[float] = None) -> int:
+        """Pozostały czas w pełnych sekundach (nigdy ujemny)"""
+        if now is None:
+            now = time.time()
+        return max(0, int(self.deadline - now))
+
+    def is_running(self, now: Optional[float] = None) -> bool:
+        return not self.stopped and self.time_left(now) > 0
+
+
+class MatchClock:
+    """Rejestr zegarów pytań dla meczów obsługiwanych przez ten proces"""
+
+    def __init__(self, time_limit: int = QUESTION_TIME_LIMIT):
+        self.time_limit = time_limit
+        # {match_id: QuestionClock}
+        self._clocks: Dict[int, QuestionClock] = {}
+
+    def start_question(self, match_id: int, question_index: int,
+                       deadline: Optional[float] = None) -> QuestionClock:
+        """
+        Uruchom zegar pytania.
+
+        Wywołanie jest idempotentne dla tego samego pytania - drugi gracz
+        (lub drugi handler) nie przesuwa terminu, chyba że przekaże deadline
+        otrzymany z eventu grupy.
+        """
+        clock = self._clocks.get(match_id)
+        if clock and clock.question_index == question_index and deadline is None:
+            return clock
+
+        if deadline is None:
+            deadline = time.time() + self.time_limit
+        clock = QuestionClock(question_index=question_index, deadline=deadline)
+        self._clocks[match_id] = clock
+        return clock
+
+    def get(self, match_id: int) -> Optional[QuestionClock]:
+        return self._clocks.get(match_id)
+
+    def stop_question(self, match_id: int, question_index: int) -> None:
+        """Zatrzymaj zegar (obaj gracze odpowiedzieli lub minął czas)"""
+        clock = self._clocks.get(match_id)
+        if clock and clock.question_index == question_index:
+            clock.stopped = True
+
+    def clear(self, match_id: int) -> None:
+        """Usuń zegar meczu (koniec meczu)"""
+        self._clocks.pop(match_id, None)
+
+
+# Zegar współdzielony przez wszystkie consumery w procesie
+match_clock = MatchClock()
@@ -0,0 +1,69 @@
+"""
+Historia meczów gracza (MatchViewSet.list) stronicowana kluczem.
+
+Zamiast offsetu klient dostaje kursor - (created_at, id) ostatniego meczu
+strony - a kolejna strona to mecze starsze od niego. Koszt strony nie
+rośnie z długością historii.
+
+Warunek "player1 = u OR player2 = u" wymusiłby sortowanie wszystkich
+meczów gracza, więc strona składa się z dwóch zapytań (jako player1 i jako
+player2) z LIMIT, każde po własnym indeksie (player, -created_at, -id),
+scalanych w Pythonie.
+"""
+import base64
+import binascii
+import heapq
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from django.db.models import Q
+
+from .models import Match
+
+# Pola potrzebne MatchHistorySerializer - bez pełnych obiektów książki i graczy
+HISTORY_FIELDS = (
+    'id', 'status', 'winner', 'player1_score', 'player2_score', 'question_count', 'created_at', 'finished_at',
+    'book__title', 'subject__name', 'subject__color', 'player1__username', 'player2__username',
+)
+
+
+def encode_cursor(match: Match) -> str:
+    raw = f'{match.created_at.isoformat()}|{match.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """(created_at, id) z kursora; ValueError dla niepoprawnego"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, match_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(match_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError('Niepoprawny kursor') from e
+
+
+def _sort_key(match: Match) -> Tuple[datetime, int]:
+    return match.created_at, match.id
+
+
+def history_page(user, limit: int, cursor: Optional[str] = None) -> Tuple[List[Match], Optional[str]]:
+    """Strona historii (od najnowszych) i kursor następnej strony (None - koniec)"""
+    after = Q()
+    if cursor:
+        created_at, match_id = decode_cursor(cursor)
+        after = Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=match_id)
+
+    queryset = (
+        Match.objects.filter(after)
+        .select_related('book', 'subject', 'player1', 'player2')
+        .only(*HISTORY_FIELDS)
+        .order_by('-created_at', '-id')
+    )
+    as_player1 = queryset.filter(player1=user)[:limit + 1]
+    as_player2 = queryset.filter(player2=user)[:limit + 1]
+
+    matches = list(heapq.merge(as_player1, as_player2, key=_sort_key, reverse=True))[:limit + 1]
+    if len(matches) > limit:
+        matches = matches[:limit]
+        return matches, encode_cursor(matches[-1])
+    return matches, None
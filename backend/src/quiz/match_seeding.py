@@ -0,0 +1,91 @@
+"""
+Przygotowanie pytań meczu (sloty MatchQuestion) przy starcie.
+
+Wspólne dla REST (MatchViewSet.start) i WebSocket (MatchConsumer).
+Wszystkie zapisy - ewentualne nowe pytania do banku i sloty meczu - idą
+przez bulk_create w jednej transakcji, zamiast osobnego create() i
+exists() dla każdego pytania.
+
+Wyścig obu graczy startujących mecz jednocześnie: wiersz meczu jest
+blokowany (select_for_update), a drugi seedujący widzi już gotowe sloty.
+Konflikty na (match, question_order) są dodatkowo ignorowane przez bazę.
+"""
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+
+from src.db_executor import database_sync_to_async
+
+from .models import Match, MatchQuestion
+from .question_bank import (
+    QUESTIONS_PER_MATCH, agenerate_bank_questions, bank_size, book_data,
+    generate_bank_questions, select_questions, store_generated_questions,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _seed_state(match: Match) -> Tuple[int, int, Dict]:
+    """(istniejące sloty, rozmiar banku, dane książki) - jedno przejście do bazy"""
+    slots = MatchQuestion.objects.filter(match_id=match.id).count()
+    if slots:
+        return slots, 0, {}
+    book = match.book
+    return slots, bank_size(book), book_data(book)
+
+
+def _write_slots(match: Match, count: int, generated: Optional[List[Dict]] = None) -> int:
+    """Zapisz wygenerowane pytania i sloty meczu w jednej transakcji"""
+    with transaction.atomic():
+        # Blokada wiersza meczu - drugi seedujący czeka i widzi gotowe sloty
+        Match.objects.select_for_update().filter(id=match.id).first()
+        existing = MatchQuestion.objects.filter(match_id=match.id).count()
+        if existing:
+            return existing
+
+        if generated:
+            store_generated_questions(match.book, generated)
+        questions = select_questions(match, count)
+        if len(questions) < count:
+            logger.warning('Match %s seeded with only %d questions', match.id, len(questions))
+        MatchQuestion.objects.bulk_create(
+            [
+                MatchQuestion(match_id=match.id, question=question, question_order=idx)
+                for idx, question in enumerate(questions)
+            ],
+            ignore_conflicts=True,
+        )
+        slots = MatchQuestion.objects.filter(match_id=match.id).count()
+        # Liczba pytań zdenormalizowana w meczu - historia nie liczy slotów
+        Match.objects.filter(id=match.id).update(question_count=slots)
+    match.question_count = slots
+    return slots
+
+
+def seed_match_questions(match: Match, count: int = QUESTIONS_PER_MATCH) -> int:
+    """
+    Utwórz sloty pytań meczu, jeśli jeszcze ich nie ma.
+
+    LLM jest wywoływany (poza transakcją) tylko wtedy, gdy bank książki nie
+    wystarcza na mecz. Zwraca liczbę slotów meczu.
+    """
+    slots, size, _ = _seed_state(match)
+    if slots:
+        return slots
+    generated = generate_bank_questions(match.book) if size < count else None
+    return _write_slots(match, count, generated)
+
+
+async def aseed_match_questions(match: Match, count: int = QUESTIONS_PER_MATCH) -> int:
+    """
+    Asynchroniczna wersja seed_match_questions (MatchConsumer).
+
+    Najwyżej dwa przejścia do wątku ORM; ewentualne generowanie działa
+    natywnie w pętli zdarzeń.
+    """
+    slots, size, data = await database_sync_to_async(_seed_state)(match)
+    if slots:
+        return slots
+    generated = await agenerate_bank_questions(data) if size < count else None
+    return await database_sync_to_async(_write_slots)(match, count, generated)
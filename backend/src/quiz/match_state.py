@@ -0,0 +1,476 @@
+"""
+Stan meczu w trakcie rozgrywki - źródło prawdy dla MatchConsumer.
+
+Status, bieżące pytanie, wyniki, odpowiedzi i termin pytania są trzymane
+w Redis (współdzielone przez wszystkie procesy) albo w pamięci procesu
+(pojedynczy worker, testy). Obsługa odpowiedzi nie czyta już Match
+i MatchQuestion z bazy - Postgres dostaje zapis tylko przy przejściach
+stanu: start meczu, wynik pytania, następne pytanie, koniec meczu.
+
+Zapis odpowiedzi to jedna atomowa operacja (commit_answers; w Redis skrypt
+Lua): zapisuje odpowiedź, sprawdza, czy obaj gracze odpowiedzieli, i wtedy
+przejmuje przetworzenie wyniku oraz nalicza punkty. Wyścig dwóch graczy
+odpowiadających w tej samej chwili nie zależy od kilku zapytań - wynik
+dostaje dokładnie jeden consumer. Pozostałe jednorazowe przejścia (start,
+następne pytanie, koniec) są chronione przez claim().
+"""
+import copy
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from src.db_executor import database_sync_to_async
+from src.redis_client import get_async_redis
+
+from .models import Match, MatchQuestion
+from .serializers import QuestionSerializer
+
+# Odpowiedź zapisana po upływie czasu (liczona jako błędna)
+NO_ANSWER = ''
+# Odpowiedź zapisywana w bazie za gracza, który nie zdążył
+DEFAULT_ANSWER = 'a'
+
+
+@dataclass
+class MatchState:
+    """Stan meczu; questions: [{'id', 'question', 'correct_answer'}] w kolejności pytań"""
+    match_id: int
+    status: str
+    player1_id: int
+    player2_id: Optional[int] = None
+    subject_id: Optional[int] = None
+    current_question_index: int = 0
+    player1_score: int = 0
+    player2_score: int = 0
+    # Termin bieżącego pytania (timestamp)
+    deadline: Optional[float] = None
+    questions: List[Dict] = field(default_factory=list)
+    # {(indeks pytania, gracz 1/2): odpowiedź}
+    answers: Dict[Tuple[int, int], str] = field(default_factory=dict)
+    claims: Set[str] = field(default_factory=set)
+
+    @property
+    def question_count(self) -> int:
+        return len(self.questions)
+
+    def player_number(self, user_id: int) -> Optional[int]:
+        if user_id == self.player1_id:
+            return 1
+        if self.player2_id and user_id == self.player2_id:
+            return 2
+        return None
+
+    def question_data(self, index: int) -> Optional[Dict]:
+        """Dane pytania BEZ poprawnej odpowiedzi"""
+        if 0 <= index < len(self.questions):
+            return dict(self.questions[index]['question'])
+        return None
+
+    def answer(self, index: int, player: int) -> Optional[str]:
+        return self.answers.get((index, player))
+
+    def both_answered(self, index: int) -> bool:
+        return (index, 1) in self.answers and (index, 2) in self.answers
+
+    def is_correct(self, index: int, player: int) -> bool:
+        answer = self.answer(index, player)
+        return bool(answer) and answer == self.questions[index]['correct_answer']
+
+    def stored_answer(self, index: int, player: int) -> Optional[str]:
+        """Odpowiedź w formacie MatchQuestion (brak odpowiedzi w czasie = DEFAULT_ANSWER)"""
+        answer = self.answer(index, player)
+        if answer is None:
+            return None
+        return answer or DEFAULT_ANSWER
+
+    def result_data(self, index: int) -> Dict:
+        """Wynik pytania w formacie MatchQuestionWithAnswerSerializer (bez answered_at - znany dopiero w bazie)"""
+        slot = self.questions[index]
+        processed = f'result:{index}' in self.claims
+        return {
+            'id': slot['id'],
+            'match': self.match_id,
+            'question': {**slot['question'], 'correct_answer': slot['correct_answer']},
+            'question_order': index,
+            'player1_answer': self.stored_answer(index, 1),
+            'player2_answer': self.stored_answer(index, 2),
+            'player1_correct': self.is_correct(index, 1) if processed else None,
+            'player2_correct': self.is_correct(index, 2) if processed else None,
+        }
+
+    def winner_id(self) -> Optional[int]:
+        if self.player1_score > self.player2_score:
+            return self.player1_id
+        if self.player2_score > self.player1_score:
+            return self.player2_id
+        return None
+
+
+@dataclass
+class AnswerCommit:
+    """Wynik commit_answers"""
+    # Czy zapisano którąkolwiek odpowiedź (False: duplikat, inne pytanie, mecz nieaktywny)
+    recorded: bool
+    # Czy ten wywołujący przejął przetworzenie wyniku pytania (punkty już naliczone)
+    claimed: bool
+    state: Optional[MatchState]
+
+
+# Pola skalarne zapisywane w hashu Redis
+_SCALAR_FIELDS = ('status', 'player1_id', 'player2_id', 'subject_id', 'current_question_index',
+                  'player1_score', 'player2_score', 'deadline')
+_INT_FIELDS = ('player1_id', 'player2_id', 'subject_id', 'current_question_index',
+               'player1_score', 'player2_score')
+
+
+def _encode(name: str, value) -> str:
+    if name == 'questions':
+        return json.dumps(value)
+    return '' if value is None else str(value)
+
+
+def _slots(match_id: int):
+    return MatchQuestion.objects.filter(match_id=match_id).select_related('question').order_by('question_order')
+
+
+def _question_entry(slot: MatchQuestion) -> Dict:
+    return {
+        'id': slot.id,
+        'question': dict(QuestionSerializer(slot.question).data),
+        'correct_answer': slot.question.correct_answer,
+    }
+
+
+def match_questions(match_id: int) -> List[Dict]:
+    """Pytania meczu w formacie MatchState.questions - jedno zapytanie"""
+    return [_question_entry(slot) for slot in _slots(match_id)]
+
+
+def build_state(match_id: int) -> Optional[MatchState]:
+    """Stan meczu odtworzony z bazy (pierwsze użycie w procesie/Redis, po restarcie)"""
+    match = Match.objects.filter(id=match_id).values(
+        'status', 'player1_id', 'player2_id', 'subject_id', 'current_question_index',
+        'player1_score', 'player2_score').first()
+    if match is None:
+        return None
+
+    state = MatchState(match_id=match_id, **match)
+    for slot in _slots(match_id):
+        state.questions.append(_question_entry(slot))
+        for player, answer in ((1, slot.player1_answer), (2, slot.player2_answer)):
+            if answer:
+                state.answers[(slot.question_order, player)] = answer
+        if slot.player1_correct is not None or slot.player2_correct is not None:
+            state.claims.add(f'result:{slot.question_order}')
+    return state
+
+
+def persist_result(state: MatchState, index: int) -> None:
+    """Zapis wyniku pytania i wyników meczu (przejście: wynik pytania)"""
+    with transaction.atomic():
+        MatchQuestion.objects.filter(id=state.questions[index]['id']).update(
+            player1_answer=state.stored_answer(index, 1),
+            player2_answer=state.stored_answer(index, 2),
+            player1_correct=state.is_correct(index, 1),
+            player2_correct=state.is_correct(index, 2),
+            answered_at=timezone.now(),
+        )
+        Match.objects.filter(id=state.match_id).update(
+            player1_score=state.player1_score,
+            player2_score=state.player2_score,
+        )
+
+
+# KEYS[1] - hash stanu meczu; ARGV: indeks pytania, ttl, potem pary gracz, odpowiedź.
+# Zwraca {zapisano, przejęto wynik, HGETALL}.
+COMMIT_ANSWERS_SCRIPT = """
+local key = KEYS[1]
+local index = ARGV[1]
+if redis.call('EXISTS', key) == 0 then
+    return {0, 0, {}}
+end
+local recorded = 0
+if redis.call('HGET', key, 'status') == 'active'
+        and redis.call('HGET', key, 'current_question_index') == index then
+    for i = 3, #ARGV, 2 do
+        recorded = recorded + redis.call('HSETNX', key, 'answer:' .. index .. ':' .. ARGV[i], ARGV[i + 1])
+    end
+end
+local claimed = 0
+local answer1 = redis.call('HGET', key, 'answer:' .. index .. ':1')
+local answer2 = redis.call('HGET', key, 'answer:' .. index .. ':2')
+if answer1 and answer2 then
+    claimed = redis.call('HSETNX', key, 'claim:result:' .. index, 1)
+    if claimed == 1 then
+        local questions = cjson.decode(redis.call('HGET', key, 'questions'))
+        local correct = questions[tonumber(index) + 1]['correct_answer']
+        if answer1 ~= '' and answer1 == correct then
+            redis.call('HINCRBY', key, 'player1_score', 1)
+        end
+        if answer2 ~= '' and answer2 == correct then
+            redis.call('HINCRBY', key, 'player2_score', 1)
+        end
+    end
+end
+redis.call('EXPIRE', key, ARGV[2])
+return {recorded, claimed, redis.call('HGETALL', key)}
+"""
+
+# Przejście tylko dla istniejącego stanu - HSETNX na wygasłym kluczu utworzyłby
+# niepełny hash bez TTL
+CLAIM_SCRIPT = """
+local key = KEYS[1]
+if redis.call('EXISTS', key) == 0 then
+    return 0
+end
+local claimed = redis.call('HSETNX', key, 'claim:' .. ARGV[1], 1)
+redis.call('EXPIRE', key, ARGV[2])
+return claimed
+"""
+
+# Zapis pól i punktów również tylko dla istniejącego stanu - spóźniony zapis po
+# delete() (koniec meczu) odtworzyłby niepełny stan.
+# ARGV: ttl, potem pary pole, wartość
+UPDATE_SCRIPT = """
+local key = KEYS[1]
+if redis.call('EXISTS', key) == 0 then
+    return 0
+end
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', key, ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', key, ARGV[1])
+return 1
+"""
+
+# ARGV: ttl, punkty gracza 1, punkty gracza 2; zwraca HGETALL (pusty bez stanu)
+ADD_SCORES_SCRIPT = """
+local key = KEYS[1]
+if redis.call('EXISTS', key) == 0 then
+    return {}
+end
+redis.call('HINCRBY', key, 'player1_score', ARGV[2])
+redis.call('HINCRBY', key, 'player2_score', ARGV[3])
+redis.call('EXPIRE', key, ARGV[1])
+return redis.call('HGETALL', key)
+"""
+
+
+class BaseMatchStateStore:
+    """Interfejs magazynu stanu meczów"""
+
+    def __init__(self, ttl: Optional[int] = None):
+        # Stan nieużywanego meczu znika po ttl sekundach (potem znowu z bazy)
+        self.ttl = ttl or getattr(settings, 'MATCH_STATE_TTL', 2 * 60 * 60)
+
+    async def get(self, match_id: int) -> Optional[MatchState]:
+        raise NotImplementedError
+
+    async def init(self, state: MatchState) -> None:
+        """Zapisz stan, jeśli jeszcze go nie ma (nie nadpisuje odpowiedzi z innych procesów)"""
+        raise NotImplementedError
+
+    async def update(self, match_id: int, **fields) -> None:
+        """Ustaw pola skalarne i/lub questions (bez stanu - nic nie robi)"""
+        raise NotImplementedError
+
+    async def commit_answers(self, match_id: int, index: int, answers: Dict[int, str]) -> AnswerCommit:
+        """
+        Atomowo: zapisz pierwsze odpowiedzi graczy ({gracz 1/2: odpowiedź}) na
+        bieżące pytanie aktywnego meczu, a gdy obaj już odpowiedzieli - przejmij
+        wynik pytania (claim result:<index>) i nalicz punkty.
+
+        Pusty answers tylko przejmuje wynik (np. odpowiedzi odtworzone z bazy).
+        """
+        raise NotImplementedError
+
+    async def add_scores(self, match_id: int, player1: int = 0, player2: int = 0) -> Optional[MatchState]:
+        """Dodaj punkty graczom; zwraca nowy stan (None bez stanu)"""
+        raise NotImplementedError
+
+    async def claim(self, match_id: int, name: str) -> bool:
+        """Jednorazowe przejście stanu - True tylko dla pierwszego wywołującego (False bez stanu)"""
+        raise NotImplementedError
+
+    async def delete(self, match_id: int) -> None:
+        raise NotImplementedError
+
+    async def load(self, match_id: int) -> Optional[MatchState]:
+        """Stan meczu; przy pierwszym użyciu odtwarzany z bazy"""
+        state = await self.get(match_id)
+        if state is not None:
+            return state
+        state = await database_sync_to_async(build_state)(match_id)
+        if state is None:
+            return None
+        await self.init(state)
+        return await self.get(match_id)
+
+
+class InMemoryMatchStateStore(BaseMatchStateStore):
+    """Stan w pamięci procesu (pojedynczy worker, testy)"""
+
+    def __init__(self, ttl: Optional[int] = None):
+        super().__init__(ttl)
+        # {match_id: (MatchState, ostatni zapis)}
+        self.states: Dict[int, Tuple[MatchState, float]] = {}
+
+    def _state(self, match_id: int) -> Optional[MatchState]:
+        entry = self.states.get(match_id)
+        if entry is None:
+            return None
+        state, touched = entry
+        if time.time() - touched > self.ttl:
+            del self.states[match_id]
+            return None
+        self.states[match_id] = (state, time.time())
+        return state
+
+    async def get(self, match_id):
+        state = self._state(match_id)
+        # Kopia - consumery nie współdzielą obiektu stanu
+        return copy.deepcopy(state) if state else None
+
+    async def init(self, state):
+        if self._state(state.match_id) is None:
+            self.states[state.match_id] = (copy.deepcopy(state), time.time())
+
+    async def update(self, match_id, **fields):
+        state = self._state(match_id)
+        if state is not None:
+            for name, value in fields.items():
+                setattr(state, name, copy.deepcopy(value))
+
+    async def commit_answers(self, match_id, index, answers):
+        state = self._state(match_id)
+        if state is None:
+            return AnswerCommit(False, False, None)
+        recorded = claimed = False
+        if state.status == 'active' and state.current_question_index == index:
+            for player, answer in answers.items():
+                if (index, player) not in state.answers:
+                    state.answers[(index, player)] = answer
+                    recorded = True
+        result = f'result:{index}'
+        if state.both_answered(index) and result not in state.claims:
+            state.claims.add(result)
+            state.player1_score += int(state.is_correct(index, 1))
+            state.player2_score += int(state.is_correct(index, 2))
+            claimed = True
+        return AnswerCommit(recorded, claimed, copy.deepcopy(state))
+
+    async def add_scores(self, match_id, player1=0, player2=0):
+        state = self._state(match_id)
+        if state is None:
+            return None
+        state.player1_score += player1
+        state.player2_score += player2
+        return copy.deepcopy(state)
+
+    async def claim(self, match_id, name):
+        state = self._state(match_id)
+        if state is None or name in state.claims:
+            return False
+        state.claims.add(name)
+        return True
+
+    async def delete(self, match_id):
+        self.states.pop(match_id, None)
+
+
+class RedisMatchStateStore(BaseMatchStateStore):
+    """
+    Stan w Redis współdzielony przez wszystkie procesy i węzły.
+
+    Jeden hash na mecz - match:state:<id>:
+    - pola skalarne (status, current_question_index, wyniki, deadline, ...)
+    - questions          JSON pytań meczu
+    - answer:<idx>:<p>   odpowiedź gracza p (HSETNX - liczy się pierwsza)
+    - claim:<name>       wykonane jednorazowe przejścia (HSETNX)
+    """
+
+    def _key(self, match_id) -> str:
+        return f'match:state:{match_id}'
+
+    def _parse(self, match_id: int, data: Dict[str, str]) -> Optional[MatchState]:
+        if not data:
+            return None
+        state = MatchState(match_id=match_id, status=data.get('status', ''), player1_id=0)
+        for name in _INT_FIELDS:
+            if data.get(name):
+                setattr(state, name, int(data[name]))
+        if data.get('deadline'):
+            state.deadline = float(data['deadline'])
+        state.questions = json.loads(data.get('questions') or '[]')
+        for name, value in data.items():
+            if name.startswith('answer:'):
+                _, index, player = name.split(':')
+                state.answers[(int(index), int(player))] = value
+            elif name.startswith('claim:'):
+                state.claims.add(name[len('claim:'):])
+        return state
+
+    async def get(self, match_id):
+        return self._parse(match_id, await get_async_redis().hgetall(self._key(match_id)))
+
+    async def init(self, state):
+        key = self._key(state.match_id)
+        async with get_async_redis().pipeline(transaction=True) as pipe:
+            for name in _SCALAR_FIELDS + ('questions',):
+                pipe.hsetnx(key, name, _encode(name, getattr(state, name)))
+            for (index, player), answer in state.answers.items():
+                pipe.hsetnx(key, f'answer:{index}:{player}', answer)
+            for name in state.claims:
+                pipe.hsetnx(key, f'claim:{name}', 1)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def update(self, match_id, **fields):
+        script = get_async_redis().register_script(UPDATE_SCRIPT)
+        args = [self.ttl]
+        for name, value in fields.items():
+            args += [name, _encode(name, value)]
+        await script(keys=[self._key(match_id)], args=args)
+
+    async def commit_answers(self, match_id, index, answers):
+        # Skrypt jest wiązany z klientem bieżącej pętli (EVALSHA, EVAL tylko przy pierwszym użyciu)
+        script = get_async_redis().register_script(COMMIT_ANSWERS_SCRIPT)
+        args = [index, self.ttl]
+        for player, answer in answers.items():
+            args += [player, answer]
+        recorded, claimed, data = await script(keys=[self._key(match_id)], args=args)
+        # HGETALL ze skryptu wraca jako płaska lista [pole, wartość, ...]
+        data = dict(zip(data[::2], data[1::2]))
+        return AnswerCommit(bool(recorded), bool(claimed), self._parse(match_id, data))
+
+    async def add_scores(self, match_id, player1=0, player2=0):
+        script = get_async_redis().register_script(ADD_SCORES_SCRIPT)
+        data = await script(keys=[self._key(match_id)], args=[self.ttl, player1, player2])
+        return self._parse(match_id, dict(zip(data[::2], data[1::2])))
+
+    async def claim(self, match_id, name):
+        script = get_async_redis().register_script(CLAIM_SCRIPT)
+        return bool(await script(keys=[self._key(match_id)], args=[name, self.ttl]))
+
+    async def delete(self, match_id):
+        await get_async_redis().delete(self._key(match_id))
+
+
+_store = None
+_store_path = None
+
+
+def get_match_state() -> BaseMatchStateStore:
+    """Zwróć magazyn stanu skonfigurowany w settings.MATCH_STATE_BACKEND"""
+    global _store, _store_path
+    path = settings.MATCH_STATE_BACKEND
+    if _store is None or _store_path != path:
+        _store = import_string(path)()
+        _store_path = path
+    return _store
@@ -0,0 +1,414 @@
+"""
+Kolejka matchmakingu - łączenie graczy w pary według rankingu.
+
+"Znajdź przeciwnika" (MatchViewSet.find) tworzy oczekujący mecz i wstawia
+bilet do kolejki (przedmiot, książka). Pętla matchmakingu (komenda
+run_matchmaking) co tick łączy w pary graczy, których różnica punktów
+UserRanking mieści się w oknie - okno rośnie z czasem oczekiwania, więc
+nikt nie czeka w nieskończoność na idealnego przeciwnika.
+
+Para przejmuje mecz starszego biletu (ten sam claim pop_pending co
+akceptacja powiadomienia, więc wygrywa tylko jedna ścieżka), drugi mecz
+jest usuwany, a obaj gracze dostają match_accepted z id wspólnego meczu.
+
+Backend Redis jest bezpieczny dla wielu procesów: bilety są zdejmowane z
+kolejki w transakcji WATCH/MULTI, więc ta sama para nie zostanie
+utworzona dwa razy. Backend w pamięci służy do testów.
+"""
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from src.db_executor import database_sync_to_async
+from src.redis_client import get_async_redis, get_redis
+
+from .models import Match, UserRanking
+from .presence import get_presence
+
+logger = logging.getLogger(__name__)
+
+QueueKey = Tuple[int, int]
+
+
+@dataclass
+class MatchmakingTicket:
+    """Gracz czekający na przeciwnika"""
+    user_id: int
+    match_id: int
+    subject_id: int
+    book_id: int
+    points: int
+    enqueued_at: float
+
+    @property
+    def queue(self) -> QueueKey:
+        return self.subject_id, self.book_id
+
+    def wait(self, now: float) -> float:
+        return max(0.0, now - self.enqueued_at)
+
+
+@dataclass
+class TickResult:
+    """Wynik jednego ticku kolejki"""
+    pairs: List[Tuple[MatchmakingTicket, MatchmakingTicket]]
+    expired: List[MatchmakingTicket]
+
+
+def rating_window(wait: float) -> float:
+    """Dopuszczalna różnica punktów po wait sekundach oczekiwania"""
+    return min(
+        settings.MATCHMAKING_MAX_WINDOW,
+        settings.MATCHMAKING_BASE_WINDOW + settings.MATCHMAKING_WINDOW_GROWTH * wait,
+    )
+
+
+def pair_tickets(tickets: List[MatchmakingTicket], now: float) -> TickResult:
+    """
+    Połącz bilety jednej kolejki w pary.
+
+    Najdłużej czekający wybierają pierwsi - każdy dostaje najbliższego
+    punktowo wolnego gracza w oknie (szerszym z okien obu graczy).
+    Bilety starsze niż MATCHMAKING_MAX_WAIT wygasają.
+    """
+    max_wait = settings.MATCHMAKING_MAX_WAIT
+    expired = [ticket for ticket in tickets if ticket.wait(now) >= max_wait]
+    waiting = sorted(
+        (ticket for ticket in tickets if ticket.wait(now) < max_wait),
+        key=lambda ticket: ticket.enqueued_at,
+    )
+
+    pairs = []
+    paired = set()
+    for ticket in waiting:
+        if ticket.user_id in paired:
+            continue
+        best = None
+        for other in waiting:
+            if other.user_id == ticket.user_id or other.user_id in paired:
+                continue
+            diff = abs(ticket.points - other.points)
+            if diff > max(rating_window(ticket.wait(now)), rating_window(other.wait(now))):
+                continue
+            if best is None or diff < abs(ticket.points - best.points):
+                best = other
+        if best is not None:
+            paired.update((ticket.user_id, best.user_id))
+            pairs.append((ticket, best))
+    return TickResult(pairs=pairs, expired=expired)
+
+
+class BaseMatchmakingQueue:
+    """Interfejs kolejki matchmakingu"""
+
+    def enqueue(self, ticket: MatchmakingTicket) -> None:
+        """Wstaw (lub zastąp) bilet gracza w kolejce (przedmiot, książka)"""
+        raise NotImplementedError
+
+    def remove(self, subject_id: int, book_id: int, user_id: int) -> bool:
+        raise NotImplementedError
+
+    async def aremove(self, subject_id: int, book_id: int, user_id: int) -> bool:
+        """Asynchroniczna wersja remove (consumery WebSocket)"""
+        raise NotImplementedError
+
+    def tickets(self, subject_id: int, book_id: int) -> List[MatchmakingTicket]:
+        raise NotImplementedError
+
+    def queues(self) -> List[QueueKey]:
+        """Kolejki z co najmniej jednym biletem"""
+        raise NotImplementedError
+
+    def tick_queue(self, subject_id: int, book_id: int, now: float) -> TickResult:
+        """Zdejmij z kolejki utworzone pary i wygasłe bilety"""
+        raise NotImplementedError
+
+    def record_pair(self, waits: List[float]) -> None:
+        raise NotImplementedError
+
+    def record_expired(self, count: int) -> None:
+        raise NotImplementedError
+
+    def counters(self) -> Dict[str, float]:
+        raise NotImplementedError
+
+    def tick(self, now: Optional[float] = None) -> TickResult:
+        """Jeden tick wszystkich kolejek"""
+        now = time.time() if now is None else now
+        result = TickResult(pairs=[], expired=[])
+        for subject_id, book_id in self.queues():
+            queue_result = self.tick_queue(subject_id, book_id, now)
+            result.pairs.extend(queue_result.pairs)
+            result.expired.extend(queue_result.expired)
+        # Pary są liczone w statystykach dopiero po utworzeniu meczu (complete_tick)
+        if result.expired:
+            self.record_expired(len(result.expired))
+        return result
+
+    def stats(self, now: Optional[float] = None) -> Dict:
+        """Głębokość kolejek, najdłuższe oczekiwanie i czasy oczekiwania sparowanych graczy"""
+        now = time.time() if now is None else now
+        queues = {}
+        for subject_id, book_id in self.queues():
+            tickets = self.tickets(subject_id, book_id)
+            queues[f'{subject_id}:{book_id}'] = {
+                'depth': len(tickets),
+                'oldest_wait': round(max((ticket.wait(now) for ticket in tickets), default=0.0), 1),
+            }
+        counters = self.counters()
+        paired = int(counters.get('paired_players', 0))
+        return {
+            'queues': queues,
+            'waiting': sum(queue['depth'] for queue in queues.values()),
+            'paired_players': paired,
+            'expired': int(counters.get('expired', 0)),
+            'mean_wait': round(counters.get('wait_total', 0.0) / paired, 2) if paired else 0.0,
+            'max_wait': round(counters.get('wait_max', 0.0), 2),
+        }
+
+
+class InMemoryMatchmakingQueue(BaseMatchmakingQueue):
+    """Kolejka w pamięci procesu (testy, pojedynczy proces)"""
+
+    def __init__(self):
+        self._queues: Dict[QueueKey, Dict[int, MatchmakingTicket]] = {}
+        self._counters: Dict[str, float] = {}
+
+    def enqueue(self, ticket):
+        self._queues.setdefault(ticket.queue, {})[ticket.user_id] = ticket
+
+    def remove(self, subject_id, book_id, user_id):
+        queue = self._queues.get((subject_id, book_id), {})
+        return queue.pop(user_id, None) is not None
+
+    async def aremove(self, subject_id, book_id, user_id):
+        return self.remove(subject_id, book_id, user_id)
+
+    def tickets(self, subject_id, book_id):
+        return list(self._queues.get((subject_id, book_id), {}).values())
+
+    def queues(self):
+        return [key for key, queue in self._queues.items() if queue]
+
+    def tick_queue(self, subject_id, book_id, now):
+        result = pair_tickets(self.tickets(subject_id, book_id), now)
+        for ticket in result.expired + [ticket for pair in result.pairs for ticket in pair]:
+            self.remove(subject_id, book_id, ticket.user_id)
+        return result
+
+    def record_pair(self, waits):
+        self._counters['paired_players'] = self._counters.get('paired_players', 0) + len(waits)
+        self._counters['wait_total'] = self._counters.get('wait_total', 0.0) + sum(waits)
+        self._counters['wait_max'] = max([self._counters.get('wait_max', 0.0), *waits])
+
+    def record_expired(self, count):
+        self._counters['expired'] = self._counters.get('expired', 0) + count
+
+    def counters(self):
+        return dict(self._counters)
+
+
+class RedisMatchmakingQueue(BaseMatchmakingQueue):
+    """
+    Kolejka w Redis współdzielona przez wszystkie procesy.
+
+    Klucze:
+    - matchmaking:queues               SET "subject:book" niepustych kolejek
+    - matchmaking:queue:<s>:<b>        HASH user_id -> JSON biletu
+    - matchmaking:stats                HASH liczników (sparowani, wygasłe, czasy oczekiwania)
+    """
+    QUEUES_KEY = 'matchmaking:queues'
+    STATS_KEY = 'matchmaking:stats'
+
+    def _queue_key(self, subject_id, book_id) -> str:
+        return f'matchmaking:queue:{subject_id}:{book_id}'
+
+    def enqueue(self, ticket):
+        with get_redis().pipeline(transaction=True) as pipe:
+            pipe.hset(self._queue_key(*ticket.queue), ticket.user_id, json.dumps(asdict(ticket)))
+            pipe.sadd(self.QUEUES_KEY, f'{ticket.subject_id}:{ticket.book_id}')
+            pipe.execute()
+
+    def remove(self, subject_id, book_id, user_id):
+        return bool(get_redis().hdel(self._queue_key(subject_id, book_id), user_id))
+
+    async def aremove(self, subject_id, book_id, user_id):
+        return bool(await get_async_redis().hdel(self._queue_key(subject_id, book_id), user_id))
+
+    def tickets(self, subject_id, book_id):
+        payloads = get_redis().hvals(self._queue_key(subject_id, book_id))
+        return [MatchmakingTicket(**json.loads(payload)) for payload in payloads]
+
+    def queues(self):
+        return [
+            tuple(int(part) for part in member.split(':'))
+            for member in get_redis().smembers(self.QUEUES_KEY)
+        ]
+
+    def tick_queue(self, subject_id, book_id, now):
+        key = self._queue_key(subject_id, book_id)
+        with get_redis().pipeline(transaction=True) as pipe:
+            try:
+                # Bilet dodany lub usunięty w trakcie ticku (inny worker, akceptacja)
+                # przerywa transakcję - kolejka zostanie sparowana w następnym ticku
+                pipe.watch(key)
+                tickets = [MatchmakingTicket(**json.loads(payload)) for payload in pipe.hvals(key)]
+                result = pair_tickets(tickets, now)
+                removed = result.expired + [ticket for pair in result.pairs for ticket in pair]
+                pipe.multi()
+                if removed:
+                    pipe.hdel(key, *[ticket.user_id for ticket in removed])
+                if len(removed) == len(tickets):
+                    pipe.srem(self.QUEUES_KEY, f'{subject_id}:{book_id}')
+                pipe.execute()
+            except redis.WatchError:
+                return TickResult(pairs=[], expired=[])
+        return result
+
+    def record_pair(self, waits):
+        with get_redis().pipeline(transaction=False) as pipe:
+            pipe.hincrby(self.STATS_KEY, 'paired_players', len(waits))
+            pipe.hincrbyfloat(self.STATS_KEY, 'wait_total', sum(waits))
+            pipe.execute()
+        # Maksimum bez skryptu - wyścig między workerami najwyżej zaniży wartość
+        current = float(get_redis().hget(self.STATS_KEY, 'wait_max') or 0)
+        if max(waits) > current:
+            get_redis().hset(self.STATS_KEY, 'wait_max', max(waits))
+
+    def record_expired(self, count):
+        get_redis().hincrby(self.STATS_KEY, 'expired', count)
+
+    def counters(self):
+        return {name: float(value) for name, value in get_redis().hgetall(self.STATS_KEY).items()}
+
+
+_matchmaking = None
+_matchmaking_path = None
+
+
+def get_matchmaking() -> BaseMatchmakingQueue:
+    """Zwróć kolejkę skonfigurowaną w settings.MATCHMAKING_BACKEND"""
+    global _matchmaking, _matchmaking_path
+    path = settings.MATCHMAKING_BACKEND
+    if _matchmaking is None or _matchmaking_path != path:
+        _matchmaking = import_string(path)()
+        _matchmaking_path = path
+    return _matchmaking
+
+
+def enqueue_match(match: Match) -> MatchmakingTicket:
+    """Wstaw gracza 1 oczekującego meczu do kolejki (punkty z UserRanking przedmiotu)"""
+    ranking = UserRanking.objects.filter(user_id=match.player1_id, subject_id=match.subject_id).first()
+    ticket = MatchmakingTicket(
+        user_id=match.player1_id,
+        match_id=match.id,
+        subject_id=match.subject_id,
+        book_id=match.book_id,
+        points=ranking.points if ranking else 0,
+        enqueued_at=time.time(),
+    )
+    get_matchmaking().enqueue(ticket)
+    return ticket
+
+
+def _assign_pair(host: MatchmakingTicket, guest: MatchmakingTicket) -> bool:
+    """Gość zostaje graczem 2 meczu gospodarza; jego własny oczekujący mecz jest usuwany"""
+    with transaction.atomic():
+        updated = Match.objects.filter(
+            id=host.match_id, status='waiting', player2__isnull=True,
+        ).update(player2_id=guest.user_id, status='ready')
+        if not updated:
+            return False
+        Match.objects.filter(id=guest.match_id, status='waiting', player2__isnull=True).delete()
+    return True
+
+
+async def _requeue(ticket: MatchmakingTicket, pending: Dict) -> None:
+    """Przywróć przejęty pending meczu (z pozostałym czasem oczekiwania) i bilet w kolejce"""
+    from .notification_consumer import PENDING_TIMEOUT
+
+    remaining = max(1, int(PENDING_TIMEOUT - ticket.wait(time.time())))
+    pending = {key: value for key, value in pending.items() if key != 'created_at'}
+    await get_presence().add_pending('match', ticket.match_id, pending, timeout=remaining)
+    get_matchmaking().enqueue(ticket)
+
+
+async def complete_pair(host: MatchmakingTicket, guest: MatchmakingTicket) -> bool:
+    """
+    Utwórz mecz z pary zdjętej z kolejki (host czekał dłużej).
+
+    Oba mecze są przejmowane przez pop_pending - tak samo jak akceptacja
+    powiadomienia - więc para i akceptacja nie mogą wygrać jednocześnie.
+    Gracz, którego mecz został w międzyczasie przejęty, wypada z pary, a
+    drugi wraca do kolejki. Błąd zapisu meczu przywraca obu graczy
+    (pending i bilety) i jest przekazywany dalej.
+    """
+    from channels.layers import get_channel_layer
+    from .notification_consumer import NotificationConsumer
+
+    presence = get_presence()
+    host_pending = await presence.pop_pending('match', host.match_id)
+    if not host_pending:
+        get_matchmaking().enqueue(guest)
+        return False
+    guest_pending = await presence.pop_pending('match', guest.match_id)
+    if not guest_pending:
+        await _requeue(host, host_pending)
+        return False
+    try:
+        assigned = await database_sync_to_async(_assign_pair)(host, guest)
+    except Exception:
+        await _requeue(host, host_pending)
+        await _requeue(guest, guest_pending)
+        raise
+    if not assigned:
+        # Mecz gospodarza nie czeka już na gracza (anulowany) - wraca tylko gość
+        await _requeue(guest, guest_pending)
+        return False
+    # Obaj gracze przechodzą do meczu gospodarza (match:accepted w NotificationConsumer)
+    channel_layer = get_channel_layer()
+    for player, opponent in ((host, guest), (guest, host)):
+        await channel_layer.group_send(
+            f'user_{player.user_id}',
+            {
+                'type': 'match_accepted',
+                'match_id': host.match_id,
+                'opponent': await NotificationConsumer.get_user_data(opponent.user_id),
+            }
+        )
+    logger.info('Matched users %s (%s pts) and %s (%s pts) in match %s',
+                host.user_id, host.points, guest.user_id, guest.points, host.match_id)
+    return True
+
+
+async def complete_tick(result: TickResult) -> int:
+    """Dokończ pary i wygasłe bilety z ticku; zwraca liczbę utworzonych meczów"""
+    from .notification_consumer import match_pending_expired
+
+    queue = get_matchmaking()
+    for ticket in result.expired:
+        # Idempotentne z timeoutem powiadomienia - mecz usuwa ten, kto pierwszy przejmie pending
+        try:
+            await match_pending_expired(ticket.match_id, ticket.user_id)
+        except Exception:
+            logger.exception('Expiring match %s failed', ticket.match_id)
+    created = 0
+    for host, guest in result.pairs:
+        # Błąd jednej pary nie przerywa pozostałych
+        try:
+            if not await complete_pair(host, guest):
+                continue
+        except Exception:
+            logger.exception('Pairing matches %s and %s failed', host.match_id, guest.match_id)
+            continue
+        now = time.time()
+        queue.record_pair([host.wait(now), guest.wait(now)])
+        created += 1
+    return created
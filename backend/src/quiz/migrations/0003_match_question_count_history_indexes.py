@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:35
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+
+
+def fill_question_count(apps, schema_editor):
+    Match = apps.get_model('quiz', 'Match')
+    MatchQuestion = apps.get_model('quiz', 'MatchQuestion')
+    counts = (
+        MatchQuestion.objects.filter(match=OuterRef('pk'))
+        .order_by().values('match').annotate(count=Count('id')).values('count')
+    )
+    Match.objects.filter(id__in=MatchQuestion.objects.values('match_id')).update(question_count=Subquery(counts))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0002_match_question_benefit_matchquestion_userranking'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='question_count',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_question_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['player1', '-created_at', '-id'], name='quiz_match_player1_created'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['player2', '-created_at', '-id'], name='quiz_match_player2_created'),
+        ),
+    ]
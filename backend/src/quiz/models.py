@@ -94,12 +94,19 @@ class Match(models.Model):
         blank=True,
         related_name='won_matches'
     )
+    # Liczba slotów MatchQuestion (zapisywana przy seedowaniu pytań)
+    question_count = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     started_at = models.DateTimeField(null=True, blank=True)
     finished_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-created_at']
+        # Historia meczów gracza (match_history) - stronicowanie po (created_at, id)
+        indexes = [
+            models.Index(fields=['player1', '-created_at', '-id'], name='quiz_match_player1_created'),
+            models.Index(fields=['player2', '-created_at', '-id'], name='quiz_match_player2_created'),
+        ]
 
     def __str__(self):
         return f"Match {self.id}: {self.player1} vs {self.player2 or 'Waiting...'}"
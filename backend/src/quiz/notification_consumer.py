@@ -6,97 +6,82 @@ Obsługuje:
 - Zaproszenia do meczów
 """
 import json
-import asyncio
-from datetime import datetime, timedelta
+import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from jwt import decode as jwt_decode
 from django.conf import settings
-from typing import Dict, Set, Optional
-from collections import defaultdict
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from typing import List
+from src.db_executor import DatabaseLaneMixin, database_sync_to_async
+from src.encoding import JSONFrameMixin
 
 from .models import Match, UserRanking, Book, Subject
-from auth_api.serializers import UserSerializer
+from .matchmaking import get_matchmaking
+from .presence import get_presence
+from .scheduler import cancel_heartbeat, get_scheduler, schedule_heartbeat
+from .log import match_logger
+from .user_summary import get_user_summary
 
 User = get_user_model()
 
-# Globalne struktury danych (w produkcji użyj Redis)
-# {user_id: {channel_name, last_seen, user_data}}
-active_users: Dict[int, Dict] = {}
-# {match_id: {player1_id, book_id, subject_id, created_at, timeout_task}}
-pending_matches: Dict[int, Dict] = {}
-# {match_id: {player1_id, player2_id, created_at, timeout_task}}
-pending_invites: Dict[int, Dict] = {}
+logger = logging.getLogger(__name__)
+
+# Czas na akceptację meczu/zaproszenia (sekundy)
+PENDING_TIMEOUT = 60
+
+# Obecność i oczekujące mecze są w rejestrze (quiz.presence) współdzielonym przez workery.
+# Lokalnie (harmonogram workera, quiz.scheduler) są tylko terminy wygaśnięcia
+# utworzone w tym procesie, z kluczami ('pending', kind, match_id).
+
+
+def subject_group_name(subject_id: int) -> str:
+    """Grupa powiadomień o meczach z danego przedmiotu"""
+    return f'subject_{subject_id}'
+
+
+def interest_subject_ids(user_id: int) -> List[int]:
+    """
+    Przedmioty, z których użytkownik dostaje powiadomienia o meczach.
+
+    Przedmioty, w których gracz ma ranking (grał mecze); nowy gracz bez
+    rankingu dostaje powiadomienia z NOTIFICATION_FALLBACK_SUBJECTS
+    przedmiotów o największej liczbie graczy. Przedmiot pierwszego meczu
+    dochodzi do subskrypcji bez ponownego połączenia (subject_ranked).
+    """
+    subject_ids = list(
+        UserRanking.objects.filter(user_id=user_id).values_list('subject_id', flat=True)
+    )
+    if not subject_ids:
+        subject_ids = list(
+            Subject.objects.annotate(players=Count('rankings'))
+            .order_by('-players', 'id')
+            .values_list('id', flat=True)[:settings.NOTIFICATION_FALLBACK_SUBJECTS]
+        )
+    return subject_ids
+
+
+def _cancel_timeout_task(kind: str, match_id: int):
+    """Anuluj lokalny termin wygaśnięcia (jeśli został utworzony w tym procesie)"""
+    get_scheduler().cancel(('pending', kind, match_id))
 
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+class NotificationConsumer(DatabaseLaneMixin, JSONFrameMixin, AsyncWebsocketConsumer):
     """Consumer dla powiadomień i aktywnych użytkowników"""
 
     async def connect(self):
         """Połączenie WebSocket z autentykacją JWT"""
-        # Autentykacja przez JWT token w query string
-        query_string = self.scope.get('query_string', b'').decode()
-
-        # Parsuj query string
-        token = None
-        if query_string:
-            params = query_string.split('&')
-            for param in params:
-                if param.startswith('token='):
-                    token = param.split('=', 1)[1]
-                    break
-
-        if not token:
-            print(f"NotificationConsumer: No token provided. Query string: {query_string}")
+        # Logger z kontekstem użytkownika (uzupełniany po autentykacji)
+        self.log = match_logger(logger)
+        # Użytkownik z JWTAuthMiddleware (token z query string)
+        self.user = self.scope.get('user')
+        if not self.user or not self.user.is_authenticated:
+            self.log.info('Authentication failed: %s', self.scope.get('auth_error'))
             await self.close(code=4001)  # 4001 = Unauthorized
             return
 
-        try:
-            # Weryfikacja tokena - najpierw sprawdź czy token jest poprawny
-            validated_token = UntypedToken(token)
-
-            # Dekoduj token
-            decoded_data = jwt_decode(
-                token, settings.SECRET_KEY, algorithms=["HS256"])
-            user_id = decoded_data.get('user_id')
-
-            if not user_id:
-                print(f"NotificationConsumer: No user_id in token. Decoded: {decoded_data}")
-                await self.close(code=4001)
-                return
-
-            # Pobierz użytkownika
-            self.user = await self.get_user(user_id)
-            if not self.user:
-                print(f"NotificationConsumer: User {user_id} not found in database")
-                await self.close(code=4001)
-                return
-
-            if not self.user.is_active:
-                print(f"NotificationConsumer: User {user_id} is not active")
-                await self.close(code=4001)
-                return
-
-            self.user_id = user_id
-            print(f"NotificationConsumer: User {user_id} ({self.user.email}) authenticated successfully")
-
-        except TokenError as e:
-            print(f"NotificationConsumer: TokenError: {str(e)}")
-            await self.close(code=4001)
-            return
-        except InvalidToken as e:
-            print(f"NotificationConsumer: InvalidToken: {str(e)}")
-            await self.close(code=4001)
-            return
-        except Exception as e:
-            import traceback
-            print(f"NotificationConsumer: Exception during auth: {type(e).__name__}: {str(e)}")
-            print(traceback.format_exc())
-            await self.close(code=4001)
-            return
+        self.user_id = self.user.id
+        self.log.extra['user_id'] = self.user_id
+        self.log.debug('Authenticated successfully')
 
         # Dołącz do grupy użytkownika (dla powiadomień)
         self.user_group_name = f'user_{self.user_id}'
@@ -106,6 +91,14 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         self.active_users_group = 'active_users'
         await self.channel_layer.group_add(self.active_users_group, self.channel_name)
 
+        # Dołącz do grup przedmiotów - powiadomienia o meczach trafiają tylko do zainteresowanych
+        self.subject_groups = [
+            subject_group_name(subject_id)
+            for subject_id in await database_sync_to_async(interest_subject_ids)(self.user_id)
+        ]
+        for group_name in self.subject_groups:
+            await self.channel_layer.group_add(group_name, self.channel_name)
+
         # Zarejestruj użytkownika jako aktywnego
         await self.register_active_user()
 
@@ -114,20 +107,21 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         # Wyślij listę aktywnych użytkowników
         await self.send_active_users_list()
 
-        # Rozpocznij heartbeat loop
-        self._heartbeat_task = asyncio.create_task(self.heartbeat_loop())
+        # Heartbeat w harmonogramie workera
+        schedule_heartbeat(self.channel_name)
 
     async def disconnect(self, close_code):
         """Rozłączenie - usuń użytkownika z aktywnych"""
-        # Anuluj heartbeat loop
-        if hasattr(self, '_heartbeat_task'):
-            self._heartbeat_task.cancel()
+        # Anuluj heartbeat
+        cancel_heartbeat(self.channel_name)
 
         await self.unregister_active_user()
         if hasattr(self, 'user_group_name'):
             await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
         if hasattr(self, 'active_users_group'):
             await self.channel_layer.group_discard(self.active_users_group, self.channel_name)
+        for group_name in getattr(self, 'subject_groups', []):
+            await self.channel_layer.group_discard(group_name, self.channel_name)
 
     async def receive(self, text_data):
         """Odbieranie wiadomości od klienta"""
@@ -150,7 +144,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                 match_id = data.get('match_id')
                 await self.handle_invite_decline(match_id)
         except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({'type': 'error', 'message': 'Invalid JSON'}))
+            await self.send_json({'type': 'error', 'message': 'Invalid JSON'})
 
     # Event handlers
 
@@ -160,9 +154,17 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
     async def handle_match_accept(self, match_id: int):
         """Gracz zaakceptował mecz"""
-        if match_id in pending_matches:
-            match_data = pending_matches[match_id]
+        presence = get_presence()
+        match_data = await presence.get_pending('match', match_id)
+        if match_data:
             if match_data['player1_id'] != self.user_id:
+                # Przejmij mecz atomowo - inny gracz (lub timeout) mógł być szybszy
+                if not await presence.pop_pending('match', match_id):
+                    return
+                _cancel_timeout_task('match', match_id)
+                # Gracz 1 nie czeka już w kolejce matchmakingu
+                await get_matchmaking().aremove(
+                    match_data['subject_id'], match_data['book_id'], match_data['player1_id'])
                 # Zaktualizuj istniejący mecz zamiast tworzyć nowy
                 try:
                     match = await database_sync_to_async(Match.objects.get)(id=match_id)
@@ -170,11 +172,6 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                     match.status = 'ready'
                     await database_sync_to_async(match.save)()
 
-                    # Anuluj timeout
-                    if 'timeout_task' in match_data:
-                        match_data['timeout_task'].cancel()
-                    del pending_matches[match_id]
-
                     # Powiadom obu graczy
                     opponent_data = await NotificationConsumer.get_user_data(self.user_id)
                     await self.channel_layer.group_send(
@@ -185,21 +182,21 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                             'opponent': opponent_data,
                         }
                     )
-                    await self.send(text_data=json.dumps({
+                    await self.send_json({
                         'type': 'match:accepted',
                         'match_id': match.id,
-                    }))
-                except Exception as e:
-                    print(f"Error accepting match: {e}")
-                    await self.send(text_data=json.dumps({
+                    })
+                except Exception:
+                    self.log.exception('Error accepting match %s', match_id)
+                    await self.send_json({
                         'type': 'error',
                         'message': 'Nie udało się zaakceptować meczu',
-                    }))
+                    })
 
     async def handle_match_decline(self, match_id: int):
         """Gracz odrzucił mecz"""
-        if match_id in pending_matches:
-            match_data = pending_matches[match_id]
+        match_data = await get_presence().get_pending('match', match_id)
+        if match_data:
             # Powiadom gracza 1
             opponent_data = await NotificationConsumer.get_user_data(self.user_id)
             await self.channel_layer.group_send(
@@ -213,20 +210,20 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
     async def handle_invite_accept(self, match_id: int):
         """Gracz zaakceptował zaproszenie"""
-        if match_id in pending_invites:
-            invite_data = pending_invites[match_id]
+        presence = get_presence()
+        invite_data = await presence.get_pending('invite', match_id)
+        if invite_data:
             if invite_data['player2_id'] == self.user_id:
+                # Przejmij zaproszenie atomowo (wyścig z timeoutem)
+                if not await presence.pop_pending('invite', match_id):
+                    return
+                _cancel_timeout_task('invite', match_id)
                 # Zaktualizuj mecz
                 try:
                     match = await database_sync_to_async(Match.objects.get)(id=match_id)
                     match.status = 'ready'
                     await database_sync_to_async(match.save)()
 
-                    # Anuluj timeout
-                    if 'timeout_task' in invite_data:
-                        invite_data['timeout_task'].cancel()
-                    del pending_invites[match_id]
-
                     # Powiadom gracza 1
                     await self.channel_layer.group_send(
                         f'user_{invite_data["player1_id"]}',
@@ -235,26 +232,27 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                             'match_id': match_id,
                         }
                     )
-                    await self.send(text_data=json.dumps({
+                    await self.send_json({
                         'type': 'invite:accepted',
                         'match_id': match_id,
-                    }))
-                except Exception as e:
-                    print(f"Error accepting invite: {e}")
-                    await self.send(text_data=json.dumps({
+                    })
+                except Exception:
+                    self.log.exception('Error accepting invite %s', match_id)
+                    await self.send_json({
                         'type': 'error',
                         'message': 'Nie udało się zaakceptować zaproszenia',
-                    }))
+                    })
 
     async def handle_invite_decline(self, match_id: int):
         """Gracz odrzucił zaproszenie"""
-        if match_id in pending_invites:
-            invite_data = pending_invites[match_id]
+        presence = get_presence()
+        invite_data = await presence.get_pending('invite', match_id)
+        if invite_data:
             if invite_data['player2_id'] == self.user_id:
+                if not await presence.pop_pending('invite', match_id):
+                    return
                 # Anuluj timeout
-                if 'timeout_task' in invite_data:
-                    invite_data['timeout_task'].cancel()
-                del pending_invites[match_id]
+                _cancel_timeout_task('invite', match_id)
 
                 # Powiadom gracza 1
                 await self.channel_layer.group_send(
@@ -270,11 +268,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
     async def register_active_user(self):
         """Zarejestruj użytkownika jako aktywnego"""
         user_data = await NotificationConsumer.get_user_data(self.user_id)
-        active_users[self.user_id] = {
-            'channel_name': self.channel_name,
-            'last_seen': datetime.now(),
-            'user_data': user_data,
-        }
+        await get_presence().add_user(self.user_id, self.channel_name, user_data)
         # Powiadom innych o nowym aktywnym użytkowniku
         await self.channel_layer.group_send(
             self.active_users_group,
@@ -286,8 +280,9 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
     async def unregister_active_user(self):
         """Usuń użytkownika z aktywnych"""
-        if self.user_id in active_users:
-            del active_users[self.user_id]
+        if not hasattr(self, 'user_id'):
+            return
+        if await get_presence().remove_user(self.user_id):
             # Powiadom innych o opuszczeniu
             await self.channel_layer.group_send(
                 self.active_users_group,
@@ -299,152 +294,132 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
     async def update_last_seen(self):
         """Aktualizuj last_seen użytkownika"""
-        if self.user_id in active_users:
-            active_users[self.user_id]['last_seen'] = datetime.now()
+        await get_presence().touch(self.user_id)
 
     async def send_active_users_list(self):
         """Wyślij listę aktywnych użytkowników"""
-        # Filtruj nieaktywnych (ostatnia aktywność > 5 minut temu)
-        cutoff = datetime.now() - timedelta(minutes=5)
-        active = [
-            user_data['user_data']
-            for user_data in active_users.values()
-            if user_data['last_seen'] > cutoff and user_data['user_data']['id'] != self.user_id
-        ]
+        # Rejestr pomija nieaktywnych (ostatnia aktywność starsza niż PRESENCE_TTL)
+        active = await get_presence().active_users_data(exclude_user_id=self.user_id)
 
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'active_users',
             'users': active,
-        }))
-
-    @database_sync_to_async
-    def get_user(self, user_id):
-        """Pobierz użytkownika"""
-        try:
-            return User.objects.get(id=user_id)
-        except User.DoesNotExist:
-            return None
+        })
 
     @staticmethod
     @database_sync_to_async
     def get_user_data(user_id):
-        """Pobierz dane użytkownika z rankingiem"""
-        try:
-            user = User.objects.get(id=user_id)
-            # Pobierz najlepszy ranking
-            best_ranking = UserRanking.objects.filter(
-                user=user).order_by('-points').first()
-            serializer = UserSerializer(user)
-            data = serializer.data
-            if best_ranking:
-                data['best_ranking'] = {
-                    'points': best_ranking.points,
-                    'subject': best_ranking.subject.name,
-                }
-            return data
-        except User.DoesNotExist:
-            return None
+        """Pobierz dane użytkownika z rankingiem (karta z cache)"""
+        return get_user_summary(user_id)
 
     # WebSocket event handlers (wysyłane do klientów)
 
     async def user_joined(self, event):
         """Nowy aktywny użytkownik"""
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'user:joined',
             'user': event['user'],
-        }))
+        })
 
     async def user_left(self, event):
         """Użytkownik opuścił platformę"""
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'user:left',
             'user_id': event['user_id'],
-        }))
+        })
+
+    async def subject_ranked(self, event):
+        """Gracz dostał ranking w nowym przedmiocie - dołącz do jego grupy powiadomień"""
+        group_name = subject_group_name(event['subject_id'])
+        if group_name not in self.subject_groups:
+            self.subject_groups.append(group_name)
+            await self.channel_layer.group_add(group_name, self.channel_name)
 
     async def match_notification(self, event):
         """Powiadomienie o możliwości gry"""
-        await self.send(text_data=json.dumps({
+        # Grupa przedmiotu obejmuje też gracza, który szuka meczu
+        if event['player1_id'] == self.user_id:
+            return
+        await self.send_json({
             'type': 'match:notification',
             'match_id': event['match_id'],
             'player': event['player'],
             'book': event['book'],
             'subject': event['subject'],
-            'timeout': 60,
-        }))
+            'timeout': PENDING_TIMEOUT,
+        })
 
     async def match_accepted(self, event):
         """Mecz został zaakceptowany"""
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'match:accepted',
             'match_id': event['match_id'],
             'opponent': event['opponent'],
-        }))
+        })
 
     async def match_declined(self, event):
         """Mecz został odrzucony"""
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'match:declined',
             'match_id': event['match_id'],
             'opponent': event['opponent'],
-        }))
+        })
 
     async def match_timeout(self, event):
         """Timeout meczu"""
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'match:timeout',
             'match_id': event['match_id'],
-        }))
+        })
 
     async def invite_notification(self, event):
         """Powiadomienie o zaproszeniu"""
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'invite:notification',
             'match_id': event['match_id'],
             'player': event['player'],
             'book': event['book'],
             'subject': event['subject'],
-            'timeout': 60,
-        }))
+            'timeout': PENDING_TIMEOUT,
+        })
 
     async def invite_accepted(self, event):
         """Zaproszenie zostało zaakceptowane"""
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'invite:accepted',
             'match_id': event['match_id'],
-        }))
+        })
 
     async def invite_declined(self, event):
         """Zaproszenie zostało odrzucone"""
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'invite:declined',
             'match_id': event['match_id'],
-        }))
+        })
 
     async def invite_timeout(self, event):
         """Timeout zaproszenia"""
-        await self.send(text_data=json.dumps({
+        await self.send_json({
             'type': 'invite:timeout',
             'match_id': event['match_id'],
-        }))
+        })
 
-    async def heartbeat_loop(self):
-        """Pętla heartbeat - wysyła ping co 30 sekund"""
-        try:
-            while True:
-                await asyncio.sleep(30)
-                await self.send(text_data=json.dumps({
-                    'type': 'ping',
-                }))
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            print(f"Heartbeat loop error: {e}")
+    async def heartbeat(self, event):
+        """Ping z harmonogramu (co HEARTBEAT_INTERVAL sekund)"""
+        await self.send_json({
+            'type': 'ping',
+        })
 
 
 # Helper functions dla matchmakingu
 
 async def send_match_notification(match_id: int, player1_id: int, book_id: int, subject_id: int):
-    """Wyślij powiadomienie o możliwości gry do aktywnych użytkowników"""
+    """
+    Wyślij powiadomienie o możliwości gry do graczy zainteresowanych przedmiotem.
+
+    Jeden group_send do grupy przedmiotu (subject_group_name) zamiast osobnej
+    publikacji dla każdego aktywnego użytkownika.
+    """
     from channels.layers import get_channel_layer
     channel_layer = get_channel_layer()
 
@@ -456,62 +431,38 @@ async def send_match_notification(match_id: int, player1_id: int, book_id: int,
     if not player1_data:
         return
 
-    # Wyślij do wszystkich aktywnych użytkowników (oprócz gracza 1)
-    cutoff = datetime.now() - timedelta(minutes=5)
-    active_user_ids = [
-        user_id for user_id, user_data in active_users.items()
-        if user_data['last_seen'] > cutoff and user_id != player1_id
-    ]
-
-    for user_id in active_user_ids:
-        await channel_layer.group_send(
-            f'user_{user_id}',
-            {
-                'type': 'match_notification',
-                'match_id': match_id,
-                'player': player1_data,
-                'book': {
-                    'id': book.id,
-                    'title': book.title,
-                    'author': book.author,
-                },
-                'subject': {
-                    'id': subject.id,
-                    'name': subject.name,
-                    'color': subject.color,
-                },
-            }
-        )
-
-    # Utwórz timeout task
-    async def timeout_handler():
-        await asyncio.sleep(60)
-        if match_id in pending_matches:
-            # Anuluj mecz
-            await channel_layer.group_send(
-                f'user_{player1_id}',
-                {
-                    'type': 'match_timeout',
-                    'match_id': match_id,
-                }
-            )
-            # Usuń mecz z bazy jeśli istnieje
-            try:
-                match = await database_sync_to_async(Match.objects.get)(id=match_id)
-                if match.status == 'waiting' and not match.player2_id:
-                    await database_sync_to_async(match.delete)()
-            except:
-                pass
-            del pending_matches[match_id]
-
-    timeout_task = asyncio.create_task(timeout_handler())
-    pending_matches[match_id] = {
+    # Zarejestruj oczekujący mecz przed wysłaniem powiadomień (akceptacja może przyjść od razu)
+    presence = get_presence()
+    await presence.add_pending('match', match_id, {
         'player1_id': player1_id,
         'book_id': book_id,
         'subject_id': subject_id,
-        'created_at': datetime.now(),
-        'timeout_task': timeout_task,
-    }
+    }, timeout=PENDING_TIMEOUT)
+
+    # Wyślij do grupy przedmiotu (gracz 1 pomija własne powiadomienie)
+    await channel_layer.group_send(
+        subject_group_name(subject_id),
+        {
+            'type': 'match_notification',
+            'match_id': match_id,
+            'player1_id': player1_id,
+            'player': player1_data,
+            'book': {
+                'id': book.id,
+                'title': book.title,
+                'author': book.author,
+            },
+            'subject': {
+                'id': subject.id,
+                'name': subject.name,
+                'color': subject.color,
+            },
+        }
+    )
+
+    # Termin wygaśnięcia w harmonogramie workera
+    get_scheduler().schedule_in(
+        ('pending', 'match', match_id), PENDING_TIMEOUT, match_pending_expired, match_id, player1_id)
 
 
 async def send_invite_notification(match_id: int, player1_id: int, player2_id: int, book_id: int, subject_id: int):
@@ -547,31 +498,63 @@ async def send_invite_notification(match_id: int, player1_id: int, player2_id: i
         }
     )
 
-    # Utwórz timeout task
-    async def timeout_handler():
-        await asyncio.sleep(60)
-        if match_id in pending_invites:
-            # Anuluj zaproszenie
-            await channel_layer.group_send(
-                f'user_{player1_id}',
-                {
-                    'type': 'invite_timeout',
-                    'match_id': match_id,
-                }
-            )
-            # Usuń mecz z bazy jeśli istnieje
-            try:
-                match = await database_sync_to_async(Match.objects.get)(id=match_id)
-                if match.status == 'waiting':
-                    await database_sync_to_async(match.delete)()
-            except:
-                pass
-            del pending_invites[match_id]
-
-    timeout_task = asyncio.create_task(timeout_handler())
-    pending_invites[match_id] = {
+    # Zarejestruj oczekujące zaproszenie przed startem timeoutu
+    presence = get_presence()
+    await presence.add_pending('invite', match_id, {
         'player1_id': player1_id,
         'player2_id': player2_id,
-        'created_at': datetime.now(),
-        'timeout_task': timeout_task,
-    }
+    }, timeout=PENDING_TIMEOUT)
+
+    # Termin wygaśnięcia w harmonogramie workera
+    get_scheduler().schedule_in(
+        ('pending', 'invite', match_id), PENDING_TIMEOUT, invite_pending_expired, match_id, player1_id)
+
+
+async def match_pending_expired(match_id: int, player1_id: int):
+    """Wygaśnięcie meczu, którego nikt nie przyjął w PENDING_TIMEOUT"""
+    from channels.layers import get_channel_layer
+
+    # Tylko jeśli nikt nie przejął meczu (akceptacja lub para z kolejki, na dowolnym workerze)
+    match_data = await get_presence().pop_pending('match', match_id)
+    if match_data:
+        await get_matchmaking().aremove(
+            match_data['subject_id'], match_data['book_id'], player1_id)
+        # Anuluj mecz
+        await get_channel_layer().group_send(
+            f'user_{player1_id}',
+            {
+                'type': 'match_timeout',
+                'match_id': match_id,
+            }
+        )
+        # Usuń mecz z bazy jeśli istnieje
+        try:
+            match = await database_sync_to_async(Match.objects.get)(id=match_id)
+            if match.status == 'waiting' and not match.player2_id:
+                await database_sync_to_async(match.delete)()
+        except:
+            pass
+
+
+async def invite_pending_expired(match_id: int, player1_id: int):
+    """Wygaśnięcie zaproszenia bez odpowiedzi w PENDING_TIMEOUT"""
+    from channels.layers import get_channel_layer
+
+    # Tylko jeśli zaproszenie nie zostało przyjęte/odrzucone na dowolnym workerze
+    if await get_presence().pop_pending('invite', match_id):
+        # Anuluj zaproszenie
+        await get_channel_layer().group_send(
+            f'user_{player1_id}',
+            {
+                'type': 'invite_timeout',
+                'match_id': match_id,
+            }
+        )
+        # Usuń mecz z bazy jeśli istnieje
+        try:
+            match = await database_sync_to_async(Match.objects.get)(id=match_id)
+            if match.status == 'waiting':
+                await database_sync_to_async(match.delete)()
+        except:
+            pass
+
@@ -0,0 +1,236 @@
+"""
+Rejestr obecności użytkowników i oczekujących zaproszeń do meczów.
+
+Backend Redis jest współdzielony przez wszystkie procesy Daphne/uvicorn,
+więc obecność i zaproszenia działają niezależnie od tego, na który worker
+trafił użytkownik. Backend w pamięci zachowuje dawną semantykę słowników
+(active_users, pending_matches, pending_invites) i służy do testów.
+"""
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from src.redis_client import get_async_redis
+
+from .scheduler import get_scheduler
+
+
+class BasePresenceBackend:
+    """Interfejs rejestru obecności"""
+
+    def __init__(self, ttl: Optional[int] = None):
+        # Po ilu sekundach bez aktywności użytkownik przestaje być aktywny
+        self.ttl = ttl or getattr(settings, 'PRESENCE_TTL', 300)
+
+    async def add_user(self, user_id: int, channel_name: str, user_data: Dict) -> None:
+        raise NotImplementedError
+
+    async def remove_user(self, user_id: int) -> bool:
+        """Usuń użytkownika; zwraca True jeśli był aktywny"""
+        raise NotImplementedError
+
+    async def touch(self, user_id: int) -> None:
+        """Aktualizuj last_seen użytkownika"""
+        raise NotImplementedError
+
+    async def active_user_ids(self, exclude_user_id: Optional[int] = None) -> List[int]:
+        raise NotImplementedError
+
+    async def active_users_data(self, exclude_user_id: Optional[int] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    async def add_pending(self, kind: str, match_id: int, data: Dict, timeout: int) -> None:
+        """Zapisz oczekujący mecz ('match') lub zaproszenie ('invite')"""
+        raise NotImplementedError
+
+    async def get_pending(self, kind: str, match_id: int) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def pop_pending(self, kind: str, match_id: int) -> Optional[Dict]:
+        """
+        Atomowo usuń oczekujący mecz/zaproszenie.
+
+        Tylko jeden proces dostaje dane (akceptacja albo timeout) - pozostali
+        dostają None i nic nie robią.
+        """
+        raise NotImplementedError
+
+
+class InMemoryPresenceBackend(BasePresenceBackend):
+    """Rejestr w pamięci procesu (pojedynczy worker, testy)"""
+
+    def __init__(self, ttl: Optional[int] = None):
+        super().__init__(ttl)
+        # {user_id: {channel_name, last_seen, user_data}}
+        self.active_users: Dict[int, Dict] = {}
+        # {match_id: {player1_id, book_id, subject_id, created_at}}
+        self.pending_matches: Dict[int, Dict] = {}
+        # {match_id: {player1_id, player2_id, created_at}}
+        self.pending_invites: Dict[int, Dict] = {}
+
+    def _pending(self, kind: str) -> Dict[int, Dict]:
+        return self.pending_matches if kind == 'match' else self.pending_invites
+
+    def _cutoff(self) -> datetime:
+        return datetime.now() - timedelta(seconds=self.ttl)
+
+    async def add_user(self, user_id, channel_name, user_data):
+        self.active_users[user_id] = {
+            'channel_name': channel_name,
+            'last_seen': datetime.now(),
+            'user_data': user_data,
+        }
+
+    async def remove_user(self, user_id):
+        return self.active_users.pop(user_id, None) is not None
+
+    async def touch(self, user_id):
+        if user_id in self.active_users:
+            self.active_users[user_id]['last_seen'] = datetime.now()
+
+    async def active_user_ids(self, exclude_user_id=None):
+        cutoff = self._cutoff()
+        return [
+            user_id for user_id, entry in self.active_users.items()
+            if entry['last_seen'] > cutoff and user_id != exclude_user_id
+        ]
+
+    async def active_users_data(self, exclude_user_id=None):
+        cutoff = self._cutoff()
+        return [
+            entry['user_data'] for user_id, entry in self.active_users.items()
+            if entry['last_seen'] > cutoff and user_id != exclude_user_id
+        ]
+
+    async def add_pending(self, kind, match_id, data, timeout):
+        self._pending(kind)[match_id] = {**data, 'created_at': datetime.now()}
+
+    async def get_pending(self, kind, match_id):
+        return self._pending(kind).get(match_id)
+
+    async def pop_pending(self, kind, match_id):
+        return self._pending(kind).pop(match_id, None)
+
+
+class RedisPresenceBackend(BasePresenceBackend):
+    """
+    Rejestr w Redis współdzielony przez wszystkie procesy i węzły.
+
+    Klucze:
+    - presence:last_seen         ZSET user_id -> timestamp ostatniej aktywności
+    - presence:user:<id>         JSON {channel_name, user_data}, wygasa po TTL
+    - presence:pending:<kind>:<id>  JSON oczekującego meczu/zaproszenia
+    """
+    LAST_SEEN_KEY = 'presence:last_seen'
+    # Termin zbiorczego zapisu heartbeatów w harmonogramie workera
+    TOUCH_FLUSH_KEY = ('presence', 'touch_flush')
+
+    def __init__(self, ttl: Optional[int] = None):
+        super().__init__(ttl)
+        self.touch_flush_interval = getattr(settings, 'PRESENCE_TOUCH_FLUSH_INTERVAL', 5)
+        # Użytkownicy z heartbeatem od ostatniego zapisu
+        self._touched: Set[int] = set()
+
+    def _user_key(self, user_id) -> str:
+        return f'presence:user:{user_id}'
+
+    def _pending_key(self, kind, match_id) -> str:
+        return f'presence:pending:{kind}:{match_id}'
+
+    async def add_user(self, user_id, channel_name, user_data):
+        redis = get_async_redis()
+        payload = json.dumps({
+            'channel_name': channel_name,
+            'user_data': user_data,
+        })
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._user_key(user_id), payload, ex=self.ttl)
+            pipe.zadd(self.LAST_SEEN_KEY, {user_id: time.time()})
+            await pipe.execute()
+
+    async def remove_user(self, user_id):
+        self._touched.discard(user_id)
+        redis = get_async_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._user_key(user_id))
+            pipe.zrem(self.LAST_SEEN_KEY, user_id)
+            deleted, _ = await pipe.execute()
+        return bool(deleted)
+
+    async def touch(self, user_id):
+        # Heartbeaty wszystkich gniazd procesu idą do Redis jednym pipeline
+        # co touch_flush_interval sekund zamiast osobnego round trip na gniazdo
+        self._touched.add(user_id)
+        scheduler = get_scheduler()
+        if not scheduler.pending(self.TOUCH_FLUSH_KEY):
+            scheduler.schedule_in(self.TOUCH_FLUSH_KEY, self.touch_flush_interval, self.flush_touches)
+
+    async def flush_touches(self) -> None:
+        """Zapisz zebrane heartbeaty (EXPIRE kluczy użytkowników i jeden ZADD)"""
+        user_ids, self._touched = self._touched, set()
+        if not user_ids:
+            return
+        now = time.time()
+        async with get_async_redis().pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.expire(self._user_key(user_id), self.ttl)
+            # XX - nie przywracaj użytkownika usuniętego przed zapisem
+            pipe.zadd(self.LAST_SEEN_KEY, {user_id: now for user_id in user_ids}, xx=True)
+            await pipe.execute()
+
+    async def active_user_ids(self, exclude_user_id=None):
+        redis = get_async_redis()
+        cutoff = time.time() - self.ttl
+        async with redis.pipeline(transaction=False) as pipe:
+            # Sprzątanie wygasłych wpisów przy okazji odczytu
+            pipe.zremrangebyscore(self.LAST_SEEN_KEY, '-inf', cutoff)
+            pipe.zrangebyscore(self.LAST_SEEN_KEY, cutoff, '+inf')
+            _, user_ids = await pipe.execute()
+        return [
+            int(user_id) for user_id in user_ids
+            if int(user_id) != exclude_user_id
+        ]
+
+    async def active_users_data(self, exclude_user_id=None):
+        user_ids = await self.active_user_ids(exclude_user_id)
+        if not user_ids:
+            return []
+        redis = get_async_redis()
+        payloads = await redis.mget([self._user_key(user_id) for user_id in user_ids])
+        return [
+            json.loads(payload)['user_data']
+            for payload in payloads
+            if payload is not None
+        ]
+
+    async def add_pending(self, kind, match_id, data, timeout):
+        redis = get_async_redis()
+        payload = json.dumps({**data, 'created_at': time.time()})
+        # Zapas na wypadek opóźnionego timeoutu - klucz i tak zostanie usunięty przez pop
+        await redis.set(self._pending_key(kind, match_id), payload, ex=timeout + 30)
+
+    async def get_pending(self, kind, match_id):
+        payload = await get_async_redis().get(self._pending_key(kind, match_id))
+        return json.loads(payload) if payload else None
+
+    async def pop_pending(self, kind, match_id):
+        payload = await get_async_redis().getdel(self._pending_key(kind, match_id))
+        return json.loads(payload) if payload else None
+
+
+_presence = None
+_presence_path = None
+
+
+def get_presence() -> BasePresenceBackend:
+    """Zwróć backend obecności skonfigurowany w settings.PRESENCE_BACKEND"""
+    global _presence, _presence_path
+    path = settings.PRESENCE_BACKEND
+    if _presence is None or _presence_path != path:
+        _presence = import_string(path)()
+        _presence_path = path
+    return _presence
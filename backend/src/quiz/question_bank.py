@@ -0,0 +1,135 @@
+"""
+Bank pytań - ponowne użycie zapisanych pytań książki zamiast generowania przy każdym meczu.
+
+Pytania do meczu są losowane z pytań zapisanych dla książki (Question).
+Bank jest uzupełniany w tle do QUESTION_BANK_TARGET_SIZE pytań
+(ai.pregeneration, komenda pregenerate_questions). Podczas startu meczu
+(quiz.match_seeding) LLM jest wywoływany tylko wtedy, gdy bank nie wystarcza
+nawet na jeden mecz.
+
+Polityka świeżości dla pary graczy (kolejność wyboru):
+1. pytania, których żaden z graczy nie widział w ostatnich meczach z tą książką,
+2. pytania widziane przez jednego z graczy w ostatnich meczach,
+3. pytania z poprzednich meczów tej samej pary graczy (na końcu).
+"""
+import logging
+import random
+from typing import Dict, List
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Book, Match, MatchQuestion, Question
+
+logger = logging.getLogger(__name__)
+
+# Liczba pytań w jednym meczu
+QUESTIONS_PER_MATCH = 10
+
+
+def bank_size(book: Book) -> int:
+    """Liczba pytań zapisanych dla książki"""
+    return Question.objects.filter(book=book).count()
+
+
+def store_generated_questions(book: Book, questions: List[Dict]) -> List[Question]:
+    """
+    Dodaj wygenerowane pytania do banku książki.
+
+    Zapisywane są wszystkie pytania (nie tylko 10 na mecz), z pominięciem
+    tych, które już są w banku.
+    """
+    existing = set(Question.objects.filter(book=book).values_list('question_text', flat=True))
+    new_questions = []
+    for q_data in questions:
+        if q_data['question'] in existing:
+            continue
+        existing.add(q_data['question'])
+        new_questions.append(Question(
+            book=book,
+            question_text=q_data['question'],
+            option_a=q_data['option_a'],
+            option_b=q_data['option_b'],
+            option_c=q_data['option_c'],
+            option_d=q_data['option_d'],
+            correct_answer=q_data['correct_answer'].lower(),
+        ))
+
+    created = Question.objects.bulk_create(new_questions)
+    logger.info('Question bank for book %s refilled with %d questions', book.id, len(created))
+    return created
+
+
+def book_data(book: Book) -> Dict:
+    """Dane książki w formacie argumentów generatora pytań"""
+    return {
+        'title': book.title,
+        'author': book.author,
+        'isbn': book.isbn,
+        'subject': book.subject.name,
+        'toc_pdf_url': book.toc_pdf_url,
+    }
+
+
+def generate_bank_questions(book: Book) -> List[Dict]:
+    """Wygeneruj nowe pytania przez LLM (bez zapisu do bazy)"""
+    from ai.agent.generator_pool import get_generator_pool
+
+    result = get_generator_pool().generate_questions(use_agent=False, **book_data(book))
+    return [q.model_dump() for q in result.questions]
+
+
+async def agenerate_bank_questions(data: Dict) -> List[Dict]:
+    """Asynchroniczna wersja generate_bank_questions (data - wynik book_data)"""
+    from ai.agent.generator_pool import get_generator_pool
+
+    result = await get_generator_pool().agenerate_questions(use_agent=False, **data)
+    return [q.model_dump() for q in result.questions]
+
+
+def select_questions(match: Match, count: int = QUESTIONS_PER_MATCH) -> List[Question]:
+    """Wylosuj pytania z banku zgodnie z polityką świeżości dla graczy meczu"""
+    player_ids = [pid for pid in (match.player1_id, match.player2_id) if pid]
+    recent_matches = getattr(settings, 'QUESTION_BANK_RECENT_MATCHES', 5)
+
+    # Ostatnie mecze każdego z graczy z tą książką
+    recently_seen = set()
+    for player_id in player_ids:
+        match_ids = list(
+            Match.objects.filter(book_id=match.book_id)
+            .filter(Q(player1_id=player_id) | Q(player2_id=player_id))
+            .exclude(id=match.id)
+            .order_by('-created_at')
+            .values_list('id', flat=True)[:recent_matches]
+        )
+        recently_seen.update(
+            MatchQuestion.objects.filter(match_id__in=match_ids).values_list('question_id', flat=True)
+        )
+
+    # Wszystkie wcześniejsze mecze tej samej pary graczy
+    seen_by_pair = set()
+    if len(player_ids) == 2:
+        seen_by_pair = set(
+            MatchQuestion.objects.filter(match__book_id=match.book_id).filter(
+                Q(match__player1_id=player_ids[0], match__player2_id=player_ids[1]) |
+                Q(match__player1_id=player_ids[1], match__player2_id=player_ids[0])
+            ).exclude(match_id=match.id).values_list('question_id', flat=True)
+        )
+
+    bank = list(Question.objects.filter(book_id=match.book_id).values_list('id', flat=True))
+    tiers = [
+        [qid for qid in bank if qid not in recently_seen and qid not in seen_by_pair],
+        [qid for qid in bank if qid in recently_seen and qid not in seen_by_pair],
+        [qid for qid in bank if qid in seen_by_pair],
+    ]
+
+    chosen = []
+    for tier in tiers:
+        missing = count - len(chosen)
+        if missing <= 0:
+            break
+        chosen.extend(random.sample(tier, min(missing, len(tier))))
+
+    random.shuffle(chosen)
+    questions = Question.objects.in_bulk(chosen)
+    return [questions[qid] for qid in chosen]
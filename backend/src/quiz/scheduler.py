@@ -0,0 +1,155 @@
+"""
+Wspólny harmonogram terminów (kopiec) - jedna pętla na worker.
+
+Zamiast osobnego taska asyncio na każdy timeout (per gracz i per pytanie)
+wszystkie terminy procesu - koniec czasu na pytanie, przejście do
+następnego pytania, synchronizacja timera, heartbeat, wygaśnięcie
+zaproszeń - są wpisami w jednym kopcu. Jeden task czeka do najbliższego
+terminu i po jego upływie uruchamia callback wpisu.
+
+Wpisy mają klucze: ponowne schedule() z tym samym kluczem zastępuje
+termin, cancel() go usuwa. Callbacki to funkcje modułów (nie metody
+consumerów) - termin przeżywa rozłączenie consumera, który go ustawił.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Callback = Callable[..., Awaitable[Any]]
+
+
+@dataclass(order=True)
+class ScheduledEntry:
+    """Termin w kopcu; anulowane wpisy są usuwane leniwie"""
+    when: float
+    seq: int
+    key: Hashable = field(compare=False)
+    callback: Callback = field(compare=False)
+    args: Tuple = field(compare=False, default=())
+    cancelled: bool = field(compare=False, default=False)
+
+
+class DeadlineScheduler:
+    """Kopiec terminów obsługiwany przez jeden task w pętli zdarzeń"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        # Czas ścienny - terminy (deadline pytań) są wspólne dla wszystkich workerów
+        self.clock = clock
+        self._heap: List[ScheduledEntry] = []
+        self._entries: Dict[Hashable, ScheduledEntry] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+        # Krótkie taski uruchomionych callbacków (referencje, żeby nie zniknęły w GC)
+        self._running = set()
+        self.fired = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def schedule(self, key: Hashable, when: float, callback: Callback, *args) -> ScheduledEntry:
+        """Ustaw (lub przesuń) termin klucza; callback(*args) zostanie uruchomiony o czasie when"""
+        self.cancel(key)
+        entry = ScheduledEntry(when, next(self._seq), key, callback, args)
+        heapq.heappush(self._heap, entry)
+        self._entries[key] = entry
+        self._ensure_runner()
+        if self._heap[0] is entry:
+            # Nowy najbliższy termin - obudź pętlę, żeby skróciła oczekiwanie
+            self._wakeup.set()
+        return entry
+
+    def schedule_in(self, key: Hashable, delay: float, callback: Callback, *args) -> ScheduledEntry:
+        return self.schedule(key, self.clock() + delay, callback, *args)
+
+    def cancel(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry.cancelled = True
+        return True
+
+    def pending(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def _ensure_runner(self) -> None:
+        if self._runner is None or self._runner.done():
+            # Czysty kontekst - runner nie dziedziczy zmiennych kontekstu (np. kolejki bazy
+            # src.db_executor) consumera, który jako pierwszy ustawił termin
+            self._runner = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+
+    async def _run(self) -> None:
+        while True:
+            while self._heap and self._heap[0].cancelled:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0].when - self.clock()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            entry = heapq.heappop(self._heap)
+            if self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+            self._fire(entry)
+
+    def _fire(self, entry: ScheduledEntry) -> None:
+        self.fired += 1
+        task = asyncio.get_running_loop().create_task(entry.callback(*entry.args), context=contextvars.Context())
+        self._running.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Scheduled callback failed', exc_info=task.exception())
+
+
+# Harmonogram jest związany z pętlą zdarzeń - jeden na pętlę (worker)
+_schedulers = weakref.WeakKeyDictionary()
+
+
+def get_scheduler() -> DeadlineScheduler:
+    """Harmonogram terminów bieżącej pętli asyncio"""
+    loop = asyncio.get_running_loop()
+    scheduler = _schedulers.get(loop)
+    if scheduler is None:
+        scheduler = DeadlineScheduler()
+        _schedulers[loop] = scheduler
+    return scheduler
+
+
+# Co ile sekund consumery wysyłają ping do klienta
+HEARTBEAT_INTERVAL = 30
+
+
+def schedule_heartbeat(channel_name: str) -> None:
+    """Następny heartbeat kanału (event 'heartbeat' do consumera) za HEARTBEAT_INTERVAL sekund"""
+    get_scheduler().schedule_in(('heartbeat', channel_name), HEARTBEAT_INTERVAL, _heartbeat_due, channel_name)
+
+
+def cancel_heartbeat(channel_name: str) -> None:
+    get_scheduler().cancel(('heartbeat', channel_name))
+
+
+async def _heartbeat_due(channel_name: str) -> None:
+    from channels.layers import get_channel_layer
+
+    schedule_heartbeat(channel_name)
+    await get_channel_layer().send(channel_name, {'type': 'heartbeat'})
@@ -80,7 +80,7 @@ class MatchSerializer(serializers.ModelSerializer):
     book = BookSerializer(read_only=True)
     subject = SubjectSerializer(read_only=True)
     winner = UserBasicSerializer(read_only=True)
-    total_questions = serializers.SerializerMethodField()
+    total_questions = serializers.IntegerField(source='question_count', read_only=True)
 
     class Meta:
         model = Match
@@ -89,12 +89,27 @@ class MatchSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'player1', 'player2', 'book', 'subject', 'status', 'current_question_index',
                             'player1_score', 'player2_score', 'winner', 'created_at', 'started_at', 'finished_at', 'total_questions']
 
-    def get_total_questions(self, obj):
-        """Zwróć liczbę pytań w meczu"""
-        # Użyj prefetch_related jeśli dostępne, w przeciwnym razie użyj count()
-        if hasattr(obj, '_prefetched_objects_cache') and 'match_questions' in obj._prefetched_objects_cache:
-            return len(obj._prefetched_objects_cache['match_questions'])
-        return obj.match_questions.count()
+
+class MatchHistorySerializer(serializers.ModelSerializer):
+    """Zwięzły wiersz historii meczów (match_history) - płaskie pola zamiast zagnieżdżonych obiektów"""
+    book_id = serializers.IntegerField(read_only=True)
+    book_title = serializers.CharField(source='book.title', read_only=True)
+    subject_id = serializers.IntegerField(read_only=True)
+    subject_name = serializers.CharField(source='subject.name', read_only=True)
+    subject_color = serializers.CharField(source='subject.color', read_only=True)
+    player1_id = serializers.IntegerField(read_only=True)
+    player1_username = serializers.CharField(source='player1.username', read_only=True)
+    player2_id = serializers.IntegerField(read_only=True, allow_null=True)
+    player2_username = serializers.CharField(source='player2.username', read_only=True, allow_null=True)
+    winner_id = serializers.IntegerField(read_only=True, allow_null=True)
+    total_questions = serializers.IntegerField(source='question_count', read_only=True)
+
+    class Meta:
+        model = Match
+        fields = ['id', 'status', 'book_id', 'book_title', 'subject_id', 'subject_name', 'subject_color',
+                  'player1_id', 'player1_username', 'player2_id', 'player2_username', 'winner_id',
+                  'player1_score', 'player2_score', 'total_questions', 'created_at', 'finished_at']
+        read_only_fields = fields
 
 
 class UserRankingSerializer(serializers.ModelSerializer):
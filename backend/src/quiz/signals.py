@@ -0,0 +1,63 @@
+"""
+Sygnały modeli podtrzymujące leaderboard (podłączane w QuizConfig.ready).
+
+Każdy zapis UserRanking - po meczu, z panelu admina czy shella - odświeża
+wpisy gracza, a usunięcie unieważnia rankingi. Zmiany trafiają do
+leaderboardu po commit, tak jak w auth_api.signals.
+"""
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from redis import RedisError
+
+from .leaderboard import get_leaderboard
+from .models import UserRanking
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=User, dispatch_uid='quiz_leaderboard_remove_user')
+def remove_deleted_user_from_leaderboard(sender, instance, **kwargs):
+    """Usunięte konto znika z rankingów (liczba graczy i pozycje pozostałych)"""
+    user_id = instance.id
+
+    def remove():
+        try:
+            get_leaderboard().remove_user(user_id)
+        except RedisError as e:
+            logger.warning('Could not remove user %s from the leaderboard: %s', user_id, e)
+
+    # Po commit - odbudowa rankingu w trakcie transakcji wczytałaby jeszcze usunięte konto
+    transaction.on_commit(remove)
+
+
+@receiver(post_save, sender=UserRanking, dispatch_uid='quiz_leaderboard_update_ranking')
+def update_leaderboard_for_ranking(sender, instance, **kwargs):
+    user_id, subject_id = instance.user_id, instance.subject_id
+
+    def update():
+        try:
+            get_leaderboard().update_user(user_id, subject_id)
+        except Exception:
+            logger.warning('Leaderboard update failed for user %s', user_id, exc_info=True)
+
+    transaction.on_commit(update)
+
+
+@receiver(post_delete, sender=UserRanking, dispatch_uid='quiz_leaderboard_invalidate_ranking')
+def invalidate_leaderboard_for_ranking(sender, instance, **kwargs):
+    subject_id = instance.subject_id
+
+    def invalidate():
+        try:
+            for scope_subject_id in (subject_id, None):
+                get_leaderboard().invalidate(scope_subject_id)
+        except RedisError as e:
+            logger.warning('Could not invalidate the leaderboard of subject %s: %s', subject_id, e)
+
+    transaction.on_commit(invalidate)
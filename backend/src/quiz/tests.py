@@ -1,3 +1,1075 @@
-from django.test import TestCase
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from decimal import Decimal
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib import admin
+from django.core.cache import caches
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from src.db_executor import (
+    DatabaseLaneMixin, _current_lane, database_sync_to_async as pooled_sync_to_async, get_db_executor,
+)
+from src.encoding import dumps
+from src.renderers import CustomJSONRenderer
+
+from .admin import SubjectAdmin
+from .leaderboard import InMemoryLeaderboard
+from .log import MatchContextFilter, SampleFilter, match_logger
+from .match_clock import MatchClock
+from .match_history import decode_cursor
+from .matchmaking import (
+    InMemoryMatchmakingQueue, MatchmakingTicket, TickResult, _assign_pair, complete_pair, complete_tick,
+    get_matchmaking, pair_tickets,
+)
+from .models import Book, Match, MatchQuestion, Question, Subject, UserRanking
+from .presence import InMemoryPresenceBackend, get_presence
+from .match_seeding import aseed_match_questions, seed_match_questions
+from .match_state import NO_ANSWER, InMemoryMatchStateStore, build_state, persist_result
+from .question_bank import select_questions
+from .user_summary import get_user_summary
+from .consumers import MatchConsumer
+from .notification_consumer import NotificationConsumer, interest_subject_ids, send_match_notification, subject_group_name
+from .scheduler import DeadlineScheduler, get_scheduler
+
+User = get_user_model()
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+    'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'local'},
+}
+
+
+class MatchClockTest(SimpleTestCase):
+    """Tests for the in-memory match clock."""
+
+    def setUp(self):
+        self.clock = MatchClock(time_limit=60)
+
+    def test_start_question_sets_deadline(self):
+        """Test that starting a question sets a deadline time_limit seconds ahead."""
+        question_clock = self.clock.start_question(1, 0)
+
+        self.assertEqual(question_clock.question_index, 0)
+        self.assertEqual(question_clock.time_left(now=question_clock.deadline - 60), 60)
+        self.assertEqual(question_clock.time_left(now=question_clock.deadline + 5), 0)
+
+    def test_start_question_is_idempotent_for_same_question(self):
+        """Test that a second start for the same question keeps the original deadline."""
+        first = self.clock.start_question(1, 0)
+        second = self.clock.start_question(1, 0)
+
+        self.assertIs(first, second)
+
+    def test_start_question_uses_broadcast_deadline(self):
+        """Test that a deadline received from the group event overrides the local one."""
+        self.clock.start_question(1, 0)
+        question_clock = self.clock.start_question(1, 0, deadline=1234.0)
+
+        self.assertEqual(question_clock.deadline, 1234.0)
+
+    def test_next_question_replaces_clock(self):
+        """Test that starting the next question replaces the previous clock."""
+        self.clock.start_question(1, 0)
+        question_clock = self.clock.start_question(1, 1)
+
+        self.assertEqual(self.clock.get(1).question_index, 1)
+        self.assertFalse(question_clock.stopped)
+
+    def test_stop_question_ignores_other_questions(self):
+        """Test that stopping a stale question index does not stop the current one."""
+        self.clock.start_question(1, 1)
+
+        self.clock.stop_question(1, 0)
+        self.assertFalse(self.clock.get(1).stopped)
+
+        self.clock.stop_question(1, 1)
+        self.assertTrue(self.clock.get(1).stopped)
+        self.assertFalse(self.clock.get(1).is_running())
+
+    def test_clear_removes_clock(self):
+        """Test that clearing a match removes its clock."""
+        self.clock.start_question(1, 0)
+        self.clock.clear(1)
+
+        self.assertIsNone(self.clock.get(1))
+
+
+class DeadlineSchedulerTest(SimpleTestCase):
+    """Tests for the per-worker deadline scheduler."""
+
+    def setUp(self):
+        self.fired = []
+
+    async def record(self, name):
+        self.fired.append(name)
+
+    async def test_entries_fire_in_deadline_order(self):
+        """Test that entries fire by deadline, not by scheduling order."""
+        scheduler = DeadlineScheduler()
+        scheduler.schedule_in('late', 0.03, self.record, 'late')
+        scheduler.schedule_in('early', 0.01, self.record, 'early')
+
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(self.fired, ['early', 'late'])
+        self.assertEqual(len(scheduler), 0)
+
+    async def test_cancel_prevents_fire(self):
+        """Test that a cancelled entry never fires."""
+        scheduler = DeadlineScheduler()
+        scheduler.schedule_in('question', 0.01, self.record, 'question')
+
+        self.assertTrue(scheduler.cancel('question'))
+        self.assertFalse(scheduler.pending('question'))
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(self.fired, [])
+        self.assertFalse(scheduler.cancel('question'))
+
+    async def test_schedule_replaces_entry_with_same_key(self):
+        """Test that rescheduling a key keeps only the newest deadline."""
+        scheduler = DeadlineScheduler()
+        scheduler.schedule_in('question', 0.01, self.record, 'first')
+        scheduler.schedule_in('question', 0.02, self.record, 'second')
+
+        await asyncio.sleep(0.06)
+
+        self.assertEqual(self.fired, ['second'])
+        self.assertEqual(scheduler.fired, 1)
+
+    async def test_one_runner_task_per_loop(self):
+        """Test that many entries share one runner task and one scheduler per loop."""
+        scheduler = get_scheduler()
+        tasks_before = len(asyncio.all_tasks())
+        for match_id in range(100):
+            scheduler.schedule_in(('question', match_id), 60, self.record, match_id)
+
+        self.assertIs(get_scheduler(), scheduler)
+        self.assertLessEqual(len(asyncio.all_tasks()) - tasks_before, 1)
+        for match_id in range(100):
+            scheduler.cancel(('question', match_id))
+
+
+class ConsumerLoggingTest(SimpleTestCase):
+    """Tests for the consumer logging helpers."""
+
+    def make_record(self, level=logging.DEBUG):
+        return logging.LogRecord('quiz.consumers.timer', level, __file__, 1, 'tick %s', (1,), None)
+
+    def test_sample_filter_passes_every_nth_record(self):
+        """Test that only every rate-th record passes, but warnings always do."""
+        sample = SampleFilter(rate=3)
+
+        passed = [sample.filter(self.make_record()) for _ in range(6)]
+
+        self.assertEqual(passed, [True, False, False, True, False, False])
+        self.assertTrue(sample.filter(self.make_record(logging.WARNING)))
+
+    def test_match_context_defaults(self):
+        """Test that records without match context get placeholder fields."""
+        record = self.make_record()
+        record.match_id = 7
+
+        self.assertTrue(MatchContextFilter().filter(record))
+        self.assertEqual((record.match_id, record.user_id), (7, '-'))
+
+    def test_match_logger_adds_context(self):
+        """Test that the adapter attaches match context and keeps formatting lazy."""
+        log = match_logger(logging.getLogger('quiz.tests.consumer'), match_id=5, user_id=3)
+
+        with self.assertLogs('quiz.tests.consumer', level='DEBUG') as logs:
+            log.debug('answer %s', 'a', extra={'user_id': 4})
+
+        record = logs.records[0]
+        self.assertEqual((record.match_id, record.user_id), (5, 4))
+        self.assertEqual(record.args, ('a',))
+        self.assertEqual(record.getMessage(), 'answer a')
+
+
+class JSONEncodingTest(SimpleTestCase):
+    """Tests for the orjson encoder shared by renderers and consumers."""
+
+    def test_matches_drf_encoding(self):
+        """Test that dates, UUIDs and decimals encode like DRF's JSONRenderer."""
+        data = {
+            'finished_at': datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc),
+            'day': date(2025, 1, 2),
+            'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'points': Decimal('1.50'),
+            'name': 'Żółć',
+        }
+
+        self.assertEqual(dumps(data), JSONRenderer().render(data))
+
+    def test_custom_renderer_wraps_success_responses(self):
+        """Test that successful responses are wrapped in the standard envelope."""
+        context = {'response': type('Response', (), {'status_code': 200})()}
+
+        rendered = CustomJSONRenderer().render([1, 2], 'application/json', context)
+
+        self.assertEqual(rendered, b'{"status":"success","message":"Operation successful","data":[1,2]}')
+
+
+class InMemoryPresenceBackendTest(SimpleTestCase):
+    """Tests for the in-process presence registry."""
+
+    def setUp(self):
+        self.presence = InMemoryPresenceBackend(ttl=300)
+
+    async def test_active_users_exclude_self(self):
+        """Test that the active users list skips the requesting user."""
+        await self.presence.add_user(1, 'chan-1', {'id': 1})
+        await self.presence.add_user(2, 'chan-2', {'id': 2})
+
+        self.assertEqual(await self.presence.active_user_ids(exclude_user_id=1), [2])
+        self.assertEqual(await self.presence.active_users_data(exclude_user_id=2), [{'id': 1}])
+
+    async def test_expired_users_are_not_active(self):
+        """Test that users without a heartbeat within the TTL are filtered out."""
+        await self.presence.add_user(1, 'chan-1', {'id': 1})
+        self.presence.active_users[1]['last_seen'] = datetime.now() - timedelta(seconds=301)
+
+        self.assertEqual(await self.presence.active_user_ids(), [])
+
+        await self.presence.touch(1)
+        self.assertEqual(await self.presence.active_user_ids(), [1])
+
+    async def test_remove_user(self):
+        """Test that removing reports whether the user was registered."""
+        await self.presence.add_user(1, 'chan-1', {'id': 1})
+
+        self.assertTrue(await self.presence.remove_user(1))
+        self.assertFalse(await self.presence.remove_user(1))
+
+    async def test_pop_pending_claims_once(self):
+        """Test that a pending match can be claimed only once (accept vs timeout)."""
+        await self.presence.add_pending('match', 10, {'player1_id': 1}, timeout=60)
+
+        self.assertEqual((await self.presence.get_pending('match', 10))['player1_id'], 1)
+        self.assertIsNotNone(await self.presence.pop_pending('match', 10))
+        self.assertIsNone(await self.presence.pop_pending('match', 10))
+
+    async def test_pending_kinds_are_separate(self):
+        """Test that match requests and invites do not share keys."""
+        await self.presence.add_pending('invite', 10, {'player1_id': 1, 'player2_id': 2}, timeout=60)
+
+        self.assertIsNone(await self.presence.get_pending('match', 10))
+        self.assertIsNotNone(await self.presence.get_pending('invite', 10))
+
+    @override_settings(PRESENCE_BACKEND='quiz.presence.InMemoryPresenceBackend')
+    def test_get_presence_uses_configured_backend(self):
+        """Test that the backend is loaded from settings and reused."""
+        self.assertIsInstance(get_presence(), InMemoryPresenceBackend)
+        self.assertIs(get_presence(), get_presence())
+
+
+class RankingViewTest(APITestCase):
+    """Tests for the leaderboard-backed ranking endpoints."""
+
+    def setUp(self):
+        self.math = Subject.objects.create(name='Matematyka', color='#6366F1', icon_name='calculator')
+        self.physics = Subject.objects.create(name='Fizyka', color='#8B5CF6', icon_name='atom')
+        self.users = [
+            User.objects.create_user(email=f'player{i}@p.lodz.pl', password='testpass123', username=f'player{i}')
+            for i in range(3)
+        ]
+        UserRanking.objects.create(user=self.users[0], subject=self.math, points=30, wins=3, losses=0)
+        UserRanking.objects.create(user=self.users[1], subject=self.math, points=20, wins=2, losses=1)
+        UserRanking.objects.create(user=self.users[1], subject=self.physics, points=20, wins=2, losses=0)
+        UserRanking.objects.create(user=self.users[2], subject=self.physics, points=10, wins=1, losses=2)
+
+        self.leaderboard = InMemoryLeaderboard()
+        patcher = patch('quiz.views.get_leaderboard', return_value=self.leaderboard)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_authenticate(self.users[2])
+
+    def test_general_ranking_sums_subjects(self):
+        """Test that the general ranking aggregates points across subjects."""
+        response = self.client.get(reverse('ranking-general'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([entry['user']['id'] for entry in response.data],
+                         [self.users[1].id, self.users[0].id, self.users[2].id])
+        self.assertEqual(response.data[0]['points'], 40)
+        self.assertEqual(response.data[0]['position'], 1)
+        self.assertEqual(response['X-Total-Count'], '3')
+
+    def test_subject_ranking_is_paginated(self):
+        """Test that offset/limit select a page and keep absolute positions."""
+        url = reverse('ranking-subject', args=[self.math.id])
+        response = self.client.get(url, {'offset': 1, 'limit': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['position'], 2)
+        self.assertEqual(response.data[0]['user']['id'], self.users[1].id)
+        self.assertEqual(response.data[0]['subject_id'], self.math.id)
+
+    def test_invalid_page_params(self):
+        """Test that non-numeric paging parameters are rejected."""
+        response = self.client.get(reverse('ranking-general'), {'limit': 'abc'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_my_rank(self):
+        """Test the current user's position lookup."""
+        response = self.client.get(reverse('ranking-subject-me', args=[self.physics.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['position'], 2)
+        self.assertEqual(response.data['user']['id'], self.users[2].id)
+
+    def test_my_rank_without_games(self):
+        """Test that a user without games in a subject gets 404."""
+        response = self.client.get(reverse('ranking-subject-me', args=[self.math.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_update_user_refreshes_cached_ranking(self):
+        """Test that a ranking change after a match is reflected without a rebuild."""
+        self.client.get(reverse('ranking-general'))
+
+        UserRanking.objects.filter(user=self.users[2], subject=self.physics).update(points=100, wins=10)
+        self.leaderboard.update_user(self.users[2].id, self.physics.id)
+
+        response = self.client.get(reverse('ranking-general-me'))
+        self.assertEqual(response.data['position'], 1)
+        self.assertEqual(response.data['points'], 100)
+
+    def test_saved_ranking_updates_built_ranking(self):
+        """Test that any UserRanking save (admin, shell) refreshes a built ranking after commit."""
+        self.client.get(reverse('ranking-subject', args=[self.physics.id]))
+        ranking = UserRanking.objects.get(user=self.users[2], subject=self.physics)
+        ranking.points = 100
+
+        with patch('quiz.signals.get_leaderboard', return_value=self.leaderboard), \
+                self.captureOnCommitCallbacks(execute=True):
+            ranking.save()
+
+        response = self.client.get(reverse('ranking-subject-me', args=[self.physics.id]))
+        self.assertEqual((response.data['position'], response.data['points']), (1, 100))
+
+    def test_deleted_ranking_invalidates_ranking(self):
+        """Test that deleting a UserRanking rebuilds the subject and general rankings."""
+        self.client.get(reverse('ranking-general'))
+        self.client.get(reverse('ranking-subject', args=[self.physics.id]))
+
+        with patch('quiz.signals.get_leaderboard', return_value=self.leaderboard), \
+                self.captureOnCommitCallbacks(execute=True):
+            UserRanking.objects.get(user=self.users[1], subject=self.physics).delete()
+
+        response = self.client.get(reverse('ranking-subject', args=[self.physics.id]))
+        self.assertEqual([entry['user']['id'] for entry in response.data], [self.users[2].id])
+        response = self.client.get(reverse('ranking-general-me'))
+        self.assertEqual(response.data['position'], 3)
+
+    def test_deleted_user_leaves_ranking(self):
+        """Test that deleting an account removes it from count and positions of a built ranking."""
+        self.client.get(reverse('ranking-general'))
+
+        with patch('quiz.signals.get_leaderboard', return_value=self.leaderboard), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.users[1].delete()
+
+        response = self.client.get(reverse('ranking-general'))
+        self.assertEqual([(entry['position'], entry['user']['id']) for entry in response.data],
+                         [(1, self.users[0].id), (2, self.users[2].id)])
+        self.assertEqual(response['X-Total-Count'], '2')
+        self.assertEqual(self.client.get(reverse('ranking-subject-me', args=[self.physics.id])).data['position'], 1)
+
+
+class QuestionBankTest(TestCase):
+    """Tests for drawing match questions from the per-book bank."""
+
+    def setUp(self):
+        self.subject = Subject.objects.create(name='Matematyka', color='#6366F1', icon_name='calculator')
+        self.book = Book.objects.create(
+            title='Analiza', author='Autor', isbn='123', subject=self.subject,
+            toc_pdf_url='https://example.com/toc.pdf')
+        self.player1 = User.objects.create_user(email='p1@p.lodz.pl', password='testpass123', username='p1')
+        self.player2 = User.objects.create_user(email='p2@p.lodz.pl', password='testpass123', username='p2')
+        self.questions = [self._question(i) for i in range(15)]
+
+    def _question(self, i):
+        return Question.objects.create(
+            book=self.book, question_text=f'Pytanie {i}', option_a='a', option_b='b',
+            option_c='c', option_d='d', correct_answer='a')
+
+    def _match(self, player2=None):
+        return Match.objects.create(
+            player1=self.player1, player2=player2 or self.player2, book=self.book,
+            subject=self.subject, status='ready')
+
+    def test_prefers_questions_unseen_by_pair(self):
+        """Test that questions from the pair's previous match are used last."""
+        previous = self._match()
+        for idx, question in enumerate(self.questions[:10]):
+            MatchQuestion.objects.create(match=previous, question=question, question_order=idx)
+
+        chosen = select_questions(self._match(), count=10)
+
+        self.assertEqual(len(chosen), 10)
+        self.assertEqual(len(set(q.id for q in chosen)), 10)
+        self.assertTrue({q.id for q in self.questions[10:]} <= {q.id for q in chosen})
+
+    def test_recently_seen_by_one_player_before_pair_history(self):
+        """Test that questions one player saw elsewhere come before pair history."""
+        outsider = User.objects.create_user(email='p3@p.lodz.pl', password='testpass123', username='p3')
+        pair_match = self._match()
+        for idx, question in enumerate(self.questions[:5]):
+            MatchQuestion.objects.create(match=pair_match, question=question, question_order=idx)
+        other_match = self._match(player2=outsider)
+        for idx, question in enumerate(self.questions[5:10]):
+            MatchQuestion.objects.create(match=other_match, question=question, question_order=idx)
+
+        chosen = {q.id for q in select_questions(self._match(), count=10)}
+
+        self.assertEqual(chosen, {q.id for q in self.questions[5:15]})
+
+    @override_settings(QUESTION_BANK_TARGET_SIZE=50)
+    @patch('quiz.match_seeding.generate_bank_questions')
+    def test_bank_below_target_does_not_block_on_llm(self, generate):
+        """Test that a bank able to fill a match is used without inline generation."""
+        match = self._match()
+
+        self.assertEqual(seed_match_questions(match), 10)
+        generate.assert_not_called()
+        self.assertEqual(
+            sorted(MatchQuestion.objects.filter(match=match).values_list('question_order', flat=True)),
+            list(range(10)))
+        match.refresh_from_db()
+        self.assertEqual(match.question_count, 10)
+
+    @patch('quiz.match_seeding.generate_bank_questions', side_effect=ValueError('LLM down'))
+    def test_too_small_bank_generates_inline(self, generate):
+        """Test that a bank too small for one match falls back to inline generation."""
+        Question.objects.filter(id__in=[q.id for q in self.questions[5:]]).delete()
+        match = self._match()
+
+        with self.assertRaises(ValueError):
+            seed_match_questions(match)
+        generate.assert_called_once()
+        self.assertFalse(MatchQuestion.objects.filter(match=match).exists())
+
+    @patch('quiz.match_seeding.generate_bank_questions')
+    def test_generated_questions_stored_with_slots(self, generate):
+        """Test that inline-generated questions are added to the bank and used for the match."""
+        Question.objects.filter(id__in=[q.id for q in self.questions[5:]]).delete()
+        generate.return_value = [
+            {'question': f'Nowe {i}', 'option_a': 'a', 'option_b': 'b', 'option_c': 'c',
+             'option_d': 'd', 'correct_answer': 'B'}
+            for i in range(5)
+        ]
+        match = self._match()
+
+        self.assertEqual(seed_match_questions(match), 10)
+        self.assertEqual(Question.objects.filter(book=self.book).count(), 10)
+        self.assertEqual(Question.objects.get(question_text='Nowe 0').correct_answer, 'b')
+
+    def test_seeding_is_idempotent(self):
+        """Test that seeding an already seeded match keeps its questions."""
+        match = self._match()
+        seed_match_questions(match)
+        first = list(MatchQuestion.objects.filter(match=match).values_list('question_id', flat=True))
+
+        self.assertEqual(seed_match_questions(match), 10)
+        self.assertEqual(
+            list(MatchQuestion.objects.filter(match=match).values_list('question_id', flat=True)), first)
+
+
+@override_settings(DB_EXECUTOR_WORKERS=0)
+class MatchStateTest(TestCase):
+    """Tests for the live match state store and its write-through to the database."""
+
+    def setUp(self):
+        self.store = InMemoryMatchStateStore()
+        subject = Subject.objects.create(name='Fizyka', color='#6366F1', icon_name='atom')
+        book = Book.objects.create(title='Mechanika', author='Autor', isbn='456', subject=subject)
+        self.player1 = User.objects.create_user(email='s1@p.lodz.pl', password='testpass123', username='s1')
+        self.player2 = User.objects.create_user(email='s2@p.lodz.pl', password='testpass123', username='s2')
+        self.match = Match.objects.create(
+            player1=self.player1, player2=self.player2, book=book, subject=subject, status='active')
+        for idx, correct in enumerate(['a', 'b']):
+            question = Question.objects.create(
+                book=book, question_text=f'Pytanie {idx}', option_a='a', option_b='b',
+                option_c='c', option_d='d', correct_answer=correct)
+            MatchQuestion.objects.create(match=self.match, question=question, question_order=idx)
+
+    def test_build_state_from_database(self):
+        """Test that the state is rebuilt with questions, answers and processed results."""
+        MatchQuestion.objects.filter(match=self.match, question_order=0).update(
+            player1_answer='a', player2_answer='c', player1_correct=True, player2_correct=False)
+
+        state = build_state(self.match.id)
+
+        self.assertEqual(state.question_count, 2)
+        self.assertNotIn('correct_answer', state.question_data(0))
+        self.assertTrue(state.both_answered(0))
+        self.assertIn('result:0', state.claims)
+        self.assertEqual(state.player_number(self.player2.id), 2)
+
+    async def test_load_keeps_answers_recorded_by_other_consumers(self):
+        """Test that hydrating an existing state does not overwrite it."""
+        state = await self.store.load(self.match.id)
+        commit = await self.store.commit_answers(self.match.id, 0, {1: 'a'})
+        await self.store.init(state)
+
+        self.assertTrue(commit.recorded)
+        self.assertEqual((await self.store.load(self.match.id)).answer(0, 1), 'a')
+
+    async def test_first_answer_counts(self):
+        """Test that only a player's first answer to a question is recorded."""
+        await self.store.load(self.match.id)
+
+        self.assertTrue((await self.store.commit_answers(self.match.id, 0, {1: 'a'})).recorded)
+        commit = await self.store.commit_answers(self.match.id, 0, {1: 'b'})
+
+        self.assertFalse(commit.recorded)
+        self.assertFalse(commit.claimed)
+        self.assertEqual(commit.state.answer(0, 1), 'a')
+
+    async def test_second_answer_claims_result_once(self):
+        """Test that the answer completing a question claims its result and scores it."""
+        await self.store.load(self.match.id)
+        await self.store.commit_answers(self.match.id, 0, {1: 'a'})
+
+        commit = await self.store.commit_answers(self.match.id, 0, {2: 'b'})
+        self.assertTrue(commit.claimed)
+        self.assertEqual((commit.state.player1_score, commit.state.player2_score), (1, 0))
+
+        again = await self.store.commit_answers(self.match.id, 0, {})
+        self.assertFalse(again.claimed)
+        self.assertEqual(again.state.player1_score, 1)
+
+    async def test_claim_requires_existing_state(self):
+        """Test that a transition cannot be claimed for a state that expired or was deleted."""
+        self.assertFalse(await self.store.claim(self.match.id, 'end'))
+
+        await self.store.load(self.match.id)
+        self.assertTrue(await self.store.claim(self.match.id, 'end'))
+        self.assertFalse(await self.store.claim(self.match.id, 'end'))
+
+    async def test_writes_after_delete_do_not_recreate_state(self):
+        """Test that a late update or score change after the match state was deleted is dropped."""
+        await self.store.load(self.match.id)
+        await self.store.delete(self.match.id)
+
+        await self.store.update(self.match.id, status='finished')
+
+        self.assertIsNone(await self.store.add_scores(self.match.id, player1=1))
+        self.assertIsNone(await self.store.get(self.match.id))
+
+    async def test_answer_for_other_question_is_ignored(self):
+        """Test that answers for a question other than the current one are not recorded."""
+        await self.store.load(self.match.id)
+
+        commit = await self.store.commit_answers(self.match.id, 1, {1: 'b'})
+
+        self.assertFalse(commit.recorded)
+        self.assertIsNone(commit.state.answer(1, 1))
+
+    async def test_persist_result_writes_transition(self):
+        """Test that a processed question is written with answers, correctness and scores."""
+        await self.store.load(self.match.id)
+        await self.store.commit_answers(self.match.id, 0, {1: 'a'})
+        state = (await self.store.commit_answers(self.match.id, 0, {2: NO_ANSWER})).state
+
+        await database_sync_to_async(persist_result)(state, 0)
+
+        slot = await MatchQuestion.objects.aget(match=self.match, question_order=0)
+        match = await Match.objects.aget(id=self.match.id)
+        self.assertEqual((slot.player1_answer, slot.player1_correct), ('a', True))
+        # Brak odpowiedzi w czasie jest zapisywany jako 'a', ale zawsze błędny
+        self.assertEqual((slot.player2_answer, slot.player2_correct), ('a', False))
+        self.assertEqual((match.player1_score, match.player2_score), (1, 0))
+        self.assertEqual(state.result_data(0)['player1_correct'], True)
+
+    async def test_state_and_seeding_run_on_database_executor(self):
+        """Test that rebuilding the state and seeding questions go through the consumers' executor."""
+        class RecordingExecutor:
+            def __init__(self):
+                self.calls = []
+
+            async def run(self, func, *args, **kwargs):
+                self.calls.append(func.__name__)
+                return await database_sync_to_async(func)(*args, **kwargs)
+
+        executor = RecordingExecutor()
+        with patch('src.db_executor.get_db_executor', return_value=executor):
+            await self.store.load(self.match.id)
+            await aseed_match_questions(self.match)
+
+        self.assertEqual(executor.calls, ['build_state', '_seed_state'])
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    PRESENCE_BACKEND='quiz.presence.InMemoryPresenceBackend',
+    CACHES=LOCMEM_CACHES,
+    DB_EXECUTOR_WORKERS=0,
+)
+class MatchNotificationRoutingTest(TestCase):
+    """Tests for routing public match requests to interested players only."""
+
+    def setUp(self):
+        self.physics = Subject.objects.create(name='Fizyka', color='#6366F1', icon_name='atom')
+        self.history = Subject.objects.create(name='Historia', color='#F59E0B', icon_name='book')
+        self.book = Book.objects.create(title='Mechanika', author='Autor', isbn='789', subject=self.physics)
+        self.player1 = User.objects.create_user(email='n1@p.lodz.pl', password='testpass123', username='n1')
+        self.player2 = User.objects.create_user(email='n2@p.lodz.pl', password='testpass123', username='n2')
+
+    def test_interest_follows_rankings(self):
+        """Test that players get notifications for the subjects they have played."""
+        UserRanking.objects.create(user=self.player2, subject=self.history, points=10)
+
+        self.assertEqual(interest_subject_ids(self.player2.id), [self.history.id])
+
+    def test_new_player_is_interested_in_all_subjects(self):
+        """Test that a player without rankings gets notifications for every subject."""
+        self.assertCountEqual(interest_subject_ids(self.player1.id), [self.physics.id, self.history.id])
+
+    @override_settings(NOTIFICATION_FALLBACK_SUBJECTS=1)
+    def test_new_player_fallback_is_capped_to_popular_subjects(self):
+        """Test that a player without rankings only gets the most played subjects."""
+        UserRanking.objects.create(user=self.player2, subject=self.history, points=10)
+
+        self.assertEqual(interest_subject_ids(self.player1.id), [self.history.id])
+
+    async def test_first_ranking_subscribes_connected_player(self):
+        """Test that a ranking in a new subject adds its group without reconnecting."""
+        await database_sync_to_async(UserRanking.objects.create)(user=self.player2, subject=self.history, points=10)
+        communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), '/ws/notifications/')
+        communicator.scope['user'] = self.player2
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        for _ in range(2):
+            await communicator.receive_json_from()
+        await get_channel_layer().group_send(
+            f'user_{self.player2.id}', {'type': 'subject_ranked', 'subject_id': self.physics.id})
+        match = await database_sync_to_async(Match.objects.create)(
+            player1=self.player1, book=self.book, subject=self.physics, status='waiting')
+
+        await send_match_notification(match.id, self.player1.id, self.book.id, self.physics.id)
+        get_scheduler().cancel(('pending', 'match', match.id))
+
+        frame = await communicator.receive_json_from()
+        self.assertEqual((frame['type'], frame['match_id']), ('match:notification', match.id))
+        await communicator.disconnect()
+
+    async def test_new_player_receives_match_requests(self):
+        """Test that a connected player without rankings is notified about a public match."""
+        communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), '/ws/notifications/')
+        communicator.scope['user'] = self.player2
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        # Lista aktywnych i własne user:joined
+        for _ in range(2):
+            await communicator.receive_json_from()
+        match = await database_sync_to_async(Match.objects.create)(
+            player1=self.player1, book=self.book, subject=self.physics, status='waiting')
+
+        await send_match_notification(match.id, self.player1.id, self.book.id, self.physics.id)
+        get_scheduler().cancel(('pending', 'match', match.id))
+
+        frame = await communicator.receive_json_from()
+        self.assertEqual(frame['type'], 'match:notification')
+        self.assertEqual(frame['match_id'], match.id)
+        await communicator.disconnect()
+
+    async def test_match_request_is_one_group_publish(self):
+        """Test that a match request is published once, to the subject group."""
+        channel_layer = get_channel_layer()
+        channel = await channel_layer.new_channel()
+        await channel_layer.group_add(subject_group_name(self.physics.id), channel)
+        match = await database_sync_to_async(Match.objects.create)(
+            player1=self.player1, book=self.book, subject=self.physics, status='waiting')
+
+        await send_match_notification(match.id, self.player1.id, self.book.id, self.physics.id)
+        get_scheduler().cancel(('pending', 'match', match.id))
+
+        event = await channel_layer.receive(channel)
+        self.assertEqual(event['type'], 'match_notification')
+        self.assertEqual(event['player1_id'], self.player1.id)
+        self.assertIsNotNone(await get_presence().get_pending('match', match.id))
+
+
+@override_settings(MATCHMAKING_BASE_WINDOW=20, MATCHMAKING_WINDOW_GROWTH=5,
+                   MATCHMAKING_MAX_WINDOW=200, MATCHMAKING_MAX_WAIT=60)
+class MatchmakingQueueTest(SimpleTestCase):
+    """Tests for rating-based pairing in the matchmaking queue."""
+
+    def ticket(self, user_id, points, enqueued_at=0.0):
+        return MatchmakingTicket(user_id=user_id, match_id=100 + user_id, subject_id=1, book_id=1,
+                                 points=points, enqueued_at=enqueued_at)
+
+    def test_pairs_closest_rating_within_window(self):
+        """Test that the oldest ticket is paired with the closest-rated player."""
+        result = pair_tickets([self.ticket(1, 100), self.ticket(2, 115, 1), self.ticket(3, 105, 2)], now=2)
+
+        self.assertEqual([(host.user_id, guest.user_id) for host, guest in result.pairs], [(1, 3)])
+        self.assertEqual(result.expired, [])
+
+    def test_window_widens_with_wait(self):
+        """Test that a distant opponent becomes acceptable after waiting longer."""
+        tickets = [self.ticket(1, 100), self.ticket(2, 160)]
+
+        self.assertEqual(pair_tickets(tickets, now=1).pairs, [])
+        self.assertEqual(len(pair_tickets(tickets, now=10).pairs), 1)
+
+    def test_old_tickets_expire(self):
+        """Test that tickets older than MATCHMAKING_MAX_WAIT expire instead of pairing."""
+        result = pair_tickets([self.ticket(1, 100), self.ticket(2, 100, 30)], now=60)
+
+        self.assertEqual([ticket.user_id for ticket in result.expired], [1])
+        self.assertEqual(result.pairs, [])
+
+    def test_tick_removes_pairs_and_records_stats(self):
+        """Test that a tick takes pairs off the queue without counting them as matched yet."""
+        queue = InMemoryMatchmakingQueue()
+        for ticket in (self.ticket(1, 100), self.ticket(2, 110, 2), self.ticket(3, 900, 4)):
+            queue.enqueue(ticket)
+
+        result = queue.tick(now=6)
+        stats = queue.stats(now=6)
+
+        self.assertEqual(len(result.pairs), 1)
+        self.assertEqual([ticket.user_id for ticket in queue.tickets(1, 1)], [3])
+        self.assertEqual(stats['waiting'], 1)
+        self.assertEqual(stats['queues']['1:1'], {'depth': 1, 'oldest_wait': 2.0})
+        self.assertEqual(stats['paired_players'], 0)
+
+        queue.record_pair([result.pairs[0][0].wait(6), result.pairs[0][1].wait(6)])
+        stats = queue.stats(now=6)
+        self.assertEqual(stats['paired_players'], 2)
+        self.assertEqual(stats['mean_wait'], 5.0)
+        self.assertEqual(stats['max_wait'], 6.0)
+
+    async def test_async_remove_takes_ticket_off_queue(self):
+        """Test that a consumer can cancel a ticket without a sync thread hop."""
+        queue = InMemoryMatchmakingQueue()
+        queue.enqueue(self.ticket(1, 100))
+
+        self.assertTrue(await queue.aremove(1, 1, 1))
+        self.assertFalse(await queue.aremove(1, 1, 1))
+        self.assertEqual(queue.tickets(1, 1), [])
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    PRESENCE_BACKEND='quiz.presence.InMemoryPresenceBackend',
+    MATCHMAKING_BACKEND='quiz.matchmaking.InMemoryMatchmakingQueue',
+    CACHES=LOCMEM_CACHES,
+    DB_EXECUTOR_WORKERS=0,
+)
+class MatchmakingPairTest(TestCase):
+    """Tests for turning a queued pair into a match."""
+
+    def setUp(self):
+        self.subject = Subject.objects.create(name='Fizyka', color='#6366F1', icon_name='atom')
+        self.book = Book.objects.create(title='Mechanika', author='Autor', isbn='790', subject=self.subject)
+        self.player1 = User.objects.create_user(email='q1@p.lodz.pl', password='testpass123', username='q1')
+        self.player2 = User.objects.create_user(email='q2@p.lodz.pl', password='testpass123', username='q2')
+
+    async def queued(self, user):
+        match = await database_sync_to_async(Match.objects.create)(
+            player1=user, book=self.book, subject=self.subject, status='waiting')
+        await get_presence().add_pending('match', match.id, {
+            'player1_id': user.id, 'book_id': self.book.id, 'subject_id': self.subject.id,
+        }, timeout=60)
+        return MatchmakingTicket(user_id=user.id, match_id=match.id, subject_id=self.subject.id,
+                                 book_id=self.book.id, points=0, enqueued_at=0.0)
+
+    async def test_pair_joins_host_match(self):
+        """Test that the guest becomes player2 of the host match and both players are notified."""
+        channel_layer = get_channel_layer()
+        channel = await channel_layer.new_channel()
+        await channel_layer.group_add(f'user_{self.player2.id}', channel)
+        host, guest = await self.queued(self.player1), await self.queued(self.player2)
+
+        self.assertTrue(await complete_pair(host, guest))
+
+        match = await database_sync_to_async(Match.objects.get)(id=host.match_id)
+        self.assertEqual((match.player2_id, match.status), (self.player2.id, 'ready'))
+        self.assertFalse(await database_sync_to_async(Match.objects.filter(id=guest.match_id).exists)())
+        event = await channel_layer.receive(channel)
+        self.assertEqual((event['type'], event['match_id']), ('match_accepted', host.match_id))
+
+    async def test_claimed_match_requeues_other_player(self):
+        """Test that a pair is dropped when a notification accept already claimed the host match."""
+        host, guest = await self.queued(self.player1), await self.queued(self.player2)
+        await get_presence().pop_pending('match', host.match_id)
+
+        self.assertFalse(await complete_pair(host, guest))
+
+        queued = [ticket.user_id for ticket in get_matchmaking().tickets(self.subject.id, self.book.id)]
+        self.assertIn(self.player2.id, queued)
+        self.assertNotIn(self.player1.id, queued)
+        self.assertIsNotNone(await get_presence().get_pending('match', guest.match_id))
+
+    async def test_failed_assignment_requeues_both_players(self):
+        """Test that a database error while creating the match restores both pending matches and tickets."""
+        host, guest = await self.queued(self.player1), await self.queued(self.player2)
+
+        with patch('quiz.matchmaking._assign_pair', side_effect=DatabaseError('down')):
+            with self.assertRaises(DatabaseError):
+                await complete_pair(host, guest)
+
+        queued = [ticket.match_id for ticket in get_matchmaking().tickets(self.subject.id, self.book.id)]
+        self.assertIn(host.match_id, queued)
+        self.assertIn(guest.match_id, queued)
+        self.assertIsNotNone(await get_presence().get_pending('match', host.match_id))
+        self.assertIsNotNone(await get_presence().get_pending('match', guest.match_id))
+
+    async def test_tick_failure_does_not_drop_other_pairs(self):
+        """Test that one failing pair is logged and the remaining pairs are still created and counted."""
+        player3 = await database_sync_to_async(User.objects.create_user)(
+            email='q3@p.lodz.pl', password='testpass123', username='q3')
+        player4 = await database_sync_to_async(User.objects.create_user)(
+            email='q4@p.lodz.pl', password='testpass123', username='q4')
+        failing = (await self.queued(self.player1), await self.queued(self.player2))
+        working = (await self.queued(player3), await self.queued(player4))
+        assign = _assign_pair
+        paired = get_matchmaking().stats()['paired_players']
+
+        def flaky_assign(host, guest):
+            if host.match_id == failing[0].match_id:
+                raise DatabaseError('down')
+            return assign(host, guest)
+
+        with patch('quiz.matchmaking._assign_pair', side_effect=flaky_assign):
+            with self.assertLogs('quiz.matchmaking', level='ERROR'):
+                created = await complete_tick(TickResult(pairs=[failing, working], expired=[]))
+
+        self.assertEqual(created, 1)
+        self.assertEqual(get_matchmaking().stats()['paired_players'], paired + 2)
+        match = await database_sync_to_async(Match.objects.get)(id=working[0].match_id)
+        self.assertEqual(match.player2_id, player4.id)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, DB_EXECUTOR_WORKERS=0)
+class UserSummaryCacheTest(APITestCase):
+    """Tests for the cached player card sent with notifications."""
+
+    def setUp(self):
+        self.subject = Subject.objects.create(name='Fizyka', color='#6366F1', icon_name='atom')
+        self.user = User.objects.create_user(email='s1@p.lodz.pl', password='testpass123', username='s1')
+        self.opponent = User.objects.create_user(email='s2@p.lodz.pl', password='testpass123', username='s2')
+        UserRanking.objects.create(user=self.user, subject=self.subject, points=30, wins=3, losses=0)
+        for alias in LOCMEM_CACHES:
+            caches[alias].clear()
+
+    def test_summary_is_cached(self):
+        """Test that a repeated summary lookup does not query the database."""
+        summary = get_user_summary(self.user.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_summary(self.user.id), summary)
+        self.assertEqual(summary['best_ranking'], {'points': 30, 'subject': 'Fizyka'})
+
+    def test_ranking_update_invalidates_summary(self):
+        """Test that a finished match refreshes the player's best ranking."""
+        get_user_summary(self.user.id)
+        consumer = MatchConsumer()
+        consumer.match = Match(id=1)
+
+        async_to_sync(consumer.update_user_ranking)(self.user, self.subject, True)
+
+        self.assertEqual(get_user_summary(self.user.id)['best_ranking']['points'], 40)
+
+    def test_profile_update_invalidates_summary(self):
+        """Test that editing the profile refreshes the cached card."""
+        get_user_summary(self.user.id)
+        self.client.force_authenticate(self.user)
+
+        response = self.client.patch(reverse('user'), {'first_name': 'Ada'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(get_user_summary(self.user.id)['first_name'], 'Ada')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogCacheTest(APITestCase):
+    """Tests for the cached subject and book lists."""
+
+    def setUp(self):
+        for alias in LOCMEM_CACHES:
+            caches[alias].clear()
+        self.subject = Subject.objects.create(name='Fizyka', color='#6366F1', icon_name='atom')
+        Book.objects.create(title='Mechanika', author='Autor', isbn='791', subject=self.subject)
+        self.client.force_authenticate(User.objects.create_user(
+            email='c1@p.lodz.pl', password='testpass123', username='c1'))
+
+    def test_cached_list_makes_no_queries(self):
+        """Test that a repeated catalog request is served without database queries."""
+        url = reverse('book-list', args=[self.subject.id])
+        first = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual([book['title'] for book in second.data], ['Mechanika'])
+
+    def test_matching_etag_returns_not_modified(self):
+        """Test that If-None-Match with the current ETag yields 304 without a body."""
+        etag = self.client.get(reverse('subject-list'))['ETag']
+
+        response = self.client.get(reverse('subject-list'), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_admin_change_invalidates_lists(self):
+        """Test that saving a subject in the admin serves a fresh list with a new ETag."""
+        etag = self.client.get(reverse('subject-list'))['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SubjectAdmin(Subject, admin.site).save_model(
+                None, Subject(name='Historia', color='#F59E0B', icon_name='book'), None, False)
+
+        response = self.client.get(reverse('subject-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+
+@override_settings(DB_EXECUTOR_WORKERS=4)
+class DatabaseExecutorTest(SimpleTestCase):
+    """Tests for the pooled database executor used by the consumers."""
+
+    async def test_calls_run_in_parallel_on_the_pool(self):
+        """Test that calls from different connections do not wait for each other."""
+        barrier = threading.Barrier(2, timeout=5)
+
+        await asyncio.gather(pooled_sync_to_async(barrier.wait)(), pooled_sync_to_async(barrier.wait)())
+
+        stats = get_db_executor().stats()
+        self.assertEqual((stats['workers'], stats['queued'], stats['running']), (4, 0, 0))
+        self.assertGreaterEqual(stats['completed'], 2)
+
+    async def test_lane_keeps_connection_order(self):
+        """Test that one connection's calls run one at a time, in issue order."""
+        order = []
+
+        def record(index):
+            time.sleep(0.01 * (3 - index))
+            order.append(index)
+
+        class Handler:
+            async def dispatch(self, message):
+                await asyncio.gather(*(pooled_sync_to_async(record)(index) for index in range(3)))
+
+        class Consumer(DatabaseLaneMixin, Handler):
+            pass
+
+        await Consumer().dispatch({'type': 'test'})
+
+        self.assertEqual(order, [0, 1, 2])
+
+    async def test_scheduled_callback_runs_outside_consumer_lane(self):
+        """Test that a deadline set by a consumer does not run in that consumer's lane."""
+        scheduler = DeadlineScheduler()
+        lanes = []
+
+        async def expired():
+            lanes.append(_current_lane())
+
+        class Handler:
+            async def dispatch(self, message):
+                scheduler.schedule_in('expiry', 0.01, expired)
+
+        class Consumer(DatabaseLaneMixin, Handler):
+            pass
+
+        await Consumer().dispatch({'type': 'test'})
+        await asyncio.sleep(0.05)
+
+        self.assertEqual(lanes, [None])
+
+
+class MatchHistoryTest(APITestCase):
+    """Tests for the keyset-paginated match history."""
+
+    def setUp(self):
+        self.subject = Subject.objects.create(name='Chemia', color='#10B981', icon_name='flask')
+        self.book = Book.objects.create(
+            title='Chemia ogólna', author='Autor', isbn='456', subject=self.subject,
+            toc_pdf_url='https://example.com/toc.pdf')
+        self.user = User.objects.create_user(email='h1@p.lodz.pl', password='testpass123', username='h1')
+        self.opponent = User.objects.create_user(email='h2@p.lodz.pl', password='testpass123', username='h2')
+        self.client.force_authenticate(self.user)
+
+    def _match(self, player1, player2, created_at):
+        match = Match.objects.create(
+            player1=player1, player2=player2, book=self.book, subject=self.subject,
+            status='finished', question_count=10)
+        Match.objects.filter(id=match.id).update(created_at=created_at)
+        match.refresh_from_db()
+        return match
+
+    def _pages(self, limit):
+        pages, cursor = [], None
+        while True:
+            params = {'limit': limit, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(reverse('match-list'), params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([row['id'] for row in response.data])
+            cursor = response.get('X-Next-Cursor')
+            if not cursor:
+                return pages
+
+    def test_pages_cover_history_newest_first(self):
+        """Test that cursor pages merge both player roles without gaps, duplicates or ties lost."""
+        start = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        other = User.objects.create_user(email='h3@p.lodz.pl', password='testpass123', username='h3')
+        matches = [
+            self._match(self.user, self.opponent, start + timedelta(minutes=i)) if i % 2
+            else self._match(self.opponent, self.user, start + timedelta(minutes=i))
+            for i in range(5)
+        ]
+        # Ten sam created_at - kolejność rozstrzyga id
+        matches += [self._match(self.user, None, start + timedelta(minutes=10)) for _ in range(2)]
+        self._match(self.opponent, other, start + timedelta(minutes=20))
+
+        pages = self._pages(limit=2)
+
+        expected = [m.id for m in sorted(matches, key=lambda m: (m.created_at, m.id), reverse=True)]
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_rows_are_compact(self):
+        """Test that a history row has flat fields and the stored question count."""
+        self._match(self.user, self.opponent, datetime(2026, 1, 1, tzinfo=dt_timezone.utc))
+
+        with self.assertNumQueries(2):
+            row = self.client.get(reverse('match-list')).data[0]
+
+        self.assertEqual(row['book_title'], 'Chemia ogólna')
+        self.assertEqual(row['player2_username'], 'h2')
+        self.assertEqual(row['total_questions'], 10)
+        self.assertNotIn('book', row)
+
+    def test_invalid_cursor_is_rejected(self):
+        """Test that a malformed cursor yields 400."""
+        with self.assertRaises(ValueError):
+            decode_cursor('nie-kursor')
+
+        response = self.client.get(reverse('match-list'), {'cursor': 'nie-kursor'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
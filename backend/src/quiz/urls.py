@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    SubjectListView, BookListView, RankingView,
+    SubjectListView, BookListView, RankingView, MyRankingView,
     UserProfileView, BenefitsView, UseBenefitView, MatchViewSet
 )
 
@@ -13,7 +13,9 @@ urlpatterns = [
     path("subjects/<int:subject_id>/books/",
          BookListView.as_view(), name="book-list"),
     path("ranking/", RankingView.as_view(), name="ranking-general"),
+    path("ranking/me/", MyRankingView.as_view(), name="ranking-general-me"),
     path("ranking/<int:subject_id>/", RankingView.as_view(), name="ranking-subject"),
+    path("ranking/<int:subject_id>/me/", MyRankingView.as_view(), name="ranking-subject-me"),
     path("user/me/", UserProfileView.as_view(), name="user-profile"),
     path("user/me/benefits/", BenefitsView.as_view(), name="user-benefits"),
     path("user/me/benefits/<int:benefit_id>/use/", UseBenefitView.as_view(), name="use-benefit"),
@@ -0,0 +1,49 @@
+"""
+Karta gracza (dane użytkownika + najlepszy ranking) w cache.
+
+Kartę wysyłają powiadomienia (user:joined, match:notification, invite,
+match:accepted), więc ten sam gracz jest serializowany wielokrotnie.
+Cache dwupoziomowy (src.cache): pamięć procesu przed Redis. Karta jest
+unieważniana po zmianie rankingu (MatchConsumer.update_user_ranking) i
+profilu (UserDetailsView, ChangeEmailView, DeleteUserView).
+"""
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from src import cache
+from auth_api.serializers import UserSerializer
+
+from .models import UserRanking
+
+User = get_user_model()
+
+
+def summary_key(user_id: int) -> str:
+    return f'user_summary:{user_id}'
+
+
+def build_user_summary(user_id: int) -> Optional[dict]:
+    """Dane użytkownika z najlepszym rankingiem (None - brak użytkownika)"""
+    user = User.objects.filter(id=user_id).first()
+    if user is None:
+        return None
+    data = dict(UserSerializer(user).data)
+    best_ranking = UserRanking.objects.filter(
+        user_id=user_id).select_related('subject').order_by('-points').first()
+    if best_ranking:
+        data['best_ranking'] = {
+            'points': best_ranking.points,
+            'subject': best_ranking.subject.name,
+        }
+    return data
+
+
+def get_user_summary(user_id: int) -> Optional[dict]:
+    return cache.get_or_build(summary_key(user_id), lambda: build_user_summary(user_id),
+                              settings.USER_SUMMARY_TIMEOUT)
+
+
+def invalidate_user_summary(user_id: int) -> None:
+    cache.delete(summary_key(user_id))
@@ -4,15 +4,20 @@ from rest_framework.generics import ListAPIView, RetrieveAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q, F, Count, Sum
+from django.db.models import Q
 from django.contrib.auth import get_user_model
 
 from .models import Subject, Book, UserRanking, Benefit, Match, Question
 from .serializers import (
     SubjectSerializer, BookSerializer, UserRankingSerializer,
     RankingEntrySerializer, BenefitSerializer, MatchSerializer,
-    MatchCreateSerializer, UserBasicSerializer
+    MatchCreateSerializer, MatchHistorySerializer, UserBasicSerializer
 )
+from .catalog import catalog_response
+from .leaderboard import get_leaderboard
+from .match_history import history_page
+from .match_seeding import seed_match_questions
+from .matchmaking import enqueue_match
 
 User = get_user_model()
 
@@ -20,17 +25,21 @@ User = get_user_model()
 class SubjectListView(ListAPIView):
     """
     List all subjects with their name, color, and Lucide icon name.
-    All fields are read-only.
+    All fields are read-only. Served from the catalog cache (quiz/catalog.py).
     """
     queryset = Subject.objects.all()
     permission_classes = [IsAuthenticated]
     serializer_class = SubjectSerializer
 
+    def list(self, request, *args, **kwargs):
+        return catalog_response(request, 'subjects',
+                                lambda: self.get_serializer(self.get_queryset(), many=True).data)
+
 
 class BookListView(ListAPIView):
     """
     List all books for a given subject.
-    All fields are read-only.
+    All fields are read-only. Served from the catalog cache (quiz/catalog.py).
     """
     permission_classes = [IsAuthenticated]
     serializer_class = BookSerializer
@@ -39,52 +48,72 @@ class BookListView(ListAPIView):
         subject_id = self.kwargs['subject_id']
         return Book.objects.filter(subject_id=subject_id).order_by('title')
 
+    def list(self, request, *args, **kwargs):
+        return catalog_response(request, f'books:{self.kwargs["subject_id"]}',
+                                lambda: self.get_serializer(self.get_queryset(), many=True).data)
+
+
+def _ranking_entries_with_users(entries):
+    """Dołącz dane użytkowników do wpisów rankingu (jedno zapytanie na stronę)"""
+    users = User.objects.in_bulk([entry['user_id'] for entry in entries])
+    result = []
+    for entry in entries:
+        user = users.get(entry.pop('user_id'))
+        if user is None:
+            # Konto usunięte między odczytem rankingu a tym zapytaniem (quiz.signals)
+            continue
+        entry['user'] = UserBasicSerializer(user).data
+        result.append(entry)
+    return result
+
 
 class RankingView(APIView):
-    """Ranking ogólny lub w kategorii"""
+    """
+    Ranking ogólny lub w kategorii.
+
+    Stronicowany parametrami ?offset= i ?limit=, całkowita liczba graczy
+    w nagłówku X-Total-Count. Dane pochodzą z leaderboardu (quiz.leaderboard).
+    """
     permission_classes = [IsAuthenticated]
+    default_limit = 100
+    max_limit = 500
 
     def get(self, request, subject_id=None):
-        if subject_id:
-            # Ranking w kategorii
-            rankings = UserRanking.objects.filter(subject_id=subject_id).select_related(
-                'user', 'subject').order_by('-points', '-wins')
-        else:
-            # Ranking ogólny (suma punktów ze wszystkich kategorii)
-            rankings = UserRanking.objects.values('user').annotate(
-                total_points=Sum('points'),
-                total_wins=Sum('wins'),
-                total_losses=Sum('losses')
-            ).order_by('-total_points', '-total_wins')
-
-            # Konwertuj na listę z pozycjami
-            result = []
-            for idx, ranking in enumerate(rankings, start=1):
-                user = User.objects.get(id=ranking['user'])
-                result.append({
-                    'position': idx,
-                    'user': UserBasicSerializer(user).data,
-                    'points': ranking['total_points'],
-                    'wins': ranking['total_wins'],
-                    'losses': ranking['total_losses'],
-                })
-
-            serializer = RankingEntrySerializer(result, many=True)
-            return Response(serializer.data)
+        try:
+            offset = max(0, int(request.query_params.get('offset', 0)))
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            return Response(
+                {'error': 'Parametry offset i limit muszą być liczbami'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = min(max(1, limit), self.max_limit)
+
+        leaderboard = get_leaderboard()
+        entries = leaderboard.top(subject_id, offset=offset, limit=limit)
+
+        serializer = RankingEntrySerializer(
+            _ranking_entries_with_users(entries), many=True)
+        response = Response(serializer.data)
+        response['X-Total-Count'] = leaderboard.count(subject_id)
+        return response
+
+
+class MyRankingView(APIView):
+    """Pozycja zalogowanego użytkownika w rankingu ogólnym lub w kategorii"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, subject_id=None):
+        entry = get_leaderboard().rank_of(request.user.id, subject_id)
+        if entry is None:
+            return Response(
+                {'error': 'Nie masz jeszcze pozycji w tym rankingu'},
+                status=status.HTTP_404_NOT_FOUND
+            )
 
-        # Ranking w kategorii z pozycjami
-        result = []
-        for idx, ranking in enumerate(rankings, start=1):
-            result.append({
-                'position': idx,
-                'user': UserBasicSerializer(ranking.user).data,
-                'points': ranking.points,
-                'wins': ranking.wins,
-                'losses': ranking.losses,
-                'subject_id': ranking.subject.id,
-            })
-
-        serializer = RankingEntrySerializer(result, many=True)
+        entry.pop('user_id')
+        entry['user'] = UserBasicSerializer(request.user).data
+        serializer = RankingEntrySerializer(entry)
         return Response(serializer.data)
 
 
@@ -144,14 +173,38 @@ class UseBenefitView(APIView):
 
 
 class MatchViewSet(viewsets.ModelViewSet):
-    """Zarządzanie meczami"""
+    """
+    Zarządzanie meczami.
+
+    Lista to historia meczów gracza (quiz.match_history) w zwięzłym formacie,
+    stronicowana parametrami ?cursor= i ?limit=. Kursor następnej strony
+    jest w nagłówku X-Next-Cursor (brak nagłówka - ostatnia strona).
+    """
     permission_classes = [IsAuthenticated]
     serializer_class = MatchSerializer
+    default_limit = 20
+    max_limit = 100
 
     def get_queryset(self):
         return Match.objects.filter(
             Q(player1=self.request.user) | Q(player2=self.request.user)
-        ).select_related('player1', 'player2', 'book', 'subject', 'winner').prefetch_related('match_questions').order_by('-created_at')
+        ).select_related('player1', 'player2', 'book', 'subject', 'winner').order_by('-created_at')
+
+    def list(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get('limit', self.default_limit))
+            matches, next_cursor = history_page(
+                request.user, min(max(1, limit), self.max_limit), request.query_params.get('cursor'))
+        except ValueError:
+            return Response(
+                {'error': 'Niepoprawny parametr cursor lub limit'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        response = Response(MatchHistorySerializer(matches, many=True).data)
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
 
     @action(detail=False, methods=['post'])
     def find(self, request):
@@ -219,15 +272,17 @@ class MatchViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-        # Matchmaking - utwórz mecz i wyślij powiadomienia do aktywnych graczy
+        # Matchmaking - utwórz mecz, wstaw gracza do kolejki (parowanie według
+        # rankingu w run_matchmaking) i powiadom zainteresowanych graczy
         match = Match.objects.create(
             player1=request.user,
             book=book,
             subject=subject,
             status='waiting'
         )
+        enqueue_match(match)
 
-        # Wyślij powiadomienia do aktywnych graczy
+        # Wyślij powiadomienia do graczy zainteresowanych przedmiotem
         from .notification_consumer import send_match_notification
         from asgiref.sync import async_to_sync
 
@@ -335,62 +390,21 @@ class MatchViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Sprawdź czy pytania już istnieją
-        from .models import MatchQuestion
-        if MatchQuestion.objects.filter(match=match).exists():
-            # Pytania już istnieją, tylko zmień status
-            match.status = 'active'
-            from django.utils import timezone
-            match.started_at = timezone.now()
-            match.save()
-        else:
-            # Generuj pytania
-            from ai.agent.question_generator import BookQuestionGenerator
-            generator = BookQuestionGenerator()
-
-            try:
-                result = generator.generate_questions_simple(
-                    title=match.book.title,
-                    author=match.book.author,
-                    isbn=match.book.isbn,
-                    subject=match.book.subject.name,
-                    toc_pdf_url=match.book.toc_pdf_url
-                )
-
-                # Zapisz pytania do bazy
-                from .models import Question
-                questions = []
-                for q_data in result.questions[:10]:  # Maksymalnie 10 pytań
-                    question = Question.objects.create(
-                        book=match.book,
-                        question_text=q_data.question,
-                        option_a=q_data.option_a,
-                        option_b=q_data.option_b,
-                        option_c=q_data.option_c,
-                        option_d=q_data.option_d,
-                        correct_answer=q_data.correct_answer.lower(),
-                    )
-                    questions.append(question)
-
-                # Utwórz MatchQuestion dla każdego pytania
-                for idx, question in enumerate(questions):
-                    MatchQuestion.objects.create(
-                        match=match,
-                        question=question,
-                        question_order=idx,
-                    )
-
-                # Start meczu
-                match.status = 'active'
-                from django.utils import timezone
-                match.started_at = timezone.now()
-                match.save()
+        # Pytania z banku książki (LLM tylko gdy bank jest za mały); gdy
+        # pytania już istnieją, tylko zmień status
+        try:
+            seed_match_questions(match)
+        except Exception as e:
+            return Response(
+                {'error': f'Błąd podczas generowania pytań: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
 
-            except Exception as e:
-                return Response(
-                    {'error': f'Błąd podczas generowania pytań: {str(e)}'},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
+        # Start meczu
+        match.status = 'active'
+        from django.utils import timezone
+        match.started_at = timezone.now()
+        match.save()
 
         serializer = MatchSerializer(match)
         return Response(serializer.data)
@@ -0,0 +1,100 @@
+"""
+Two-tier cache: a per-process local-memory cache (CACHES["local"]) in front of
+the shared Redis cache (CACHES["default"]).
+
+Reads go local -> Redis -> build, and a built value is stored in both tiers.
+delete() removes the key from Redis and from this process's local tier; other
+processes keep their local copy for at most LOCAL_CACHE_TIMEOUT seconds, so
+keep that short for data that is invalidated explicitly.
+
+Redis errors are logged and treated as misses - the value is built from the
+database instead of failing the request.
+
+Versioned namespaces (get_version/bump_version) invalidate a whole group of
+keys at once: callers put the version in their keys, and bumping it makes
+every old key unreachable. The version itself is cached in the local tier, so
+a steady-state read does not touch Redis either.
+"""
+import logging
+from typing import Any, Callable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+LOCAL_ALIAS = "local"
+SHARED_ALIAS = "default"
+
+_MISSING = object()
+
+
+def get_or_build(key: str, build: Callable[[], Any], timeout: Optional[int] = None) -> Any:
+    """Return the cached value for key, building and caching it on a miss (None is not cached)."""
+    local = caches[LOCAL_ALIAS]
+    value = local.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    shared = caches[SHARED_ALIAS]
+    try:
+        value = shared.get(key, _MISSING)
+    except Exception:
+        logger.warning("Shared cache read failed for %s", key, exc_info=True)
+        value = _MISSING
+
+    if value is _MISSING:
+        value = build()
+        if value is None:
+            return None
+        try:
+            shared.set(key, value, timeout)
+        except Exception:
+            logger.warning("Shared cache write failed for %s", key, exc_info=True)
+
+    local.set(key, value, min(timeout, settings.LOCAL_CACHE_TIMEOUT) if timeout else settings.LOCAL_CACHE_TIMEOUT)
+    return value
+
+
+def delete(key: str) -> None:
+    """Invalidate key in both tiers."""
+    caches[LOCAL_ALIAS].delete(key)
+    try:
+        caches[SHARED_ALIAS].delete(key)
+    except Exception:
+        logger.warning("Shared cache delete failed for %s", key, exc_info=True)
+
+
+def _version_key(namespace: str) -> str:
+    return f"version:{namespace}"
+
+
+def get_version(namespace: str) -> int:
+    """Current version of namespace (1 until it is first bumped)."""
+    key = _version_key(namespace)
+    local = caches[LOCAL_ALIAS]
+    version = local.get(key)
+    if version is not None:
+        return version
+    shared = caches[SHARED_ALIAS]
+    try:
+        shared.add(key, 1, None)
+        version = shared.get(key, 1)
+    except Exception:
+        logger.warning("Shared cache read failed for %s", key, exc_info=True)
+        return 0
+    local.set(key, version, settings.LOCAL_CACHE_TIMEOUT)
+    return version
+
+
+def bump_version(namespace: str) -> Optional[int]:
+    """Invalidate every key built with the current version of namespace."""
+    key = _version_key(namespace)
+    caches[LOCAL_ALIAS].delete(key)
+    shared = caches[SHARED_ALIAS]
+    try:
+        shared.add(key, 1, None)
+        return shared.incr(key)
+    except Exception:
+        logger.warning("Shared cache version bump failed for %s", key, exc_info=True)
+        return None
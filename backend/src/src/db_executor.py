@@ -0,0 +1,145 @@
+"""
+Database executor for the WebSocket consumers.
+
+channels' database_sync_to_async is thread-sensitive: every ORM call from every
+socket on a worker runs on one shared thread, so a worker's gameplay
+throughput is capped by a single thread's query latency.
+
+database_sync_to_async from this module is a drop-in replacement that runs ORM
+calls on a bounded pool of DB_EXECUTOR_WORKERS threads. Each thread keeps its
+own database connection, so the pool size counts against the connection limit
+of every worker process (with DB_POOL=true threads borrow connections from the
+process's psycopg pool instead). DB_EXECUTOR_WORKERS=0 restores channels' behaviour
+(needed by TestCase tests, whose data lives in the main thread's transaction).
+
+Ordering: consumers using DatabaseLaneMixin get a lane - a FIFO lock - per
+connection. Calls issued while the consumer handles a message, including from
+tasks it starts, run one at a time in issue order. Different connections run
+in parallel.
+
+get_db_executor().stats() reports queue depth (submitted, not yet started),
+running calls, wait time (submit -> start) and run time.
+"""
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+
+# (pętla, blokada) kolejności wywołań bieżącego połączenia
+_lane: contextvars.ContextVar = contextvars.ContextVar("db_lane", default=None)
+
+
+class DatabaseExecutor:
+    """Bounded thread pool for ORM calls, with queue and timing metrics."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self._lock = threading.Lock()
+        self._counters = {
+            "submitted": 0, "started": 0, "completed": 0,
+            "wait_total": 0.0, "wait_max": 0.0, "run_total": 0.0,
+        }
+
+    def _timed(self, func: Callable, submitted: float) -> Callable:
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            wait = started - submitted
+            with self._lock:
+                self._counters["started"] += 1
+                self._counters["wait_total"] += wait
+                self._counters["wait_max"] = max(self._counters["wait_max"], wait)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._counters["completed"] += 1
+                    self._counters["run_total"] += time.perf_counter() - started
+        return timed
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            self._counters["submitted"] += 1
+        call = DatabaseSyncToAsync(
+            self._timed(func, time.perf_counter()), thread_sensitive=False, executor=self.executor)
+        return await call(*args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        started = counters["started"]
+        return {
+            "workers": self.workers,
+            "queued": counters["submitted"] - started,
+            "running": started - counters["completed"],
+            "completed": counters["completed"],
+            "mean_wait_ms": round(counters["wait_total"] / started * 1000, 3) if started else 0.0,
+            "max_wait_ms": round(counters["wait_max"] * 1000, 3),
+            "mean_run_ms": round(counters["run_total"] / counters["completed"] * 1000, 3)
+            if counters["completed"] else 0.0,
+        }
+
+
+_executor = None
+_executor_workers = None
+
+
+def get_db_executor() -> Optional[DatabaseExecutor]:
+    """Pool for settings.DB_EXECUTOR_WORKERS; None means thread-sensitive mode."""
+    global _executor, _executor_workers
+    workers = settings.DB_EXECUTOR_WORKERS
+    if workers <= 0:
+        return None
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.executor.shutdown(wait=False)
+        _executor = DatabaseExecutor(workers)
+        _executor_workers = workers
+    return _executor
+
+
+def _current_lane() -> Optional[asyncio.Lock]:
+    lane = _lane.get()
+    if lane is None:
+        return None
+    loop, lock = lane
+    # Kod synchroniczny wołający async_to_sync dziedziczy kontekst, ale ma własną pętlę
+    return lock if loop is asyncio.get_running_loop() else None
+
+
+def database_sync_to_async(func: Callable) -> Callable:
+    """Run a synchronous ORM call from async code (decorator or wrapper)."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        executor = get_db_executor()
+        if executor is None:
+            return await DatabaseSyncToAsync(func)(*args, **kwargs)
+        lane = _current_lane()
+        if lane is None:
+            return await executor.run(func, *args, **kwargs)
+        async with lane:
+            return await executor.run(func, *args, **kwargs)
+
+    return wrapper
+
+
+class DatabaseLaneMixin:
+    """Orders a consumer's database_sync_to_async calls (one lane per connection)."""
+
+    async def dispatch(self, message):
+        lane = getattr(self, "_db_lane", None)
+        if lane is None:
+            lane = self._db_lane = (asyncio.get_running_loop(), asyncio.Lock())
+        token = _lane.set(lane)
+        try:
+            await super().dispatch(message)
+        finally:
+            _lane.reset(token)
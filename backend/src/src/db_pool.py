@@ -0,0 +1,44 @@
+"""
+Health checks for the psycopg connection pool (DB_POOL=true, see settings).
+
+Django checks pooled connections on checkout only when CONN_HEALTH_CHECKS is
+set, which costs a round trip per ORM call. Instead, a daemon thread runs
+ConnectionPool.check() every DB_POOL_CHECK_INTERVAL seconds: idle connections
+that the server closed (restart, idle timeout, failover) are dropped and
+replaced before a request borrows them.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_started = False
+
+
+def _check_pools(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        for alias in connections:
+            try:
+                pool = getattr(connections[alias], "pool", None)
+                # The pool opens on the first connection
+                if pool is not None and not pool.closed:
+                    pool.check()
+            except Exception:
+                logger.warning("Connection pool check failed for %s", alias, exc_info=True)
+
+
+def start_pool_health_checks() -> None:
+    """Start the health-check thread once per process (no-op without pooling)."""
+    global _started
+    interval = settings.DB_POOL_CHECK_INTERVAL
+    if _started or not settings.DB_POOL or interval <= 0:
+        return
+    _started = True
+    threading.Thread(
+        target=_check_pools, args=(interval,), name="db-pool-check", daemon=True,
+    ).start()
@@ -0,0 +1,33 @@
+"""
+Fast JSON encoding (orjson) shared by the REST renderers and the WebSocket consumers.
+
+Types orjson does not handle natively (Decimal, lazy translations, querysets, ...)
+and dates/times are passed to DRF's JSONEncoder, so the output matches what the
+stdlib-based JSONRenderer produced: ISO 8601 datetimes with millisecond precision
+and "Z" for UTC, UUIDs as strings.
+"""
+from typing import Any
+
+import orjson
+from rest_framework.utils.encoders import JSONEncoder
+
+_drf_encoder = JSONEncoder()
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def dumps(data: Any) -> bytes:
+    """Encode data as compact UTF-8 JSON."""
+    return orjson.dumps(data, default=_drf_encoder.default, option=OPTIONS)
+
+
+def dumps_text(data: Any) -> str:
+    """Encode data as a JSON string (WebSocket text frames)."""
+    return dumps(data).decode()
+
+
+class JSONFrameMixin:
+    """send_json() for AsyncWebsocketConsumer subclasses, encoded with orjson."""
+
+    async def send_json(self, content: Any, close: bool = False) -> None:
+        await self.send(text_data=dumps_text(content), close=close)
@@ -0,0 +1,36 @@
+"""
+Shared Redis clients for application state (presence, rankings, queues).
+
+Uses the same Redis server as the channels_redis channel layer.
+"""
+import asyncio
+import weakref
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+_sync_client = None
+# Klient asyncio jest związany z pętlą zdarzeń - trzymamy jeden na pętlę
+# (async_to_sync w widokach uruchamia kod w osobnej pętli)
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_redis() -> redis.Redis:
+    """Synchroniczny klient Redis (widoki, zadania w tle)"""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = redis.Redis.from_url(
+            settings.REDIS_URL, decode_responses=True)
+    return _sync_client
+
+
+def get_async_redis() -> aioredis.Redis:
+    """Klient Redis dla bieżącej pętli asyncio (consumery WebSocket)"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = aioredis.Redis.from_url(
+            settings.REDIS_URL, decode_responses=True)
+        _async_clients[loop] = client
+    return client
@@ -1,14 +1,26 @@
 from rest_framework.renderers import JSONRenderer
+from .encoding import dumps
 from .response_builder import ResponseStatus
 
+RESPONSE_STATUSES = tuple(e.value for e in ResponseStatus)
 
-class CustomJSONRenderer(JSONRenderer):
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer encoding with orjson; indented output falls back to the stdlib encoder."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class CustomJSONRenderer(ORJSONRenderer):
     def render(self, data, accepted_media_type=None, renderer_context=None):
-        response_context = renderer_context.get("response")
+        response_context = (renderer_context or {}).get("response")
 
-        if isinstance(data, dict) and data.get("status") in [
-            e.value for e in ResponseStatus
-        ]:
+        if isinstance(data, dict) and data.get("status") in RESPONSE_STATUSES:
             return super().render(data, accepted_media_type, renderer_context)
 
         if response_context and 200 <= response_context.status_code < 300:
@@ -94,7 +94,7 @@ export interface MatchQuestion {
   player2_answer: string | null;
   player1_correct: boolean | null;
   player2_correct: boolean | null;
-  answered_at: string | null;
+  answered_at?: string | null; // Brak w wynikach przesyłanych przez WebSocket
 }
 
 export interface MatchResult {